@@ -2,13 +2,15 @@ from klampt import *
 from klampt.math import vectorops,so3,se3
 from moving_base_control import *
 from reflex_control import *
+import telemetry
 
 class StateMachineController(ReflexController):
 	"""A more sophisticated controller that uses a state machine."""
 	def __init__(self,sim,hand,dt):
-		self.sim = sim
-		self.hand = hand
-		self.dt = dt
+		ReflexController.__init__(self,sim,hand,dt)
+		#turn this to false to turn off contact sensor telemetry
+		self.verbose = True
+		self.state_log = telemetry.channel('state')
 		self.sim.updateWorld()
 		self.base_xform = get_moving_base_xform(self.sim.controller(0).model())
 		self.state = 'idle'
@@ -16,8 +18,6 @@ class StateMachineController(ReflexController):
 	def __call__(self,controller):
 		sim = self.sim
 		xform = self.base_xform
-		#turn this to false to turn off print statements
-		ReflexController.verbose = True
 		ReflexController.__call__(self,controller)
 
 		#controller state machine
@@ -29,7 +29,7 @@ class StateMachineController(ReflexController):
 		if self.state == 'idle':
 			if sim.getTime() > t_lower:
 				self.state = 'lowering'
-				print self.state
+				self.state_log.log(sim.getTime(),self.state)
 		elif self.state == 'lowering':
 			if sim.getTime() < t_grasp:
 				t_traj = min(1, max(0, (sim.getTime() - t_lower) / lift_traj_duration))
@@ -41,14 +41,14 @@ class StateMachineController(ReflexController):
 				#the controller sends a command to the hand: f1,f2,f3,preshape
 				self.hand.setCommand([0.2,0.2,0.2,0])
 				self.state = 'closing'
-				print self.state
+				self.state_log.log(sim.getTime(),self.state)
 		elif self.state == 'closing':
 			if sim.getTime() > t_lift:
 				self.base_xform = get_moving_base_xform(self.sim.controller(0).model())
 				# this is needed to stop at the current position in case there's some residual velocity
 				controller.setPIDCommand(controller.getCommandedConfig(), [0.0] * len(controller.getCommandedConfig()))
 				self.state = 'raising'
-				print self.state
+				self.state_log.log(sim.getTime(),self.state)
 		elif self.state == 'raising':
 			if sim.getTime() < (t_lift + lift_traj_duration):
 				#the controller sends a command to the base after 1 s to lift the object
@@ -58,7 +58,7 @@ class StateMachineController(ReflexController):
 			else:
 				controller.setPIDCommand(controller.getCommandedConfig(), [0.0] * len(controller.getCommandedConfig()))
 				self.state = 'raised'
-				print self.state
+				self.state_log.log(sim.getTime(),self.state)
 
 		
 def make(sim,hand,dt):
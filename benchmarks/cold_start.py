@@ -0,0 +1,60 @@
+"""Measures the cold start of a headless trial, as paid by every sweep or fork
+worker process: the import of headless.py (and main.py) and a short balls
+trial, each in a fresh Python process.  Also checks that no OpenGL or
+klampt.vis module is loaded on the headless path.
+
+Exits with status 1 if the median import time exceeds import_budget, or the
+median trial time exceeds trial_budget.
+
+Usage: python benchmarks/cold_start.py [robot] [-n runs]
+"""
+
+import common
+import argparse
+import json
+import subprocess
+import sys
+
+#time budgets, in s
+import_budget = 1.0
+trial_budget = 5.0
+#simulated duration of the trial, in s
+trial_duration = 0.5
+
+child_script = """
+import json, sys, time
+t0 = time.time()
+import headless
+t1 = time.time()
+headless.run_balls(%r,duration=%r)
+t2 = time.time()
+gui = sorted(m for m in sys.modules if sys.modules[m] is not None and (m == 'OpenGL' or m.startswith('OpenGL.') or m.startswith('klampt.vis')))
+print json.dumps({'import':t1-t0,'trial':t2-t1,'gui_modules':gui})
+"""
+
+def cold_start(robotname):
+	"""Runs the import and the trial in a fresh process and returns a dict of
+	their wall times and of the GUI modules that were loaded"""
+	out = subprocess.check_output([sys.executable,'-c',child_script%(robotname,trial_duration)],cwd=common.root)
+	return json.loads(out.strip().split('\n')[-1])
+
+def median(values):
+	values = sorted(values)
+	return values[len(values)//2]
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Times the cold start of a headless trial')
+	parser.add_argument('robot',nargs='?',default='soft_hand',help='robot (default: soft_hand)')
+	parser.add_argument('-n','--runs',type=int,default=5,help='number of fresh processes')
+	args = parser.parse_args()
+	runs = [cold_start(args.robot) for i in xrange(args.runs)]
+	t_import = median([r['import'] for r in runs])
+	t_trial = median([r['trial'] for r in runs])
+	gui = sorted(set(m for r in runs for m in r['gui_modules']))
+	print "import headless: %.3f s (budget %.3f s)"%(t_import,import_budget)
+	print "%.1f s %s trial: %.3f s (budget %.3f s)"%(trial_duration,args.robot,t_trial,trial_budget)
+	if gui:
+		print "GUI modules loaded:"," ".join(gui)
+	if t_import > import_budget or t_trial > trial_budget or gui:
+		print "FAILED"
+		sys.exit(1)
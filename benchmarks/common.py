@@ -0,0 +1,71 @@
+"""Shared setup for the benchmark scripts.
+
+The benchmarks are run from the repository root, e.g.
+> python benchmarks/emulator_allocations.py
+They use the balls scene, which needs no downloaded dataset.
+"""
+
+import os
+import sys
+import time
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if root not in sys.path:
+	sys.path.insert(0,root)
+os.chdir(root)
+
+def make_balls_trial(robotname,num_balls=10,settle=0.0):
+	"""Builds the launch_balls world for robotname with its hand emulator and
+	controller attached, and simulates it for settle seconds so that the hand
+	is in contact.  Returns (sim,hand)."""
+	import main
+	import headless
+	import balls_controller
+	from klampt.sim.simulation import SimpleSimulator
+	from moving_base_control import set_moving_base_xform
+	world,robot = main.make_balls_world(robotname,num_balls)
+	xform = headless.load_initial_xform(robot,["balls/default_initial_%s.xform"%(robotname,)])
+	set_moving_base_xform(robot,xform[0],xform[1])
+	sim = SimpleSimulator(world)
+	hand = main.setup_simulation(sim,robotname,balls_controller,headless.control_dt)
+	while sim.getTime() < settle:
+		sim.simulate(headless.sim_dt)
+	return sim,hand
+
+def time_calls(fn,n):
+	"""Returns the average wall time of fn() over n calls, in seconds"""
+	t0 = time.time()
+	for i in xrange(n):
+		fn()
+	return (time.time()-t0)/n
+
+#index of tp_alloc in the CPython 2.7 PyTypeObject, counted in pointer-sized words
+tp_alloc_slot = 38
+
+def new_arrays(fn,n):
+	"""Returns the average number of NumPy arrays (including views) created
+	during a call to fn(), over n calls.  The arrays are counted by replacing
+	the tp_alloc slot of numpy.ndarray, through which NumPy allocates every
+	array object.  Returns None if the type layout is not the expected one."""
+	import ctypes
+	import numpy as np
+	words = (ctypes.c_ssize_t*(tp_alloc_slot+1)).from_address(id(np.ndarray))
+	#check the layout against the fields that Python exposes
+	if (words[4],words[26],words[36]) != (np.ndarray.__basicsize__,np.ndarray.__weakrefoffset__,np.ndarray.__dictoffset__):
+		return None
+	allocfunc = ctypes.CFUNCTYPE(ctypes.c_void_p,ctypes.c_void_p,ctypes.c_ssize_t)
+	original = words[tp_alloc_slot]
+	alloc = allocfunc(original)
+	count = [0]
+	def counting_alloc(tp,nitems):
+		count[0] += 1
+		return alloc(tp,nitems)
+	hook = allocfunc(counting_alloc)
+	fn()
+	words[tp_alloc_slot] = ctypes.cast(hook,ctypes.c_void_p).value
+	try:
+		for i in xrange(n):
+			fn()
+	finally:
+		words[tp_alloc_slot] = original
+	return float(count[0])/n
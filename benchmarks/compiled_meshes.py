@@ -0,0 +1,84 @@
+"""Measures the time of main.make_object with and without a compiled mesh (see
+mesh_compiler.py), and how much of the compiled load is spent in
+CompiledMesh.geometry, which passes the memory-mapped arrays to Klamp't
+through Python lists.
+
+The meshes are binary STL tori written to a temporary object set, with
+roughly 2*N*N vertices and 4*N*N triangles for each N given.  Also reports the
+time of loading each hand with main.make_moving_base_robot, meshes included,
+which bounds what compiled hand meshes could save.
+
+Usage: python benchmarks/compiled_meshes.py [N ...]
+"""
+
+import common
+import os
+import shutil
+import sys
+import tempfile
+import time
+import numpy as np
+from klampt import *
+import main
+import mesh_compiler
+
+def torus(n,R=0.05,r=0.02):
+	"""Returns the (vertices,triangles) arrays of a torus with 2*n*n vertices"""
+	theta,phi = np.meshgrid(np.linspace(0,2*np.pi,n,endpoint=False),np.linspace(0,2*np.pi,2*n,endpoint=False),indexing='ij')
+	rho = R+r*np.cos(theta)
+	vertices = np.dstack([rho*np.cos(phi),rho*np.sin(phi),r*np.sin(theta)]).reshape((-1,3))
+	i = np.arange(n)[:,np.newaxis]*2*n
+	j = np.arange(2*n)[np.newaxis,:]
+	a = (i+j).ravel()
+	b = (i+(j+1)%(2*n)).ravel()
+	c = (a+2*n)%(2*n*n)
+	d = (b+2*n)%(2*n*n)
+	triangles = np.vstack([np.column_stack([a,c,b]),np.column_stack([b,c,d])])
+	return vertices,triangles
+
+def write_stl(fn,vertices,triangles):
+	"""Writes a binary STL file, with zero normals"""
+	facets = np.zeros(len(triangles),dtype=[('normal','<f4',(3,)),('vertices','<f4',(9,)),('attributes','<u2')])
+	facets['vertices'] = vertices[triangles].reshape((-1,9))
+	f = open(fn,'wb')
+	f.write('\0'*80)
+	f.write(np.array([len(triangles)],dtype='<u4').tobytes())
+	f.write(facets.tobytes())
+	f.close()
+
+def load_time(world,objectname):
+	"""Returns the wall time of make_object on the benchmark object set, with
+	the object geometry cache cleared first"""
+	main.object_cache.clear()
+	t0 = time.time()
+	main.make_object('benchmark',objectname,world)
+	return time.time()-t0
+
+if __name__ == '__main__':
+	sizes = [int(a) for a in sys.argv[1:]] or [50,150,300]
+	tmp = tempfile.mkdtemp()
+	main.object_geom_file_patterns['benchmark'] = [os.path.join(tmp,'%s','mesh.stl')]
+	world = WorldModel()
+	try:
+		for n in sizes:
+			objectname = 'torus%d'%(n,)
+			os.mkdir(os.path.join(tmp,objectname))
+			fn = os.path.join(tmp,objectname,'mesh.stl')
+			write_stl(fn,*torus(n))
+			parsed = load_time(world,objectname)
+			mesh_compiler.compile_mesh(fn)
+			compiled = load_time(world,objectname)
+			cmesh = mesh_compiler.load_mesh(fn)
+			t0 = time.time()
+			cmesh.geometry()
+			geometry = time.time()-t0
+			print "%d vertices, %d triangles: make_object %.3f s from the STL, %.3f s from the .cmesh (CompiledMesh.geometry %.3f s)"%(len(cmesh.vertices),len(cmesh.triangles),parsed,compiled,geometry)
+			if world.rigidObject(world.numRigidObjects()-2).geometry().getBB() != world.rigidObject(world.numRigidObjects()-1).geometry().getBB():
+				print "FAILED: the compiled mesh has a different bounding box"
+				sys.exit(1)
+	finally:
+		shutil.rmtree(tmp)
+	for robotname in main.robots:
+		t0 = time.time()
+		main.make_moving_base_robot(robotname,WorldModel())
+		print "make_moving_base_robot(%s): %.3f s"%(robotname,time.time()-t0)
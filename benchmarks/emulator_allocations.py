@@ -0,0 +1,124 @@
+"""Measures the cost of CompliantHandEmulator.output(), which runs at every
+simulation substep, against the implementation before the emulator was
+optimized: the time per call and the number of NumPy arrays it creates.
+
+By default the physics is not stepped, and a virtual contact wrench (see
+CompliantHandEmulator.virtual_wrenches) is applied to every underactuated
+link, so that both implementations take the contact path of every link
+without depending on the simulation.  With --settle, the trial is simulated
+for that many seconds first and the actual contacts are used instead.
+
+Usage: python benchmarks/emulator_allocations.py [robot] [# of calls] [--settle seconds]
+robot is soft_hand (default) or reflex.
+"""
+
+import common
+import argparse
+import sys
+import numpy as np
+from klampt.math import vectorops, se3
+
+def baseline_contact_forces_and_jacobians(hand):
+	"""The original CompliantHandEmulator.get_contact_forces_and_jacobians(),
+	which queries the contacts of every link with every world ID"""
+	n_contacts = 0
+	maxid = hand.world.numIDs()
+	J_l = dict()
+	f_l = dict()
+	t_l = dict()
+	for l_id in hand.u_to_l:
+		link_in_contact = hand.robot.link(hand.l_to_i[l_id])
+		contacts_per_link = 0
+		for j in xrange(maxid):
+			contacts_l_id_j = len(hand.sim.getContacts(l_id, j))
+			contacts_per_link += contacts_l_id_j
+			if contacts_l_id_j > 0:
+				if not f_l.has_key(l_id):
+					f_l[l_id] = hand.sim.contactForce(l_id, j)
+					t_l[l_id] = hand.sim.contactTorque(l_id, j)
+				else:
+					f_l[l_id] = vectorops.add(f_l[l_id], hand.sim.contactForce(l_id, j))
+					t_l[l_id] = vectorops.add(t_l[l_id], hand.sim.contactTorque(l_id, j))
+		if hand.virtual_contacts.has_key(l_id):
+			b = hand.sim.body(link_in_contact)
+			f_v = se3.apply_rotation(b.getTransform(),hand.virtual_wrenches[l_id][0:3])
+			t_v = se3.apply_rotation(b.getTransform(),hand.virtual_wrenches[l_id][3:6])
+			f_l[l_id] = f_v
+			t_l[l_id] = t_v
+		if contacts_per_link > 0 or hand.virtual_contacts.has_key(l_id):
+			n_contacts += 1
+			J_l[l_id] = np.array(link_in_contact.getJacobian((0, 0, 0)))
+			hand.robot.setConfig(hand.sim.getActualConfig(hand.robotindex))
+	f_c = np.array(6 * n_contacts * [0.0])
+	J_c = np.zeros((6 * n_contacts, hand.u_dofs))
+	for l_in_contact in xrange(len(J_l.keys())):
+		f_c[l_in_contact * 6:l_in_contact * 6 + 3] = t_l.values()[l_in_contact]
+		f_c[l_in_contact * 6 + 3:l_in_contact * 6 + 6] = f_l.values()[l_in_contact]
+		J_c[l_in_contact * 6:l_in_contact * 6 + 6, :] = np.array(J_l.values()[l_in_contact])[:, [hand.q_to_t[u_id] for u_id in hand.u_to_n]]
+	return (f_c, J_c)
+
+def baseline_output(hand):
+	"""The original CompliantHandEmulator.output(), which inverts E and
+	R E^-1 R^T and rebuilds its index lists and arrays at every call.  The
+	emulator attributes that it used to overwrite are left untouched."""
+	torque = np.array(hand.n_dofs * [0.0])
+	g_q = np.array(hand.robot.getGravityForces([0,0,-9.81]))
+	torque = g_q[hand.q_to_t]
+	q = np.array(hand.sim.getActualConfig(hand.robotindex))
+	q = q[hand.q_to_t]
+	dq = np.array(hand.sim.getActualVelocity(hand.robotindex))
+	dq = dq[hand.q_to_t]
+	dq_a = dq[hand.a_to_n]
+	dq_u = dq[hand.u_to_n]
+	dq_m = dq[hand.m_to_n]
+	q_a = q[hand.a_to_n]
+	q_u = q[hand.u_to_n]
+	q_m = q[hand.m_to_n]
+	hand.updateR(q_u)
+	R = hand.R
+	E_inv = np.linalg.inv(hand.E)
+	R_E_inv_R_T_inv = np.linalg.inv(R.dot(E_inv).dot(R.T))
+	sigma = q_a + hand.sigma_offset
+	f_c, J_c = baseline_contact_forces_and_jacobians(hand)
+	tau_c = J_c.T.dot(f_c)
+	f_a = hand.effort_scaling * R_E_inv_R_T_inv.dot(R).dot(E_inv).dot(tau_c) + hand.synergy_reduction * R_E_inv_R_T_inv.dot(sigma)
+	torque_a = 0.0 * (f_a / hand.synergy_reduction)
+	torque_u = R.T.dot(f_a) - hand.E.dot(q_u-hand.q_u_rest)
+	torque_m = len(hand.m_to_u)*[0.0]
+	q_u_ref = hand.q_u_rest + hand.effort_scaling * (-E_inv + E_inv.dot(R.T).dot(R_E_inv_R_T_inv).dot(R).dot(E_inv)).dot(tau_c) + hand.synergy_reduction * E_inv.dot(R.T).dot(R_E_inv_R_T_inv).dot(sigma)
+	torque[hand.a_to_n] = torque_a
+	torque[hand.u_to_n] += torque_u
+	torque[hand.m_to_n] += torque_m
+	qdes = np.array(hand.controller.getCommandedConfig())
+	qdes[[hand.q_to_t[u_id] for u_id in hand.u_to_n]] = q_u_ref
+	qdes[[hand.q_to_t[m_id] for m_id in hand.m_to_n]] = q_u_ref
+	qdes[[hand.q_to_t[a_id] for a_id in hand.a_to_n]] = hand.q_a_ref
+	qdes[[hand.q_to_t[d_id] for d_id in hand.d_to_n]] = hand.q_d_ref
+	return torque, qdes
+
+def add_virtual_contacts(hand,force=(0,0,-5.0)):
+	"""Applies a virtual force at the origin of every underactuated link of hand"""
+	for l_id in hand.u_to_l:
+		hand.virtual_contacts[l_id] = True
+		hand.virtual_wrenches[l_id] = np.array(list(force)+[0,0,0])
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Measures the time and array allocations of CompliantHandEmulator.output()')
+	parser.add_argument('robot',nargs='?',default='soft_hand',help='soft_hand (default) or reflex')
+	parser.add_argument('n',nargs='?',type=int,default=2000,help='number of calls')
+	parser.add_argument('--settle',type=float,default=0.0,help='simulated time before the measurement, in s; if 0 (default), virtual contacts are used')
+	args = parser.parse_args()
+	robotname,n = args.robot,args.n
+	sim,hand = common.make_balls_trial(robotname,settle=args.settle)
+	if args.settle <= 0:
+		add_virtual_contacts(hand)
+	t_old,qdes_old = baseline_output(hand)
+	t_new,qdes_new = hand.output()
+	print "max difference: torque %g, qdes %g"%(np.abs(t_old-t_new).max(),np.abs(qdes_old-qdes_new).max())
+	for name,fn in [('baseline output',lambda:baseline_output(hand)),('output',hand.output)]:
+		t = common.time_calls(fn,n)
+		narrays = common.new_arrays(fn,min(n,200))
+		if narrays is None:
+			print "%s: %.1f us per substep"%(name,t*1e6)
+		else:
+			print "%s: %.1f us, %.1f arrays created per substep"%(name,t*1e6,narrays)
@@ -0,0 +1,37 @@
+"""Measures the construction time of the CompliantHandEmulator hands with and
+without the hand parameter cache.
+
+Usage: python benchmarks/emulator_startup.py [robot ...]
+"""
+
+import common
+import importlib
+import os
+import sys
+import main
+import plugins.actuators.CompliantHandEmulator as che
+from klampt.sim.simulation import SimpleSimulator
+
+def construct_time(robotname,n,cached):
+	world,robot = main.make_balls_world(robotname,1)
+	sim = SimpleSimulator(world)
+	module = importlib.import_module('plugins.'+robotname)
+	cache_dir = che.hand_cache_dir
+	if not cached:
+		che.hand_cache_dir = None
+	stdout = sys.stdout
+	sys.stdout = open(os.devnull,'w')
+	try:
+		#the first construction fills the cache
+		module.HandEmulator(sim,0,6,6)
+		return common.time_calls(lambda:module.HandEmulator(sim,0,6,6),n)
+	finally:
+		sys.stdout.close()
+		sys.stdout = stdout
+		che.hand_cache_dir = cache_dir
+
+if __name__ == '__main__':
+	robots = sys.argv[1:] or ['soft_hand','reflex']
+	for robotname in robots:
+		for name,cached in [('uncached',False),('cached',True)]:
+			print "%s, %s: %.2f ms per emulator"%(robotname,name,construct_time(robotname,20,cached)*1000)
@@ -0,0 +1,61 @@
+"""Checks that the key of the hand parameter cache (see
+CompliantHandEmulator.handParametersKey) covers the sources of the emulator:
+the files of the emulator classes and of the soft hand parameter loader must
+be hashed, and editing the source file of an emulator subclass must change
+the key.
+
+Exits with status 1 if a check fails.
+
+Usage: python benchmarks/hand_cache_key.py
+"""
+
+import common
+import new
+import os
+import shutil
+import sys
+import tempfile
+
+subclass_source = """
+from plugins import soft_hand
+
+class HandEmulator(soft_hand.HandEmulator):
+    pass
+"""
+
+def subclass_key(hand,tmpdir,source):
+	"""Returns the cache key of a copy of hand whose class is defined in a module
+	of tmpdir with the given source"""
+	fn = os.path.join(tmpdir,'edited_hand.py')
+	f = open(fn,'w')
+	f.write(source)
+	f.close()
+	if 'edited_hand' not in sys.modules:
+		import edited_hand
+	#the emulator is not reinitialized, only the class of the copy matters
+	return new.instance(sys.modules['edited_hand'].HandEmulator,dict(hand.__dict__)).handParametersKey()
+
+if __name__ == '__main__':
+	sim,hand = common.make_balls_trial('soft_hand')
+	failures = []
+	files = [os.path.relpath(fn,common.root) for fn in hand.handSourceFiles()]
+	for fn in ['plugins/actuators/CompliantHandEmulator.py','plugins/soft_hand.py','plugins/loaders/soft_hand_loader.py']:
+		if fn not in files:
+			failures.append("%s is not hashed"%(fn,))
+	tmpdir = tempfile.mkdtemp()
+	sys.path.insert(0,tmpdir)
+	try:
+		key = subclass_key(hand,tmpdir,subclass_source)
+		if key == hand.handParametersKey():
+			failures.append("the key does not depend on the emulator class")
+		if subclass_key(hand,tmpdir,subclass_source + "    # edited\n") == key:
+			failures.append("the key does not change when the subclass source changes")
+	finally:
+		sys.path.remove(tmpdir)
+		shutil.rmtree(tmpdir)
+	print "hashed sources:"," ".join(files)
+	for failure in failures:
+		print "FAILED:",failure
+	if failures:
+		sys.exit(1)
+	print "OK"
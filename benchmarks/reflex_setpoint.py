@@ -0,0 +1,118 @@
+"""Measures the robot model writes and wall time of the reflex_col hand
+emulator while the hand closes on the balls and then holds them, for 10 s of
+simulated time.  The current HandEmulator.process / substep are compared with
+the previous versions, which set the hand command on the robot model at every
+call.
+
+With --emulator-only, the physics simulation is not stepped: the emulator's
+process and substep are called at the control and substep rates of the
+simulator while the hand closes and then holds still, in a single trial.  This isolates the
+emulator's own cost, which the physics dominates otherwise.
+
+Usage: python benchmarks/reflex_setpoint.py [simulated duration] [--emulator-only]
+"""
+
+import common
+import argparse
+import sys
+import time
+import types
+import headless
+
+class CountingRobot:
+	"""Wraps a RobotModel, counting the calls to setConfig"""
+	def __init__(self,robot):
+		self.robot = robot
+		self.setConfigCalls = 0
+	def setConfig(self,q):
+		self.setConfigCalls += 1
+		self.robot.setConfig(q)
+	def __getattr__(self,name):
+		return getattr(self.robot,name)
+
+def previous_process(self,commands,dt):
+	"""HandEmulator.process before setpoint tracking"""
+	if commands:
+		if 'position' in commands:
+			self.setCommand(commands['position'])
+			del commands['position']
+		if 'qcmd' in commands:
+			self.setCommand(commands['qcmd'])
+			del commands['qcmd']
+		if 'speed' in commands:
+			self.speed = commands['speed']
+			del commands['speed']
+		if 'force' in commands:
+			self.force = commands['force']
+			del commands['force']
+	for i in range(4):
+		speed = self.speed[i]
+		if self.endpoint[i] < self.setpoint[i]:
+			self.setpoint[i] = max(self.setpoint[i]-speed*dt,self.endpoint[i])
+		elif self.endpoint[i] > self.setpoint[i]:
+			self.setpoint[i] = min(self.setpoint[i]+speed*dt,self.endpoint[i])
+	self.model.setCommand(self.setpoint)
+	q = self.model.robot.getConfig()
+	qcmd = self.controller.getCommandedConfig()
+	for l in self.model.swivel_links + self.model.proximal_links:
+		qcmd[l] = q[l]
+	for l in self.model.distal_links:
+		qcmd[l] = 0
+	vcmd = self.controller.getCommandedVelocity()
+	if qcmd != self.controller.getCommandedConfig():
+		self.controller.setPIDCommand(qcmd,vcmd)
+
+def previous_substep(self,dt):
+	"""HandEmulator.substep before setpoint tracking"""
+	self.model.setCommand(self.setpoint)
+	self.update_tendon_lengths()
+	self.apply_tendon_forces()
+
+def run(duration,previous):
+	sim,hand = common.make_balls_trial('reflex_col')
+	if previous:
+		hand.process = types.MethodType(previous_process,hand)
+		hand.substep = types.MethodType(previous_substep,hand)
+	robot = CountingRobot(hand.model.robot)
+	hand.model.robot = robot
+	t0 = time.time()
+	while sim.getTime() < duration:
+		sim.simulate(headless.sim_dt)
+	return time.time()-t0,robot.setConfigCalls,hand.setpoint
+
+def run_emulator(sim,hand,duration,previous):
+	"""Calls the process and substep methods of hand (the current or previous
+	ones) as sim would, without stepping the physics, starting from the state
+	of hand and of its controller when the trial was built"""
+	process = types.MethodType(previous_process,hand) if previous else hand.process
+	substep = types.MethodType(previous_substep,hand) if previous else hand.substep
+	robot = CountingRobot(hand.model.robot)
+	hand.model.robot = robot
+	hand.setCommand([0.2,0.2,0.2,0])
+	substeps = int(round(headless.sim_dt/sim.substep_dt))
+	t0 = time.time()
+	for i in xrange(int(round(duration/headless.sim_dt))):
+		process({},headless.sim_dt)
+		for j in xrange(substeps):
+			substep(sim.substep_dt)
+	t = time.time()-t0
+	hand.model.robot = robot.robot
+	return t,robot.setConfigCalls,hand.setpoint
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Times the reflex_col hand emulator closing on and holding the balls')
+	parser.add_argument('duration',nargs='?',type=float,default=10.0,help='simulated duration, in s (default: 10)')
+	parser.add_argument('--emulator-only',action='store_true',help='call the emulator without stepping the physics')
+	args = parser.parse_args()
+	if args.emulator_only:
+		sim,hand = common.make_balls_trial('reflex_col')
+		state = hand.getState()
+		qcmd,vcmd = hand.controller.getCommandedConfig(),hand.controller.getCommandedVelocity()
+	for name,previous in [('previous',True),('current',False)]:
+		if args.emulator_only:
+			hand.setState(state)
+			hand.controller.setPIDCommand(qcmd,vcmd)
+			t,writes,setpoint = run_emulator(sim,hand,args.duration,previous)
+		else:
+			t,writes,setpoint = run(args.duration,previous)
+		print "%s: %.2f s wall time, %d robot model writes, final setpoint %s"%(name,t,writes,str(setpoint))
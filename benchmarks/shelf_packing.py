@@ -0,0 +1,90 @@
+"""Measures the wall time of packing N balls in the shelf with main.xy_jiggle,
+compared with the previous version, which recomputed the collisions between
+all the objects after every move and every removal.
+
+Usage: python benchmarks/shelf_packing.py [N ...]
+"""
+
+import common
+import sys
+import time
+import random
+from klampt import *
+from klampt.math import so3,se3
+from klampt.model import collide
+import main
+import packing
+
+def previous_xy_jiggle(world,objects,fixed_objects,bmin,bmax,iters,randomize=True):
+	"""main.xy_jiggle before the incremental packer, without its output"""
+	if randomize:
+		for obj in objects:
+			packing.xy_randomize(obj,bmin,bmax)
+	inner_iters = 10
+	while iters > 0:
+		numConflicts = [0]*len(objects)
+		for (i,j) in collide.self_collision_iter([o.geometry() for o in objects]):
+			numConflicts[i] += 1
+			numConflicts[j] += 1
+		for (i,j) in collide.group_collision_iter([o.geometry() for o in objects],[o.geometry() for o in fixed_objects]):
+			numConflicts[i] += 1
+		amax = max((c,i) for (i,c) in enumerate(numConflicts))[1]
+		cmax = numConflicts[amax]
+		if cmax == 0:
+			return []
+		other_geoms = [o.geometry() for o in objects[:amax]+objects[amax+1:]+fixed_objects]
+		for it in xrange(inner_iters):
+			packing.xy_randomize(objects[amax],bmin,bmax)
+			nc = sum([1 for p in collide.group_collision_iter([objects[amax].geometry()],other_geoms)])
+			if nc < cmax:
+				break
+			iters-=1
+	numConflicts = [0]*len(objects)
+	for (i,j) in collide.self_collision_iter([o.geometry() for o in objects]):
+		numConflicts[i] += 1
+		numConflicts[j] += 1
+	for (i,j) in collide.group_collision_iter([o.geometry() for o in objects],[o.geometry() for o in fixed_objects]):
+		numConflicts[i] += 1
+	removed = []
+	while max(numConflicts) > 0:
+		amax = max((c,i) for (i,c) in enumerate(numConflicts))[1]
+		removed.append(amax)
+		numConflicts = [0]*len(objects)
+		for (i,j) in collide.self_collision_iter([o.geometry() for o in objects]):
+			if i in removed or j in removed:
+				continue
+			numConflicts[i] += 1
+			numConflicts[j] += 1
+		for (i,j) in collide.group_collision_iter([o.geometry() for o in objects],[o.geometry() for o in fixed_objects]):
+			if i in removed:
+				continue
+			numConflicts[i] += 1
+	return removed
+
+def make_scene(n):
+	world = WorldModel()
+	shelf = main.make_shelf(world,*main.shelf_dims)
+	shelf.geometry().translate((0,main.shelf_offset,main.shelf_height))
+	balls = []
+	for i in xrange(n):
+		world.loadElement("data/objects/sphere_10cm.obj")
+		ball = world.rigidObject(world.numRigidObjects()-1)
+		ball.setTransform(so3.identity(),[0,main.shelf_offset,main.shelf_height + 0.06])
+		balls.append(ball)
+	bmin = [-0.5*main.shelf_dims[0],-0.5*main.shelf_dims[1]+main.shelf_offset]
+	bmax = [0.5*main.shelf_dims[0],0.5*main.shelf_dims[1]+main.shelf_offset]
+	return world,balls,[shelf],bmin,bmax
+
+def run(n,jiggle,seed=0):
+	random.seed(seed)
+	world,balls,fixed,bmin,bmax = make_scene(n)
+	t0 = time.time()
+	removed = jiggle(world,balls,fixed,bmin,bmax,100)
+	return time.time()-t0,len(removed)
+
+if __name__ == '__main__':
+	counts = [int(a) for a in sys.argv[1:]] or [5,10,20,40]
+	for n in counts:
+		for name,jiggle in [('previous',previous_xy_jiggle),('current',packing.xy_jiggle)]:
+			t,nremoved = run(n,jiggle)
+			print "%d balls, %s: %.3f s, %d removed"%(n,name,t,nremoved)
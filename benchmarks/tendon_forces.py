@@ -0,0 +1,156 @@
+"""Checks the tendon model of plugins/reflex_col.py against the per-finger
+implementation it replaced, and times both.
+
+The forces of both implementations are compared on random body transforms and
+rest lengths, with both slack and stretched tendons, and then at every step
+while the hand closes on the balls scene.  The models are timed on the random
+states, and the whole HandEmulator.substep, before and after, on the final
+state of the hand (if no step is simulated, the tendons are pulled as if the
+hand were closing).
+
+Exits with status 1 if the forces differ by more than tolerance.
+
+Usage: python benchmarks/tendon_forces.py [# of simulated steps]
+"""
+
+import common
+import random
+import sys
+import numpy as np
+from klampt.math import so3,se3,vectorops
+from plugins import reflex_col
+
+#max force difference between both implementations, in N
+tolerance = 1e-9
+
+def reference_tendon_forces(T0,T1,T2,rest_length,tendon0_local,tendon1_local,tendon2_local):
+	"""The previous tendon model of one finger, from the transforms of the base,
+	proximal and distal bodies.  Returns None if the tendon is slack, otherwise
+	the (f0,p0,f1,f2) forces and point as in reflex_col.tendon_force."""
+	tendon_c2 = 30000.0
+	tendon_c1 = 10000.0
+	p0w = se3.apply(T1,tendon0_local)
+	p1w = se3.apply(T1,tendon1_local)
+	p2w = se3.apply(T2,tendon2_local)
+	d = vectorops.distance(p1w,p2w)
+	if d <= rest_length:
+		return None
+	direction = vectorops.unit(vectorops.sub(p2w,p1w))
+	f = tendon_c2*(d - rest_length)**2+tendon_c1*(d - rest_length)
+	f = min(f,100)
+	straight = vectorops.unit(vectorops.sub(p2w,p0w))
+	pulley_direction = vectorops.unit(vectorops.sub(p1w,p0w))
+	pulley_axis = so3.apply(T1[0],(0,1,0))
+	tangential_axis = vectorops.cross(pulley_axis,pulley_direction)
+	cosangle = vectorops.dot(straight,tangential_axis)
+	base_direction = so3.apply(T0[0],[0,0,-1])
+	return (vectorops.mul(base_direction,-f),vectorops.madd(p0w,base_direction,0.04),
+			vectorops.mul(tangential_axis,cosangle*f),vectorops.mul(direction,f))
+
+def previous_substep(hand,dt):
+	"""HandEmulator.substep before the tendon model was rewritten, which looked
+	up the bodies and evaluated the model with klampt.math for each finger"""
+	hand.update_tendon_lengths()
+	robot = hand.model.robot
+	for i in range(3):
+		b0 = hand.sim.body(robot.link(hand.model.proximal_links[0]-3))
+		b1 = hand.sim.body(robot.link(hand.model.proximal_links[i]))
+		b2 = hand.sim.body(robot.link(hand.model.distal_links[i]))
+		res = reference_tendon_forces(b0.getTransform(),b1.getTransform(),b2.getTransform(),hand.tendon_lengths[i],hand.tendon0_local,hand.tendon1_local,hand.tendon2_local)
+		if res is not None:
+			f0,p0,f1,f2 = res
+			b0.applyForceAtLocalPoint(f0,p0)
+			b1.applyForceAtLocalPoint(f1,hand.tendon1_local)
+			b1.applyForceAtLocalPoint(vectorops.mul(f1,-1),hand.tendon0_local)
+			b2.applyForceAtLocalPoint(vectorops.mul(f2,-1),hand.tendon2_local)
+			hand.forces[i][1] = f1
+			hand.forces[i][2] = f2
+		else:
+			hand.forces[i] = [None,None,None]
+
+def random_transform(rng,T=None,scale=0.05):
+	"""Returns a random transform, within scale of T if given"""
+	R = so3.from_moment([rng.uniform(-3,3) for k in range(3)])
+	t = [rng.uniform(-scale,scale) for k in range(3)]
+	return (R,t) if T is None else se3.mul(T,(R,t))
+
+def random_states(n,seed=0):
+	"""Returns n random (T0,T1,T2,rest_lengths) inputs of the tendon model"""
+	rng = random.Random(seed)
+	states = []
+	for k in xrange(n):
+		T0 = random_transform(rng,scale=1.0)
+		T1 = [random_transform(rng,T0) for i in range(3)]
+		T2 = [random_transform(rng,T) for T in T1]
+		states.append((T0,T1,T2,[rng.uniform(0,0.1) for i in range(3)]))
+	return states
+
+def body_state(hand):
+	"""Returns the current (T0,T1,T2,rest_lengths) state of hand"""
+	return (hand.base_body.getTransform(),[b.getTransform() for b in hand.proximal_bodies],
+			[b.getTransform() for b in hand.distal_bodies],hand.tendon_lengths)
+
+def compare(state,hand):
+	"""Returns the max difference between the forces of both implementations on
+	the (T0,T1,T2,rest_lengths) state with the attachment points of hand, and
+	the number of stretched tendons"""
+	T0,T1,T2,rest_lengths = state
+	err = 0.0
+	active = 0
+	for i in range(3):
+		ref = reference_tendon_forces(T0,T1[i],T2[i],rest_lengths[i],hand.tendon0_local,hand.tendon1_local,hand.tendon2_local)
+		res = reflex_col.tendon_force(T0,T1[i],T2[i],rest_lengths[i],hand.tendon0_local,hand.tendon1_local,hand.tendon2_local)
+		if (ref is None) != (res is None):
+			return float('inf'),active
+		if ref is not None:
+			active += 1
+			for a,b in zip(ref,res):
+				err = max(err,np.abs(np.array(a)-np.array(b)).max())
+	return err,active
+
+def pull_tendons(hand,pull=1.0):
+	"""Commands the proximal joints pull radians beyond their current position,
+	which shortens the tendons as when the hand closes"""
+	qcmd = hand.controller.getCommandedConfig()
+	for l in hand.model.proximal_links:
+		qcmd[l] += pull
+	hand.controller.setPIDCommand(qcmd,hand.controller.getCommandedVelocity())
+
+if __name__ == '__main__':
+	n = int(sys.argv[1]) if len(sys.argv) > 1 else 500
+	sim,hand = common.make_balls_trial('reflex_col')
+	states = random_states(1000)
+	results = [compare(s,hand) for s in states]
+	err = max(e for (e,active) in results)
+	print "max force difference over %d random states (%d stretched tendons): %g"%(len(states),sum(a for (e,a) in results),err)
+	if n > 0:
+		sim_err = 0.0
+		for i in xrange(n):
+			sim.simulate(0.01)
+			sim_err = max(sim_err,compare(body_state(hand),hand)[0])
+		print "max force difference over %d simulated steps: %g"%(n,sim_err)
+		err = max(err,sim_err)
+	else:
+		pull_tendons(hand)
+	hand.update_tendon_lengths()
+	print "stretched tendons during the substeps:",compare(body_state(hand),hand)[1]
+
+	counter = [0]
+	def next_state():
+		counter[0] = (counter[0]+1)%len(states)
+		return states[counter[0]]
+	def previous_model():
+		T0,T1,T2,rest_lengths = next_state()
+		for i in range(3):
+			reference_tendon_forces(T0,T1[i],T2[i],rest_lengths[i],hand.tendon0_local,hand.tendon1_local,hand.tendon2_local)
+	def model():
+		T0,T1,T2,rest_lengths = next_state()
+		for i in range(3):
+			reflex_col.tendon_force(T0,T1[i],T2[i],rest_lengths[i],hand.tendon0_local,hand.tendon1_local,hand.tendon2_local)
+	print "previous model: %.1f us per substep (3 fingers)"%(common.time_calls(previous_model,10000)*1e6,)
+	print "model: %.1f us per substep (3 fingers)"%(common.time_calls(model,10000)*1e6,)
+	print "previous substep: %.1f us"%(common.time_calls(lambda:previous_substep(hand,0.001),10000)*1e6,)
+	print "substep: %.1f us"%(common.time_calls(lambda:hand.substep(0.001),10000)*1e6,)
+	if err > tolerance:
+		print "FAILED: the forces differ by more than",tolerance
+		sys.exit(1)
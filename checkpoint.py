@@ -0,0 +1,136 @@
+"""Checkpoints of running trials, and branching trials from a checkpoint.
+
+Many experiments share a prefix (approach and close the hand) and only
+differ afterwards (lift or shake strategies).  The prefix can be simulated
+once and captured as a Checkpoint, which holds the simulator state and the
+internal state of the hand emulator (e.g., the reflex_col setpoint and
+endpoint, or the CompliantHandEmulator q_a_ref).  fork() then runs each
+branch from the checkpoint in a pool of worker processes.
+
+Klamp't objects cannot be sent to other processes, so a trial is described
+by an info dict from which each worker rebuilds its world and simulator:
+- world, args: the world type ('simple', 'balls' or 'shelf') and the
+  arguments of the main.make_*_world function (see replay.make_world).  The
+  seed in args makes the randomly placed objects the same in every worker; it
+  is required for the shelf, whose packing may leave out objects
+- controller: the name of the controller module attached to the robot
+- control_dt: the control step (default headless.control_dt)
+- xform: the initial hand transform (default: the stored resource, as in
+  headless.py)
+This is the same info that headless.py saves in its recordings.
+
+A branch is a picklable function branch(sim,hand,dt), called after the
+checkpoint is restored, which returns the controller to attach to the robot
+or None to keep the trial's controller.  A kept controller is rebuilt with
+make() rather than restored, so it should depend only on the simulation time.
+Controller modules' make functions can be used as branches.
+
+Usage:
+	info = {'world':'simple','args':['reflex_col','ycb','011_banana',False,None],'controller':'simple_controller'}
+	checkpoint = run_prefix(info,1.0)
+	results = fork(info,checkpoint,[lift_slow,lift_fast,shake],duration=3.0)
+"""
+
+from klampt import *
+from klampt.sim.simulation import SimpleSimulator
+from moving_base_control import *
+import replay
+import headless
+import main
+import telemetry
+import multiprocessing
+import importlib
+import os
+import sys
+import time
+import traceback
+
+#resources tried for the initial hand transform when info has no xform
+initial_xform_resources = {'simple':["%(1)s/initial_%(0)s_%(2)s.xform","%(1)s/default_initial_%(0)s.xform"],
+						   'balls':["balls/default_initial_%(0)s.xform"],
+						   'shelf':["shelf/default_initial_%(0)s.xform"]}
+
+class Checkpoint:
+	"""The state of a trial at the simulation time time: sim_state is the
+	result of sim.getState() and hand_state the result of hand.getState()"""
+	def __init__(self,sim_state,hand_state,time):
+		self.sim_state = sim_state
+		self.hand_state = hand_state
+		self.time = time
+
+def capture(sim,hand):
+	"""Returns a Checkpoint of the current state of sim and of its hand emulator"""
+	return Checkpoint(sim.getState(),hand.getState(),sim.getTime())
+
+def restore(sim,hand,checkpoint):
+	"""Restores sim and its hand emulator to the given Checkpoint"""
+	sim.setState(checkpoint.sim_state)
+	hand.setState(checkpoint.hand_state)
+	sim.updateWorld()
+
+def make_trial(info):
+	"""Builds the world and the simulator described by info, with the hand
+	emulator and controller attached.  Returns (sim,hand)."""
+	if info['world'] == 'shelf' and (len(info['args']) < 4 or info['args'][3] is None):
+		raise ValueError("Shelf trials are only reproducible with a seed in args")
+	world,robot = replay.make_world(info)
+	xform = info.get('xform')
+	if xform is None:
+		keys = dict((str(i),a) for i,a in enumerate(info['args']))
+		xform = headless.load_initial_xform(robot,[fn%keys for fn in initial_xform_resources[info['world']]])
+	set_moving_base_xform(robot,xform[0],xform[1])
+	sim = SimpleSimulator(world)
+	hand = main.setup_simulation(sim,info['args'][0],importlib.import_module(info['controller']),info.get('control_dt',headless.control_dt))
+	return sim,hand
+
+def run_prefix(info,t):
+	"""Simulates the trial described by info up to the simulation time t and
+	returns its Checkpoint"""
+	sim,hand = make_trial(info)
+	while sim.getTime() < t:
+		sim.simulate(headless.sim_dt)
+	return capture(sim,hand)
+
+def _init_worker(quiet):
+	telemetry.configure(enabled=False)
+	if quiet:
+		sys.stdout = open(os.devnull,'w')
+
+def run_branch(args):
+	"""Runs a single branch in a worker process.  Returns the trial result of
+	headless.simulate_trial, or a dict with an error message if the branch
+	failed."""
+	info,checkpoint,branch,duration = args
+	name = getattr(branch,'__name__',str(branch))
+	try:
+		sim,hand = make_trial(info)
+		restore(sim,hand,checkpoint)
+		dt = info.get('control_dt',headless.control_dt)
+		robot = sim.world.robot(0)
+		controller = branch(sim,hand,dt)
+		if controller is not None:
+			sim.setController(robot,controller)
+		objects = [sim.world.rigidObject(i) for i in xrange(sim.world.numRigidObjects())]
+		res = headless.simulate_trial(sim,robot,objects,duration)
+	except Exception:
+		return {'branch':name,'error':traceback.format_exc().strip().split('\n')[-1]}
+	res['branch'] = name
+	return res
+
+def fork(info,checkpoint,branches,duration,processes=None,quiet=True):
+	"""Runs each of the given branches from checkpoint up to the simulation time
+	duration, over a pool of processes (default: one per CPU).  Returns the
+	trial results in the order of branches, in which the lift heights are
+	measured from the checkpoint."""
+	pool = multiprocessing.Pool(processes,_init_worker,(quiet,))
+	t0 = time.time()
+	try:
+		results = pool.map(run_branch,[(info,checkpoint,b,duration) for b in branches])
+		pool.close()
+	except KeyboardInterrupt:
+		pool.terminate()
+		raise
+	finally:
+		pool.join()
+	print "Ran",len(results),"branches from t =",checkpoint.time,"in",time.time()-t0,"s"
+	return results
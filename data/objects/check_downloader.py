@@ -0,0 +1,165 @@
+"""Checks downloader.py against a local HTTP server with Range support, in a
+temporary directory:
+- resume: a download whose .part file holds the start of the archive only
+  requests the rest, and extracts the whole archive
+- reconnect: a connection dropped by the server is resumed
+- corruption: an archive with a wrong SHA256 digest fails, and leaves neither
+  its .part file nor extracted files behind
+- concurrency: archives that extract into the same directories are
+  downloaded in parallel into a destination that does not exist yet
+
+Exits with status 1 if a check fails.
+
+Usage: python check_downloader.py
+"""
+
+import BaseHTTPServer
+import SimpleHTTPServer
+import SocketServer
+import hashlib
+import os
+import re
+import shutil
+import sys
+import tarfile
+import tempfile
+import threading
+import downloader
+
+
+class RangeRequestHandler(SimpleHTTPServer.SimpleHTTPRequestHandler):
+    """Serves the files of server.root, answering 'bytes=N-' Range requests.
+    The first response for a file listed in server.drop_after is cut after
+    that many bytes."""
+    def translate_path(self, path):
+        return os.path.join(self.server.root, path.lstrip('/'))
+
+    def do_GET(self):
+        fn = self.translate_path(self.path)
+        if not os.path.isfile(fn):
+            self.send_error(404)
+            return
+        data = open(fn, 'rb').read()
+        name = os.path.basename(fn)
+        m = re.match(r'bytes=(\d+)-$', self.headers.getheader('Range', ''))
+        start = int(m.group(1)) if m else 0
+        with self.server.lock:
+            self.server.requests.append((name, start))
+            drop = self.server.drop_after.pop(name, None)
+        if start >= len(data):
+            self.send_error(416)
+            return
+        if m:
+            self.send_response(206)
+            self.send_header('Content-Range', 'bytes %d-%d/%d' % (start, len(data) - 1, len(data)))
+        else:
+            self.send_response(200)
+        self.send_header('Content-Length', str(len(data) - start))
+        self.end_headers()
+        end = len(data) if drop is None else start + drop
+        self.wfile.write(data[start:end])
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Server(SocketServer.ThreadingMixIn, BaseHTTPServer.HTTPServer):
+    daemon_threads = True
+
+
+def make_archive(fn, members):
+    """Writes a .tgz archive of the (name, data) members and returns its digest"""
+    tmp = tempfile.mkdtemp()
+    tar = tarfile.open(fn, 'w:gz')
+    for name, data in members:
+        path = os.path.join(tmp, name)
+        if not os.path.isdir(os.path.dirname(path)):
+            os.makedirs(os.path.dirname(path))
+        f = open(path, 'wb')
+        f.write(data)
+        f.close()
+        tar.add(path, name)
+    tar.close()
+    shutil.rmtree(tmp)
+    return hashlib.sha256(open(fn, 'rb').read()).hexdigest()
+
+
+def extracted(dest, members):
+    """Returns True if the members were extracted into dest"""
+    for name, data in members:
+        path = os.path.join(dest, name)
+        if not os.path.isfile(path) or open(path, 'rb').read() != data:
+            return False
+    return True
+
+
+if __name__ == '__main__':
+    tmp = tempfile.mkdtemp()
+    root = os.path.join(tmp, 'server')
+    os.makedirs(root)
+    downloader.work_dir = os.path.join(tmp, 'work')
+    downloader.retry_delay = 0.0
+    server = Server(('127.0.0.1', 0), RangeRequestHandler)
+    server.root = root
+    server.lock = threading.Lock()
+    server.requests = []
+    server.drop_after = dict()
+    thread = threading.Thread(target=server.serve_forever)
+    thread.daemon = True
+    thread.start()
+    url = 'http://127.0.0.1:%d/' % (server.server_address[1],)
+    failures = []
+
+    def check(name, ok):
+        print "%s: %s" % (name, 'OK' if ok else 'FAILED')
+        if not ok:
+            failures.append(name)
+
+    try:
+        #random data does not compress, so the archives are about as large as their members
+        members = dict()
+        digests = dict()
+        for name, files in [('resume.tgz', ['resume/meshes/a.bin', 'resume/meshes/b.bin']),
+                            ('drop.tgz', ['drop/meshes/a.bin']),
+                            ('corrupt.tgz', ['corrupt/meshes/a.bin'])] + \
+                           [('shared%d.tgz' % (i,), ['shared/meshes/%d.bin' % (i,)]) for i in xrange(12)]:
+            members[name] = [(fn, os.urandom(300000)) for fn in files]
+            digests[name] = make_archive(os.path.join(root, name), members[name])
+
+        dest = os.path.join(tmp, 'resume_dest')
+        data = open(os.path.join(root, 'resume.tgz'), 'rb').read()
+        os.makedirs(downloader.work_dir)
+        part = open(os.path.join(downloader.work_dir, 'resume.tgz.part'), 'wb')
+        part.write(data[:len(data) // 3])
+        part.close()
+        failed = downloader.download([(url + 'resume.tgz', 'resume.tgz')], dest, 1, digests)
+        check("resume from a .part file", not failed and extracted(dest, members['resume.tgz'])
+              and server.requests == [('resume.tgz', len(data) // 3)])
+
+        dest = os.path.join(tmp, 'drop_dest')
+        server.drop_after['drop.tgz'] = 100000
+        failed = downloader.download([(url + 'drop.tgz', 'drop.tgz')], dest, 1, digests)
+        check("resume a dropped connection", not failed and extracted(dest, members['drop.tgz'])
+              and [r for r in server.requests if r[0] == 'drop.tgz'] == [('drop.tgz', 0), ('drop.tgz', 100000)])
+
+        dest = os.path.join(tmp, 'corrupt_dest')
+        bad = dict(digests)
+        bad['corrupt.tgz'] = '0' * 64
+        failed = downloader.download([(url + 'corrupt.tgz', 'corrupt.tgz')], dest, 1, bad)
+        check("reject a wrong digest", [name for (name, error) in failed] == ['corrupt.tgz']
+              and not os.path.exists(os.path.join(downloader.work_dir, 'corrupt.tgz.part'))
+              and not os.path.exists(os.path.join(dest, 'corrupt')))
+        failed = downloader.download([(url + 'corrupt.tgz', 'corrupt.tgz')], dest, 1, digests)
+        check("download again after a wrong digest", not failed and extracted(dest, members['corrupt.tgz']))
+
+        dest = os.path.join(tmp, 'new', 'shared_dest')
+        names = ['shared%d.tgz' % (i,) for i in xrange(12)]
+        failed = downloader.download([(url + name, name) for name in names], dest, len(names), digests)
+        check("parallel downloads into the same directories", not failed
+              and all(extracted(dest, members[name]) for name in names))
+    finally:
+        server.shutdown()
+        server.server_close()
+        shutil.rmtree(tmp)
+    if failures:
+        sys.exit(1)
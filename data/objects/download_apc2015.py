@@ -1,8 +1,7 @@
-import os
-import sys
+import argparse
 import json
-import urllib
 import urllib2
+import downloader
 
 output_directory = "./apc2015"
 
@@ -19,62 +18,36 @@ objects_to_download = "all"
 # See the website for more details.
 files_to_download = ["processed"]
 
-# Extract all files from the downloaded .tgz, and remove .tgz files.
-# If false, will just download all .tgz files to output_directory
+# Extract all files from the downloaded .tgz files.
+# If false, will just save all .tgz files to output_directory
 extract = True
 
 base_url = "http://rll.berkeley.edu/amazon_picking_challenge/"
-objects_url = base_url + "objects.json"
-
-if not os.path.exists(output_directory):
-    os.makedirs(output_directory)
 
 def fetch_objects(url):
-    response = urllib2.urlopen(url)
+    response = urllib2.urlopen(url, timeout=downloader.timeout)
     html = response.read()
     objects = json.loads(html)
     return objects["objects"]
 
-def download_file(url, filename):
-    u = urllib2.urlopen(url)
-    f = open(filename, 'wb')
-    meta = u.info()
-    file_size = int(meta.getheaders("Content-Length")[0])
-    print "Downloading: %s (%s MB)" % (filename, file_size/1000000.0)
-
-    file_size_dl = 0
-    block_sz = 65536
-    while True:
-        buffer = u.read(block_sz)
-        if not buffer:
-            break
-
-        file_size_dl += len(buffer)
-        f.write(buffer)
-        status = r"%10d  [%3.2f%%]" % (file_size_dl/1000000.0, file_size_dl * 100. / file_size)
-        status = status + chr(8)*(len(status)+1)
-        print status,
-    f.close()
-
-def tgz_url(object, type):
+def tgz_url(base_url, object, type):
     return base_url + "data/{object}/{type}.tgz".format(object=object,type=type)
 
-def extract_tgz(filename, dir):
-    tar_command = "tar -xzf {filename} -C {dir}".format(filename=filename,dir=dir)
-    os.system(tar_command)
-    os.remove(filename)
-
 if __name__ == "__main__":
-
-    objects = fetch_objects(objects_url)
-
-    for object in objects:
-        if objects_to_download == "all" or object in objects_to_download:
-            for file_type in files_to_download:
-                url = tgz_url(object, file_type)
-                filename = "{path}/{object}_{file_type}.tgz".format(path=output_directory,
-                                                                    object=object,
-                                                                    file_type=file_type)
-                download_file(url, filename)
-                if extract:
-                    extract_tgz(filename, output_directory)
\ No newline at end of file
+    parser = argparse.ArgumentParser(description='Downloads the APC2015 dataset into ' + output_directory)
+    parser.add_argument('objects', nargs='*', help='objects to download (default: objects_to_download)')
+    parser.add_argument('-t', '--type', action='append', help='kinds of files to download (default: %s)' % (' '.join(files_to_download),))
+    parser.add_argument('--url', default=base_url, help='base URL of the dataset (default: %s)' % (base_url,))
+    downloader.add_arguments(parser)
+    parser.set_defaults(extract=extract)
+    args = parser.parse_args()
+    wanted = args.objects or objects_to_download
+    archives = []
+    for object in fetch_objects(args.url + "objects.json"):
+        if wanted == "all" or object in wanted:
+            for file_type in args.type or files_to_download:
+                archives.append((tgz_url(args.url, object, file_type), "{object}_{file_type}.tgz".format(object=object, file_type=file_type)))
+    checksums = downloader.read_checksums(args.checksums) if args.checksums else None
+    failures = downloader.download(archives, output_directory, args.jobs, checksums, args.extract, args.force)
+    if failures:
+        exit(1)
@@ -1,42 +1,18 @@
-import os
-import sys
-import urllib
-import urllib2
+import argparse
+import downloader
 
-# Extract all files from the downloaded .tgz, and remove .tgz files.
+# Extract all files from the downloaded .tgz.  If false, will just save the .tgz.
 extract = True
 
 db_url = "http://rll.eecs.berkeley.edu/ycb/export/ycb.tgz"
 
-
-def download_file(url, filename):
-    u = urllib2.urlopen(url)
-    f = open(filename, 'wb')
-    meta = u.info()
-    file_size = int(meta.getheaders("Content-Length")[0])
-    print "Downloading: %s (%s MB)" % (filename, file_size/1000000.0)
-
-    file_size_dl = 0
-    block_sz = 65536
-    while True:
-        buffer = u.read(block_sz)
-        if not buffer:
-            break
-
-        file_size_dl += len(buffer)
-        f.write(buffer)
-        status = r"%10d  [%3.2f%%]" % (file_size_dl/1000000.0, file_size_dl * 100. / file_size)
-        status = status + chr(8)*(len(status)+1)
-        print status,
-    f.close()
-
-def extract_tgz(filename, dir):
-    tar_command = "tar -xzf {filename} ".format(filename=filename)
-    os.system(tar_command)
-    os.remove(filename)
-
 if __name__ == "__main__":
-
-    download_file(db_url, 'ycb.tgz')
-    if extract:
-        extract_tgz('ycb.tgz', '.')
+    parser = argparse.ArgumentParser(description='Downloads the YCB dataset into ./ycb')
+    parser.add_argument('--url', default=db_url, help='URL of the dataset archive (default: %s)' % (db_url,))
+    downloader.add_arguments(parser)
+    parser.set_defaults(extract=extract)
+    args = parser.parse_args()
+    checksums = downloader.read_checksums(args.checksums) if args.checksums else None
+    failures = downloader.download([(args.url, 'ycb.tgz')], '.', args.jobs, checksums, args.extract, args.force)
+    if failures:
+        exit(1)
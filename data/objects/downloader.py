@@ -0,0 +1,319 @@
+"""Parallel, resumable download of the dataset archives.
+
+Each .tgz archive is extracted while it downloads, by a bounded pool of
+threads.  The received bytes are also appended to a .part file in work_dir,
+so that an interrupted download resumes with an HTTP Range request: the saved
+bytes are replayed into the extraction and the rest is fetched from the
+server.  Dropped connections are resumed the same way, up to max_retries
+times in a row.
+
+The members are extracted into a staging directory, and only moved into the
+destination once the archive is complete: its size must match the one given
+by the server, and its SHA256 digest the expected one, if known.  The .part
+file is then removed.  The digests of the completed archives are appended to
+work_dir/downloaded.sha256 (in the format of sha256sum), and these archives
+are skipped by later runs.  That file can be passed as the checksums of the
+downloads on another machine.
+
+The URLs are parameters, so the downloads can be tested against a local HTTP
+server (which must support Range requests for the resume to be exercised).
+See download_ycb.py and download_apc2015.py.
+"""
+
+import errno
+import hashlib
+import httplib
+import os
+import re
+import shutil
+import socket
+import sys
+import tarfile
+import threading
+import time
+import traceback
+import urllib2
+import zlib
+from multiprocessing.pool import ThreadPool
+
+work_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), '.download')
+block_size = 65536
+timeout = 60
+max_retries = 5
+retry_delay = 2.0
+default_jobs = 4
+
+
+class DownloadError(Exception):
+    pass
+
+
+class ResumableStream:
+    """A file-like object reading the archive at url.  The bytes already saved
+    in the file part are read first, then the rest is requested from the
+    server; the new bytes are appended to part.  sha256 is the digest of the
+    bytes read so far and size the total size of the archive, if the server
+    gives it."""
+    def __init__(self, url, part, retries=None):
+        self.url = url
+        self.retries = max_retries if retries is None else retries
+        self.sha256 = hashlib.sha256()
+        self.size = None
+        self.received = 0
+        self.response = None
+        saved = os.path.getsize(part) if os.path.exists(part) else 0
+        start = self._connect(saved)
+        if start is None:
+            #the saved bytes are the whole archive
+            start = saved
+        elif start > saved:
+            raise DownloadError("%s: the server resumed at byte %d, after the %d saved bytes" % (url, start, saved))
+        self.part = open(part, 'r+b' if saved > 0 else 'w+b')
+        self.part.truncate(start)
+        self.saved = start
+        if start == 0:
+            self.part.seek(0, 2)
+
+    def _connect(self, offset):
+        """Requests the bytes of the archive from offset on.  Returns the offset
+        at which the response starts (0 if the server ignored the range), or
+        None if there are no bytes past offset."""
+        request = urllib2.Request(self.url)
+        if offset > 0:
+            request.add_header('Range', 'bytes=%d-' % (offset,))
+        try:
+            response = urllib2.urlopen(request, timeout=timeout)
+        except urllib2.HTTPError as e:
+            if e.code == 416 and offset > 0:
+                self.response = None
+                return None
+            raise
+        info = response.info()
+        if response.getcode() == 206:
+            m = re.match(r'bytes (\d+)-\d+/(\d+|\*)', info.getheader('Content-Range', ''))
+            if m is None:
+                raise DownloadError("%s: invalid Content-Range" % (self.url,))
+            start = int(m.group(1))
+            if m.group(2) != '*':
+                self.size = int(m.group(2))
+        else:
+            start = 0
+            length = info.getheader('Content-Length')
+            if length is not None:
+                self.size = int(length)
+        self.response = response
+        return start
+
+    def _reconnect(self, failures, error):
+        if failures > self.retries:
+            raise DownloadError("%s: %s" % (self.url, error))
+        time.sleep(retry_delay)
+        try:
+            start = self._connect(self.received)
+        except (urllib2.URLError, socket.error, httplib.HTTPException) as e:
+            self.response = None
+            return
+        if start is not None and start != self.received:
+            raise DownloadError("%s: the server does not resume downloads" % (self.url,))
+
+    def _read_remote(self, n):
+        failures = 0
+        error = None
+        while True:
+            if self.response is not None:
+                try:
+                    data = self.response.read(n)
+                    if data:
+                        self.part.write(data)
+                        return data
+                    if self.size is None or self.received >= self.size:
+                        #end of the archive
+                        self.response.close()
+                        self.response = None
+                        return ''
+                    error = "connection closed at byte %d of %d" % (self.received, self.size)
+                except (socket.error, httplib.HTTPException) as e:
+                    error = e
+            elif self.size is not None and self.received >= self.size:
+                return ''
+            elif error is None:
+                #the saved bytes were the whole archive
+                return ''
+            failures += 1
+            self.part.flush()
+            self._reconnect(failures, error)
+
+    def read(self, n=block_size):
+        if self.received < self.saved:
+            data = self.part.read(min(n, self.saved - self.received))
+            if self.received + len(data) == self.saved:
+                self.part.seek(0, 2)
+        else:
+            data = self._read_remote(n)
+        self.sha256.update(data)
+        self.received += len(data)
+        return data
+
+    def close(self):
+        if self.response is not None:
+            self.response.close()
+            self.response = None
+        self.part.close()
+
+
+def safe_member(member):
+    """Returns True if the tar member is a file or directory that extracts
+    inside the target directory"""
+    name = member.name
+    return (member.isfile() or member.isdir()) and not os.path.isabs(name) and '..' not in name.split('/')
+
+
+def makedirs(path):
+    """Creates the directory path and its parents, unless it exists.  Other
+    threads may be creating it at the same time."""
+    try:
+        os.makedirs(path)
+    except OSError as e:
+        if e.errno != errno.EEXIST or not os.path.isdir(path):
+            raise
+
+
+def merge_tree(src, dst):
+    """Moves the contents of the directory src into dst, replacing the files
+    that exist, and removes src.  Several archives may be merged into dst at
+    the same time."""
+    for root, dirs, files in os.walk(src):
+        target = os.path.join(dst, os.path.relpath(root, src))
+        makedirs(target)
+        for fn in files:
+            os.rename(os.path.join(root, fn), os.path.join(target, fn))
+    shutil.rmtree(src)
+
+
+def fetch(url, name, dest, sha256=None, extract=True, retries=None):
+    """Downloads the archive name from url and extracts it into dest (or if
+    extract is False, saves it as dest/name).  The archive is checked against
+    its size and the SHA256 digest sha256, if given.  Returns (digest, size).
+
+    Raises DownloadError if the download fails.  A partial download is kept
+    to be resumed, unless the archive is corrupt."""
+    makedirs(work_dir)
+    part = os.path.join(work_dir, name + '.part')
+    staging = os.path.join(work_dir, name + '.staging')
+    if os.path.exists(staging):
+        shutil.rmtree(staging)
+    try:
+        stream = ResumableStream(url, part, retries)
+    except (urllib2.URLError, socket.error, httplib.HTTPException) as e:
+        raise DownloadError("%s: %s" % (url, e))
+    corrupt = None
+    try:
+        if extract:
+            tar = tarfile.open(fileobj=stream, mode='r|gz')
+            for member in tar:
+                if not safe_member(member):
+                    corrupt = "unsafe member %s" % (member.name,)
+                    break
+                tar.extract(member, staging)
+            tar.close()
+        #read the rest of the archive (the end of the tar records and the gzip trailer)
+        while corrupt is None and stream.read():
+            pass
+    except (tarfile.TarError, zlib.error, EOFError, IOError) as e:
+        corrupt = str(e)
+    except DownloadError:
+        #keep the partial download to resume it
+        shutil.rmtree(staging, ignore_errors=True)
+        raise
+    finally:
+        stream.close()
+    digest = stream.sha256.hexdigest()
+    if corrupt is None and stream.size is not None and stream.received != stream.size:
+        corrupt = "received %d of %d bytes" % (stream.received, stream.size)
+    if corrupt is None and sha256 is not None and digest != sha256.lower():
+        corrupt = "SHA256 %s, expected %s" % (digest, sha256)
+    if corrupt is not None:
+        if os.path.exists(staging):
+            shutil.rmtree(staging)
+        os.remove(part)
+        raise DownloadError("%s is corrupt: %s" % (name, corrupt))
+    makedirs(dest)
+    if extract:
+        if os.path.exists(staging):
+            merge_tree(staging, dest)
+        os.remove(part)
+    else:
+        os.rename(part, os.path.join(dest, name))
+    return digest, stream.received
+
+
+def read_checksums(fn):
+    """Reads a file (or URL) of SHA256 digests in the format of sha256sum into
+    a dict mapping file names to digests.  Returns an empty dict if fn is a
+    file that does not exist."""
+    if fn.startswith('http://') or fn.startswith('https://'):
+        text = urllib2.urlopen(fn, timeout=timeout).read()
+    elif os.path.exists(fn):
+        text = open(fn, 'r').read()
+    else:
+        return dict()
+    checksums = dict()
+    for line in text.splitlines():
+        items = line.split()
+        if len(items) == 2:
+            checksums[items[1].lstrip('*')] = items[0]
+    return checksums
+
+
+def download(archives, dest, jobs=None, checksums=None, extract=True, force=False):
+    """Downloads the (url, name) archives into dest with jobs threads, skipping
+    the archives that were completed before unless force is True.  checksums
+    maps archive names to their SHA256 digests.  Returns the list of
+    (name, error) of the archives that failed."""
+    checksums = checksums or dict()
+    makedirs(work_dir)
+    makedirs(dest)
+    manifest = os.path.join(work_dir, 'downloaded.sha256')
+    done = read_checksums(manifest)
+    todo = [(url, name) for (url, name) in archives if force or name not in done]
+    if len(todo) < len(archives):
+        print "Skipping %d archives downloaded before" % (len(archives) - len(todo),)
+    lock = threading.Lock()
+
+    def run(archive):
+        url, name = archive
+        t0 = time.time()
+        try:
+            digest, size = fetch(url, name, dest, checksums.get(name), extract)
+        except DownloadError as e:
+            return name, str(e)
+        except Exception:
+            #e.g. an extraction error, which only fails this archive
+            return name, "%s: %s" % (name, traceback.format_exc().strip().split('\n')[-1])
+        with lock:
+            f = open(manifest, 'a')
+            f.write("%s  %s\n" % (digest, name))
+            f.close()
+            print "Downloaded: %s (%.1f MB, %.1f s)" % (name, size / 1000000.0, time.time() - t0)
+            sys.stdout.flush()
+        return name, None
+
+    failures = []
+    pool = ThreadPool(jobs or default_jobs)
+    try:
+        for name, error in pool.imap_unordered(run, todo):
+            if error is not None:
+                print "Failed:", error
+                failures.append((name, error))
+    finally:
+        pool.close()
+        pool.join()
+    return failures
+
+
+def add_arguments(parser):
+    """Adds the options common to the download scripts to an ArgumentParser"""
+    parser.add_argument('-j', '--jobs', type=int, default=default_jobs, help='number of concurrent downloads (default: %d)' % (default_jobs,))
+    parser.add_argument('-c', '--checksums', help='file or URL of the SHA256 digests of the archives, as written by sha256sum')
+    parser.add_argument('-f', '--force', action='store_true', help='download the archives that were downloaded before')
+    parser.add_argument('--no-extract', dest='extract', action='store_false', help='save the .tgz archives instead of extracting them')
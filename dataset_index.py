@@ -0,0 +1,199 @@
+"""An index of the objects of the datasets, with precomputed metadata.
+
+The index is a JSON file (index_fn) built by scanning the dataset directories
+once.  For every object whose mesh exists and loads, it records
+- mesh: the resolved mesh file (the first loadable candidate of the object
+  set's file patterns, see main.object_geom_file_patterns)
+- triangles: the number of triangles of the mesh
+- bmin, bmax: the bounding box of the mesh
+- volume, com: the mass properties computed by mesh_compiler.mass_properties
+- mass, inertia: the mass estimated from the volume with density, and the
+  inertia about the com for that mass
+- sha1, size, mtime: the hash, size and modification time of the mesh file
+Objects without a loadable mesh are left out, so that main.objects only lists
+usable objects.  main.make_object loads the recorded mesh directly.
+
+Rescanning only rereads the meshes whose size or modification time changed.
+
+Usage: python dataset_index.py [-f] [object_set ...]
+"""
+
+import hashlib
+import json
+import os
+import time
+
+index_fn = 'data/objects/index.json'
+version = 1
+#density used to estimate the object masses, in kg/m^3, and the range of the
+#estimated masses, in kg
+density = 500.0
+min_mass = 0.02
+max_mass = 2.0
+
+_index = None
+
+def file_hash(fn,block_size=1024*1024):
+	"""Returns the SHA1 hex digest of the contents of fn"""
+	h = hashlib.sha1()
+	f = open(fn,'rb')
+	try:
+		while True:
+			block = f.read(block_size)
+			if not block:
+				break
+			h.update(block)
+	finally:
+		f.close()
+	return h.hexdigest()
+
+def estimate_mass(volume):
+	return min(max(density*volume,min_mass),max_mass)
+
+def mesh_entry(fn):
+	"""Returns the index entry of the mesh file fn.  Raises IOError if the mesh
+	does not load."""
+	import mesh_compiler
+	mtime,size = mesh_compiler.source_stamp(fn)
+	cmesh = mesh_compiler.load_mesh(fn)
+	if cmesh is not None:
+		ntris = len(cmesh.triangles)
+		bmin,bmax = cmesh.bmin,cmesh.bmax
+		volume,com,inertia = cmesh.volume,cmesh.com,cmesh.inertia
+	else:
+		vertices,triangles = mesh_compiler.read_mesh(fn)
+		if len(triangles) == 0:
+			raise IOError("Mesh %s has no triangles"%(fn,))
+		ntris = len(triangles)
+		bmin,bmax = vertices.min(axis=0).tolist(),vertices.max(axis=0).tolist()
+		volume,com,inertia = mesh_compiler.mass_properties(vertices,triangles)
+		com = com.tolist()
+	mass = estimate_mass(volume)
+	return {'mesh':fn,
+			'triangles':ntris,
+			'bmin':list(bmin),
+			'bmax':list(bmax),
+			'volume':float(volume),
+			'com':list(com),
+			'mass':mass,
+			'inertia':(inertia*mass).tolist(),
+			'sha1':file_hash(fn),
+			'size':size,
+			'mtime':mtime}
+
+def is_current(entry):
+	"""Returns True if the mesh file of entry is unchanged since it was indexed"""
+	try:
+		st = os.stat(entry['mesh'])
+	except OSError:
+		return False
+	return st.st_size == entry['size'] and st.st_mtime == entry['mtime']
+
+def scan(object_sets,patterns,previous=None,force=False):
+	"""Scans the directories data/objects/<object set> and returns the index of
+	their objects, as a dict mapping each object set to a dict of object
+	entries.  patterns maps each object set to the candidate mesh file
+	patterns of its objects.  The entries of previous (an index) whose meshes
+	are unchanged are reused unless force is True.  Also returns the list of
+	(object set,object name) that have no loadable mesh."""
+	previous = previous or {}
+	index = {}
+	missing = []
+	for object_set in object_sets:
+		entries = {}
+		old = previous.get(object_set,{})
+		for objectname in sorted(os.listdir(os.path.join('data/objects',object_set))):
+			entry = old.get(objectname)
+			if entry is not None and not force and is_current(entry):
+				entries[objectname] = entry
+				continue
+			for pattern in patterns[object_set]:
+				fn = pattern%(objectname,)
+				if not os.path.exists(fn):
+					continue
+				try:
+					entries[objectname] = mesh_entry(fn)
+					break
+				except IOError as e:
+					print e
+			else:
+				missing.append((object_set,objectname))
+		index[object_set] = entries
+	return index,missing
+
+def save(index,fn=None):
+	"""Writes the index (as returned by scan) to fn (default: index_fn)"""
+	global _index
+	fn = fn or index_fn
+	tmp = '%s.%d.tmp'%(fn,os.getpid())
+	f = open(tmp,'w')
+	json.dump({'version':version,'time':time.time(),'object_sets':index},f,indent=1,sort_keys=True)
+	f.close()
+	os.rename(tmp,fn)
+	_index = None
+
+def _str_keys(d):
+	#json returns unicode strings, which Klamp't does not take as names
+	return dict((str(k),str(v) if isinstance(v,unicode) else v) for k,v in d.iteritems())
+
+def read(fn=None):
+	"""Returns the index stored in fn (default: index_fn), or None if there is
+	no valid index"""
+	try:
+		f = open(fn or index_fn,'r')
+	except IOError:
+		return None
+	try:
+		data = json.load(f,object_hook=_str_keys)
+	except ValueError:
+		return None
+	finally:
+		f.close()
+	if data.get('version') != version:
+		return None
+	return data['object_sets']
+
+def load():
+	"""Returns the index stored in index_fn, read once per process, or None if
+	the datasets have not been scanned"""
+	global _index
+	if _index is None:
+		_index = read() or {}
+	return _index or None
+
+def get(object_set,objectname):
+	"""Returns the index entry of an object, or None if it is not indexed"""
+	index = load()
+	if index is None:
+		return None
+	return index.get(object_set,{}).get(objectname)
+
+def object_names(object_set):
+	"""Returns the sorted names of the indexed objects of object_set, or if the
+	datasets have not been scanned, of all the entries of its directory"""
+	index = load()
+	if index is not None:
+		return sorted(index.get(object_set,{}).keys())
+	return sorted(os.listdir(os.path.join('data/objects',object_set)))
+
+if __name__ == '__main__':
+	import argparse
+	import main
+	parser = argparse.ArgumentParser(description='Builds the index of the object datasets')
+	parser.add_argument('object_sets',nargs='*',help='object sets to scan (default: all)')
+	parser.add_argument('-f','--force',action='store_true',help='reread the meshes that are already indexed')
+	args = parser.parse_args()
+	object_sets = args.object_sets or main.objects.keys()
+	previous = read() or {}
+	object_sets = [s for s in object_sets if os.path.isdir(os.path.join('data/objects',s))]
+	index,missing = scan(object_sets,main.object_geom_file_patterns,previous,args.force)
+	#keep the object sets that were not rescanned
+	for s,entries in previous.iteritems():
+		if s not in index:
+			index[s] = entries
+	save(index)
+	for s in object_sets:
+		print "%s: %d objects"%(s,len(index[s]))
+	for (s,name) in missing:
+		print "No loadable mesh for %s/%s"%(s,name)
+	print "Wrote",index_fn
@@ -0,0 +1,144 @@
+"""Produces reduced-resolution (LOD) collision meshes for the object datasets.
+
+Each tier is a vertex-clustering decimation of the source mesh with at most a
+given number of triangles, stored in the mesh_compiler format as
+source + '.lod<budget>.cmesh'.  make_object loads a tier when given its budget
+as the lod argument (or via main.object_lod).
+
+The approximate Hausdorff distance between each tier and its source is
+reported: it is measured between fixed-size samples of the vertices and
+triangle centroids of both meshes, so that it runs in bounded memory for any
+source mesh.  It is adequate for comparing tiers but is not an exact bound.
+
+Usage: python decimate.py [-b budget ...] [mesh files...]
+If no files are given, all the dataset meshes are processed.
+"""
+
+import numpy as np
+import argparse
+import glob
+import os
+import mesh_compiler
+
+#triangle budgets of the default tiers
+default_budgets = [20000,5000,1000]
+
+#meshes decimated by default
+default_patterns = ['data/objects/ycb/*/meshes/tsdf_mesh.stl',
+					'data/objects/ycb/*/meshes/poisson_mesh.stl',
+					'data/objects/apc2015/*/textured_meshes/optimized_tsdf_textured_mesh.ply']
+
+def lod_path(fn,budget):
+	"""Returns the file name of the tier of fn with the given triangle budget"""
+	return '%s.lod%d%s'%(fn,budget,mesh_compiler.compiled_extension)
+
+def cluster(vertices,triangles,cell):
+	"""Vertex clustering: merges all vertices within each cubic cell of size cell
+	into their mean, and removes the triangles that become degenerate or
+	duplicated.  Returns the new (vertices,triangles)."""
+	bmin = vertices.min(axis=0)
+	idx = np.floor((vertices-bmin)/cell).astype(np.int64)
+	dims = idx.max(axis=0)+1
+	keys = idx[:,0] + dims[0]*(idx[:,1] + dims[1]*idx[:,2])
+	ukeys,inverse = np.unique(keys,return_inverse=True)
+	counts = np.bincount(inverse).astype(np.float64)
+	newverts = np.empty((len(ukeys),3))
+	for i in range(3):
+		newverts[:,i] = np.bincount(inverse,weights=vertices[:,i])/counts
+	tris = inverse[triangles]
+	keep = (tris[:,0] != tris[:,1]) & (tris[:,1] != tris[:,2]) & (tris[:,0] != tris[:,2])
+	tris = tris[keep]
+	if len(tris) == 0:
+		return np.zeros((0,3)),np.zeros((0,3),dtype=np.int32)
+	#remove duplicate triangles regardless of winding, keeping the first
+	_,first = np.unique(np.sort(tris,axis=1),axis=0,return_index=True)
+	tris = tris[np.sort(first)]
+	#drop unreferenced vertices
+	used,tris = np.unique(tris,return_inverse=True)
+	return newverts[used],tris.reshape((-1,3)).astype(np.int32)
+
+def decimate(vertices,triangles,budget,iters=20):
+	"""Returns the finest vertex clustering of the mesh with at most budget
+	triangles, found by bisection on the cell size."""
+	if len(triangles) <= budget:
+		return vertices,triangles
+	lo = 0.0
+	hi = np.linalg.norm(vertices.max(axis=0)-vertices.min(axis=0))
+	best = cluster(vertices,triangles,hi)
+	for it in xrange(iters):
+		mid = 0.5*(lo+hi)
+		res = cluster(vertices,triangles,mid)
+		if len(res[1]) <= budget:
+			hi = mid
+			best = res
+		else:
+			lo = mid
+	return best
+
+def sample_points(vertices,triangles,n):
+	"""Returns up to n points of the mesh, drawn from its vertices and triangle
+	centroids.  Only the centroids of the sampled triangles are computed."""
+	nv = len(vertices)
+	total = nv + len(triangles)
+	if total > n:
+		idx = np.sort(np.random.RandomState(0).choice(total,n,replace=False))
+	else:
+		idx = np.arange(total)
+	tris = triangles[idx[idx >= nv]-nv]
+	return np.vstack((vertices[idx[idx < nv]],vertices[tris].mean(axis=1)))
+
+def nearest_distances(a,b,max_block=1<<22):
+	"""Returns the distance from each point in a to its nearest point in b.  The
+	distances are computed by blocks of at most max_block point pairs."""
+	res = np.empty(len(a))
+	bb = (b**2).sum(axis=1)
+	chunk = max(1,max_block//max(len(b),1))
+	for i in xrange(0,len(a),chunk):
+		ac = a[i:i+chunk]
+		d2 = (ac**2).sum(axis=1)[:,np.newaxis] - 2*ac.dot(b.T) + bb[np.newaxis,:]
+		res[i:i+chunk] = np.sqrt(np.maximum(d2.min(axis=1),0))
+	return res
+
+def hausdorff(mesh1,mesh2,n=5000,m=50000):
+	"""Approximates the symmetric Hausdorff distance between two (vertices,triangles)
+	meshes, querying n sample points of each mesh against m sample points of the
+	other, so that the cost does not depend on the size of the meshes"""
+	p1 = sample_points(mesh1[0],mesh1[1],m)
+	p2 = sample_points(mesh2[0],mesh2[1],m)
+	q1 = sample_points(mesh1[0],mesh1[1],n)
+	q2 = sample_points(mesh2[0],mesh2[1],n)
+	return max(nearest_distances(q1,p2).max(),nearest_distances(q2,p1).max())
+
+def make_tiers(fn,budgets,force=False):
+	"""Writes the tiers of the mesh file fn for the given triangle budgets.
+	Returns a list of (budget,# of triangles,Hausdorff error) for the tiers that
+	were written; tiers that are up to date are skipped unless force is True."""
+	todo = [b for b in budgets if force or not mesh_compiler.is_up_to_date(fn,lod_path(fn,b))]
+	if len(todo) == 0:
+		return []
+	stamp = mesh_compiler.source_stamp(fn)
+	vertices,triangles = mesh_compiler.read_mesh(fn)
+	res = []
+	for b in todo:
+		v,t = decimate(vertices,triangles,b)
+		mesh_compiler.write_compiled(fn,v,t,stamp,lod_path(fn,b))
+		res.append((b,len(t),hausdorff((vertices,triangles),(v,t))))
+	return res
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Makes decimated collision mesh tiers')
+	parser.add_argument('files',nargs='*',help='mesh files (default: all dataset meshes)')
+	parser.add_argument('-b','--budget',type=int,action='append',help='triangle budget of a tier (default: %s)'%(' '.join(str(b) for b in default_budgets),))
+	parser.add_argument('-f','--force',action='store_true',help='remake tiers that are up to date')
+	args = parser.parse_args()
+	files = args.files
+	if len(files) == 0:
+		files = sorted(sum([glob.glob(p) for p in default_patterns],[]))
+	for fn in files:
+		try:
+			tiers = make_tiers(fn,args.budget or default_budgets,args.force)
+		except IOError as e:
+			print e
+			continue
+		for (b,nt,err) in tiers:
+			print "%s: budget %d, %d triangles, Hausdorff error %.4f"%(fn,b,nt,err)
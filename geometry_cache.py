@@ -0,0 +1,114 @@
+"""A process-level cache of loaded object geometries.
+
+Parsing the large YCB / APC2015 meshes dominates world construction, so
+make_object keeps a copy of every object it loads and clones it into later
+worlds instead of reloading it from disk.
+"""
+
+from klampt import *
+import collections
+import os
+
+def geometry_bytes(geom):
+	"""Returns an approximate in-memory size of the Geometry3D geom, in bytes"""
+	if geom.type() == 'TriangleMesh':
+		m = geom.getTriangleMesh()
+		return len(m.vertices)*8 + len(m.indices)*4
+	elif geom.type() == 'PointCloud':
+		pc = geom.getPointCloud()
+		return len(pc.vertices)*8 + len(pc.properties)*8
+	elif geom.type() == 'Group':
+		return sum(geometry_bytes(geom.getElement(i)) for i in xrange(geom.numElements()))
+	return 0
+
+contact_parameter_names = ['kFriction','kRestitution','kStiffness','kDamping']
+
+def set_contact_parameters(obj,params):
+	"""Sets the contact parameters of the RigidObjectModel obj from the dict
+	params, whose keys are a subset of contact_parameter_names"""
+	cp = obj.getContactParameters()
+	for k,v in params.iteritems():
+		setattr(cp,k,v)
+	obj.setContactParameters(cp)
+
+class CacheEntry:
+	"""The data needed to recreate a loaded rigid object: its geometry, mass,
+	contact parameters (a dict of contact_parameter_names values) and the mesh
+	file they came from."""
+	def __init__(self,fn,geometry,mass,contactParameters):
+		self.fn = fn
+		self.geometry = geometry
+		self.mass = mass
+		self.contactParameters = contactParameters
+		self.nbytes = geometry_bytes(geometry)
+
+class GeometryCache:
+	"""An LRU cache of CacheEntry's keyed by (object set, object name, mesh file
+	mtime), holding at most max_bytes of geometry.  Editing a mesh file on disk
+	invalidates its entry.
+
+	Also remembers which of several candidate mesh files is the one that loads
+	for each object, so that failing candidates are only tried once.
+	"""
+	def __init__(self,max_bytes):
+		self.max_bytes = max_bytes
+		self.nbytes = 0
+		self.entries = collections.OrderedDict()
+		self.resolved = dict()
+
+	def resolve(self,object_set,objectname,candidates):
+		"""Returns the candidate files for the object, with the one that is known
+		to load (if any) first and candidates that do not exist removed."""
+		fn = self.resolved.get((object_set,objectname),None)
+		if fn is not None:
+			return [fn]
+		return [c for c in candidates if os.path.exists(c)]
+
+	def get(self,object_set,objectname):
+		"""Returns the cached CacheEntry for the object, or None if it is not
+		cached or its mesh file changed since it was cached."""
+		fn = self.resolved.get((object_set,objectname),None)
+		if fn is None:
+			return None
+		try:
+			key = (object_set,objectname,os.path.getmtime(fn))
+		except OSError:
+			return None
+		entry = self.entries.pop(key,None)
+		if entry is not None:
+			#move to the most recently used end
+			self.entries[key] = entry
+		return entry
+
+	def put(self,object_set,objectname,fn,obj):
+		"""Records that the object was loaded from fn into the RigidObjectModel
+		obj, and caches a copy of obj's geometry and properties.  Least recently
+		used entries are evicted to stay within max_bytes."""
+		self.resolved[(object_set,objectname)] = fn
+		key = (object_set,objectname,os.path.getmtime(fn))
+		params = obj.getContactParameters()
+		params = dict((k,getattr(params,k)) for k in contact_parameter_names)
+		entry = CacheEntry(fn,Geometry3D(obj.geometry()),obj.getMass(),params)
+		if key in self.entries:
+			self.nbytes -= self.entries.pop(key).nbytes
+		if entry.nbytes > self.max_bytes:
+			return
+		self.entries[key] = entry
+		self.nbytes += entry.nbytes
+		while self.nbytes > self.max_bytes:
+			k,e = self.entries.popitem(last=False)
+			self.nbytes -= e.nbytes
+
+	def make(self,world,objectname,entry):
+		"""Adds a new rigid object named objectname to world from the CacheEntry
+		entry, and returns it."""
+		obj = world.makeRigidObject(objectname)
+		obj.geometry().set(entry.geometry)
+		obj.setMass(entry.mass)
+		set_contact_parameters(obj,entry.contactParameters)
+		return obj
+
+	def clear(self):
+		self.entries.clear()
+		self.resolved.clear()
+		self.nbytes = 0
@@ -0,0 +1,196 @@
+"""Runs grasping trials without a visualization window.
+
+The worlds are built exactly as in main.launch_simple / launch_balls /
+launch_shelf, but the simulation is stepped as fast as possible for a fixed
+simulated duration and a trial result dictionary is returned instead of
+showing the GUI.
+
+Usage: python headless.py [dataset] [object] [robot]
+"""
+
+from klampt import *
+from klampt.math import so3,se3,vectorops
+from klampt.sim.simulation import SimpleSimulator
+from moving_base_control import *
+import main
+import telemetry
+from recorder import Recorder
+import os
+import sys
+import time
+
+#simulation step of the main.py visualization loops
+sim_dt = 0.01
+#control step handed to the controllers (the GLSimulationProgram default)
+control_dt = 0.02
+
+def load_initial_xform(robot,names):
+	"""Returns the first of the given resource names that exists on disk, loaded
+	as a hand transform.  If none exists, returns the current base transform of
+	robot.  Never launches an editor."""
+	from klampt.io import resource
+	for name in names:
+		if os.path.exists(os.path.join(resource.getDirectory(),name)):
+			return resource.get(name,doedit=False)
+	return robot.link(5).getTransform()
+
+def make_recorder(record,sim,hand,info):
+	"""Returns a Recorder into the directory record, or None if record is None.
+	info describes how to rebuild the world (see replay.make_world)."""
+	if not record:
+		return None
+	info = dict(info)
+	info['control_dt'] = control_dt
+	return Recorder(record,sim,hand,state_period=main.record_state_period,info=info)
+
+def simulate_trial(sim,robot,objects,duration,recorder=None):
+	"""Steps sim for duration seconds of simulated time and returns a trial
+	result dictionary describing what happened to the given rigid objects.
+	If recorder (a recorder.Recorder) is given, every step is recorded.
+
+	The result contains:
+	- sim_time, steps, wall_time: simulated time, # of sim.simulate calls, and
+	  elapsed wall clock time (in s)
+	- status: the worst simulation status string encountered
+	- objects: a list of dicts with the name, initial / final transform and lift
+	  height of each object
+	- lift_height: the maximum lift height over all objects
+	- contact_steps: # of steps in which the hand touched any of the objects
+	- max_contact_links, final_contact_links: max / final # of hand links in
+	  contact with the objects
+	"""
+	world = sim.world
+	#links 0-5 are the virtual moving base
+	hand_links = [robot.link(l).getID() for l in range(6,robot.numLinks())]
+	object_ids = [o.getID() for o in objects]
+	initial = [o.getTransform() for o in objects]
+	contact_steps = 0
+	max_contact_links = 0
+	contact_links = 0
+	worst_status = sim.getStatus()
+	steps = 0
+	if recorder: recorder.record()
+	t0 = time.time()
+	while sim.getTime() < duration:
+		sim.simulate(sim_dt)
+		steps += 1
+		if recorder: recorder.record()
+		worst_status = max(worst_status,sim.getStatus())
+		contact_links = 0
+		for l in hand_links:
+			for o in object_ids:
+				if sim.hadContact(l,o):
+					contact_links += 1
+					break
+		if contact_links > 0:
+			contact_steps += 1
+		max_contact_links = max(max_contact_links,contact_links)
+	wall_time = time.time()-t0
+	if recorder: recorder.close()
+	sim.updateWorld()
+	results = []
+	for o,T0 in zip(objects,initial):
+		T = o.getTransform()
+		results.append({'name':o.getName(),
+						'initial_transform':T0,
+						'final_transform':T,
+						'lift_height':T[1][2]-T0[1][2]})
+	return {'sim_time':sim.getTime(),
+			'steps':steps,
+			'wall_time':wall_time,
+			'status':sim.getStatusString(worst_status),
+			'objects':results,
+			'lift_height':max([r['lift_height'] for r in results]) if results else 0.0,
+			'contact_steps':contact_steps,
+			'max_contact_links':max_contact_links,
+			'final_contact_links':contact_links}
+
+def run_simple(robotname,object_set,objectname,duration=3.0,use_box=False,xform=None,lod=None,log=False,record=None):
+	"""Headless version of main.launch_simple.  The initial hand transform is
+	xform if given, otherwise the stored resource for this robot / object (or the
+	dataset default).  lod is the collision mesh tier passed to main.make_object.
+	Controller telemetry is turned off unless log is True.  If record is given,
+	the trial is recorded into that directory (see recorder.py).
+	Returns the trial result of simulate_trial, with the robot, object_set and
+	object names added."""
+	telemetry.configure(enabled=log)
+	world,robot,object = main.make_simple_world(robotname,object_set,objectname,use_box,lod)
+	if xform is None:
+		xform = load_initial_xform(robot,["%s/initial_%s_%s.xform"%(object_set,robotname,objectname),
+										  "%s/default_initial_%s.xform"%(object_set,robotname)])
+	set_moving_base_xform(robot,xform[0],xform[1])
+	sim = SimpleSimulator(world)
+	import simple_controller
+	hand = main.setup_simulation(sim,robotname,simple_controller,control_dt)
+	recorder = make_recorder(record,sim,hand,{'world':'simple','args':[robotname,object_set,objectname,use_box,lod],'controller':'simple_controller'})
+	res = simulate_trial(sim,robot,[object],duration,recorder)
+	res.update({'robot':robotname,'object_set':object_set,'object':objectname})
+	return res
+
+def run_balls(robotname,num_balls=10,duration=4.0,xform=None,log=False,record=None,seed=None):
+	"""Headless version of main.launch_balls.  Controller telemetry is turned
+	off unless log is True.  If record is given, the trial is recorded into that
+	directory.  seed makes the balls layout reproducible (see main.make_balls_world).
+	Returns the trial result of simulate_trial over all the balls."""
+	telemetry.configure(enabled=log)
+	world,robot = main.make_balls_world(robotname,num_balls,seed)
+	if xform is None:
+		xform = load_initial_xform(robot,["balls/default_initial_%s.xform"%(robotname,)])
+	set_moving_base_xform(robot,xform[0],xform[1])
+	sim = SimpleSimulator(world)
+	import balls_controller
+	hand = main.setup_simulation(sim,robotname,balls_controller,control_dt)
+	recorder = make_recorder(record,sim,hand,{'world':'balls','args':[robotname,num_balls,seed],'controller':'balls_controller'})
+	res = simulate_trial(sim,robot,[world.rigidObject(i) for i in range(world.numRigidObjects())],duration,recorder)
+	res.update({'robot':robotname,'object_set':'balls','object':str(num_balls)})
+	return res
+
+def run_shelf(robotname,objects,duration=3.0,xform=None,lod=None,log=False,record=None,seed=None):
+	"""Headless version of main.launch_shelf, for a list of (objectset,objectname)
+	pairs.  Objects that could not be packed are removed as in main.xy_jiggle.
+	lod is the collision mesh tier passed to main.make_object.  Controller
+	telemetry is turned off unless log is True.  If record is given, the trial is
+	recorded into that directory.  seed makes the packing reproducible and cached
+	(see main.make_shelf_world).
+	Returns the trial result of simulate_trial over the shelved objects."""
+	telemetry.configure(enabled=log)
+	world,robot,shelf = main.make_shelf_world(robotname,objects,interactive=False,lod=lod,seed=seed)
+	if xform is None:
+		xform = load_initial_xform(robot,["shelf/default_initial_%s.xform"%(robotname,)])
+	set_moving_base_xform(robot,xform[0],xform[1])
+	sim = SimpleSimulator(world)
+	import shelf_controller
+	hand = main.setup_simulation(sim,robotname,shelf_controller,control_dt)
+	recorder = make_recorder(record,sim,hand,{'world':'shelf','args':[robotname,objects,lod,seed],'controller':'shelf_controller'})
+	res = simulate_trial(sim,robot,[world.rigidObject(i) for i in range(world.numRigidObjects())],duration,recorder)
+	res.update({'robot':robotname,'object_set':'shelf','object':' '.join('%s/%s'%o for o in objects)})
+	return res
+
+if __name__ == '__main__':
+	import random
+	try:
+		dataset = sys.argv[1]
+	except IndexError:
+		dataset = random.choice(main.objects.keys())
+	try:
+		robot = sys.argv[3]
+	except IndexError:
+		robot = "soft_hand"
+	if dataset == 'balls':
+		try:
+			numballs = int(sys.argv[2])
+		except IndexError:
+			numballs = 10
+		res = run_balls(robot,numballs)
+	else:
+		try:
+			index = int(sys.argv[2])
+			objname = main.objects[dataset][index]
+		except IndexError:
+			index = random.randint(0,len(main.objects[dataset])-1)
+			objname = main.objects[dataset][index]
+		except ValueError:
+			objname = sys.argv[2]
+		res = run_simple(robot,dataset,objname)
+	for k in sorted(res.keys()):
+		print k,":",res[k]
@@ -1,34 +1,64 @@
-import pkg_resources
-pkg_resources.require("klampt>=0.7.0")
 from klampt import *
 #Klampt v0.6.x
 #from klampt import visualization as vis
 #from klampt import resource
-#from klampt import robotcollide as collide
 #from klampt.simulation import *
 #from klampt.glrobotprogram import *
 #Klampt v0.7.x
-from klampt import vis 
-from klampt.vis.glrobotprogram import *
 from klampt.math import *
-from klampt.model import collide
-from klampt.io import resource
 from klampt.sim import *
 from moving_base_control import *
+from geometry_cache import GeometryCache,contact_parameter_names,set_contact_parameters
+from packing import xy_randomize,xy_jiggle
+import scene_cache
+import dataset_index
+import profiling
+import mesh_compiler
+import decimate
+import telemetry
+from recorder import Recorder
 import importlib
 import os
 import time
 import sys
+import math
+import random
+import tempfile
+import shutil
+import UserDict
+import multiprocessing.util
 
 box_dims = (0.5,0.5,0.3)
 shelf_dims = (0.4,0.4,0.3)
 shelf_offset = 0.6
 shelf_height = 0.7
 moving_base_template_fn = 'data/robots/moving_base_template.rob'
+moving_base_geometry_fn = 'data/objects/cube.tri'
 object_template_fn = 'data/objects/object_template.obj'
-objects = {}
-objects['ycb'] = [f for f in os.listdir('data/objects/ycb')]
-objects['apc2015'] = [f for f in os.listdir('data/objects/apc2015')]
+
+class ObjectListing(UserDict.DictMixin):
+	"""Maps each object set to the names of its objects.  They are read from
+	the dataset index (see dataset_index.py) the first time they are accessed,
+	or if the datasets have not been indexed, listed from the object set's
+	directory in data/objects."""
+	def __init__(self,object_sets):
+		self.object_sets = object_sets
+		self.listed = dict()
+
+	def keys(self):
+		return list(self.object_sets)
+
+	def __contains__(self,object_set):
+		return object_set in self.object_sets
+
+	def __getitem__(self,object_set):
+		if object_set not in self.listed:
+			if object_set not in self.object_sets:
+				raise KeyError(object_set)
+			self.listed[object_set] = dataset_index.object_names(object_set)
+		return self.listed[object_set]
+
+objects = ObjectListing(['ycb','apc2015'])
 robots = ['reflex_col', 'soft_hand', 'reflex']
 
 object_geom_file_patterns = {
@@ -37,10 +67,22 @@ object_geom_file_patterns = {
 }
 #default mass for objects whose masses are not specified, in kg
 default_object_mass = 0.5
+#masses of specific objects, by object set and object name, in kg
 object_masses = {
 	'ycb':dict(),
 	'apc2015':dict(),
 }
+#if True, objects whose masses are not specified get the mass estimated from
+#their volume in the dataset index instead of default_object_mass
+use_estimated_masses = False
+#triangle budget of the decimated collision mesh tier used by make_object, or None
+#for the full resolution meshes (tiers are made with decimate.py)
+object_lod = None
+#maximum size of the loaded object geometries kept in memory by make_object, in bytes
+object_cache_bytes = 1024*1024*1024
+object_cache = GeometryCache(object_cache_bytes)
+#steps between the simulator state snapshots of recorded runs (see replay.py)
+record_state_period = 100
 robot_files = {
 	'reflex_col':'data/robots/reflex_col.rob',
 	'soft_hand':'data/robots/soft_hand.urdf',
@@ -58,33 +100,159 @@ def mkdir_p(path):
 			pass
 		else: raise
 
-def make_object(object_set,objectname,world):
-	"""Adds an object to the world using its geometry / mass properties
-	and places it in a default location (x,y)=(0,0) and resting on plane."""
-	for pattern in object_geom_file_patterns[object_set]:
-		objfile = pattern%(objectname,)
-		objmass = object_masses[object_set].get('mass',default_object_mass)
-		f = open(object_template_fn,'r')
-		pattern = ''.join(f.readlines())
+_templates = {}
+_scratch_dir = None
+_scratch_pid = None
+_scratch_files = {}
+
+def load_gui():
+	"""Imports the visualization modules used by the launch_* functions.  They
+	load OpenGL, so they are not imported by headless runs."""
+	global vis,resource,GLSimulationProgram
+	import pkg_resources
+	pkg_resources.require("klampt>=0.7.0")
+	from klampt import vis
+	from klampt.io import resource
+	from klampt.vis.glrobotprogram import GLSimulationProgram
+
+def read_template(fn):
+	"""Returns the text of the template file fn.  Each template is read from
+	disk only once per process."""
+	if fn not in _templates:
+		f = open(fn,'r')
+		_templates[fn] = ''.join(f.readlines())
 		f.close()
-		f2 = open("temp.obj",'w')
-		f2.write(pattern % (objfile,objmass))
-		f2.close()
-		nobjs = world.numRigidObjects()
-		if world.loadElement('temp.obj') < 0 :
-			continue
-		assert nobjs < world.numRigidObjects(),"Hmm... the object didn't load, but loadElement didn't return -1?"
-		obj = world.rigidObject(world.numRigidObjects()-1)
-		obj.setTransform(*se3.identity())
-		bmin,bmax = obj.geometry().getBB()
-		T = obj.getTransform()
-		spacing = 0.005
-		T = (T[0],vectorops.add(T[1],(-(bmin[0]+bmax[0])*0.5,-(bmin[1]+bmax[1])*0.5,-bmin[2]+spacing)))
-		obj.setTransform(*T)
-		obj.appearance().setColor(0.2,0.5,0.7,1.0)
-		obj.setName(objectname)
-		return obj
-	raise RuntimeError("Unable to load object name %s from set %s"%(objectname,object_set))
+	return _templates[fn]
+
+def scratch_file(name,text):
+	"""Returns the path of a file with the given base name and contents in a
+	scratch directory private to this process, writing it only on the first
+	request.  Concurrent processes never share scratch files, and the directory
+	is removed when the process (or multiprocessing worker) exits.
+
+	Paths inside text must be absolute, since Klamp't resolves relative paths
+	relative to the loaded file."""
+	global _scratch_dir,_scratch_pid,_scratch_files
+	if _scratch_pid != os.getpid():
+		#first call in this process, or in a child forked after the parent made its own
+		_scratch_dir = tempfile.mkdtemp(prefix='iros2016_%d_'%(os.getpid(),))
+		_scratch_pid = os.getpid()
+		_scratch_files = {}
+		#Finalize with an exitpriority also runs on multiprocessing worker exit, unlike atexit
+		multiprocessing.util.Finalize(None,shutil.rmtree,args=(_scratch_dir,),kwargs={'ignore_errors':True},exitpriority=0)
+	key = (name,text)
+	if key not in _scratch_files:
+		path = os.path.join(tempfile.mkdtemp(dir=_scratch_dir),name)
+		f = open(path,'w')
+		f.write(text)
+		f.close()
+		_scratch_files[key] = path
+	return _scratch_files[key]
+
+def template_contact_parameters(text):
+	"""Returns a dict of the contact parameters (kFriction, kStiffness, etc.)
+	given in the text of a rigid object file"""
+	params = dict()
+	for line in text.split('\n'):
+		items = line.split()
+		if len(items) == 2 and items[0] in contact_parameter_names:
+			params[items[0]] = float(items[1])
+	return params
+
+def make_compiled_object(world,objectname,cmesh,objmass):
+	"""Adds a rigid object to the world from the mesh_compiler.CompiledMesh
+	cmesh with mass objmass, and the contact parameters of the object template.
+	The mass properties are those precomputed by the mesh compiler."""
+	obj = world.makeRigidObject(objectname)
+	obj.geometry().set(cmesh.geometry())
+	obj.setMass(cmesh.mass(objmass))
+	set_contact_parameters(obj,template_contact_parameters(read_template(object_template_fn)))
+	return obj
+
+def object_mass(object_set,objectname):
+	"""Returns the mass of an object, in kg"""
+	mass = object_masses.get(object_set,{}).get(objectname)
+	if mass is not None:
+		return mass
+	if use_estimated_masses:
+		entry = dataset_index.get(object_set,objectname)
+		if entry is not None:
+			return entry['mass']
+	return default_object_mass
+
+def object_mesh_candidates(object_set,objectname):
+	"""Returns the mesh files tried in turn to load an object: the one recorded
+	in the dataset index, or the object set's file patterns"""
+	indexed = dataset_index.get(object_set,objectname)
+	if indexed is not None:
+		return [indexed['mesh']]
+	return [pattern%(objectname,) for pattern in object_geom_file_patterns[object_set]]
+
+def object_mesh_stamp(object_set,objectname,lod=None):
+	"""Returns the mesh file that make_object loads the object from, with its
+	modification time and size, followed by the budget, modification time and
+	size of the decimated tier if it is used.  Returns None if no mesh file
+	exists."""
+	if lod is None:
+		lod = object_lod
+	cachename = objectname if lod is None else '%s@lod%d'%(objectname,lod)
+	for objfile in object_cache.resolve(object_set,cachename,object_mesh_candidates(object_set,objectname)):
+		stamp = [objfile] + list(mesh_compiler.source_stamp(objfile))
+		if lod is not None and mesh_compiler.is_up_to_date(objfile,decimate.lod_path(objfile,lod)):
+			stamp += [lod] + list(mesh_compiler.source_stamp(decimate.lod_path(objfile,lod)))
+		return stamp
+	return None
+
+def make_object(object_set,objectname,world,lod=None):
+	"""Adds an object to the world using its geometry / mass properties
+	and places it in a default location (x,y)=(0,0) and resting on plane.
+
+	The mesh is the one recorded in the dataset index if the object is
+	indexed; otherwise the object set's file patterns are tried in turn.
+	Objects that were loaded before in this process are copied from
+	object_cache rather than reloaded from disk.  Meshes with an up-to-date
+	compiled version (see mesh_compiler.py) are loaded from it.
+
+	lod is the triangle budget of the decimated mesh tier to use (default:
+	object_lod).  If that tier has not been made for the object, the full
+	resolution mesh is used."""
+	if lod is None:
+		lod = object_lod
+	cachename = objectname if lod is None else '%s@lod%d'%(objectname,lod)
+	obj = None
+	entry = object_cache.get(object_set,cachename)
+	if entry is not None:
+		obj = object_cache.make(world,objectname,entry)
+	else:
+		objmass = object_mass(object_set,objectname)
+		for objfile in object_cache.resolve(object_set,cachename,object_mesh_candidates(object_set,objectname)):
+			cmesh = None
+			if lod is not None and mesh_compiler.is_up_to_date(objfile,decimate.lod_path(objfile,lod)):
+				cmesh = mesh_compiler.load_compiled(decimate.lod_path(objfile,lod))
+			if cmesh is None:
+				cmesh = mesh_compiler.load_mesh(objfile)
+			if cmesh is not None:
+				obj = make_compiled_object(world,objectname,cmesh,objmass)
+			else:
+				fn = scratch_file("temp.obj",read_template(object_template_fn) % (os.path.abspath(objfile),objmass))
+				nobjs = world.numRigidObjects()
+				if world.loadElement(fn) < 0 :
+					continue
+				assert nobjs < world.numRigidObjects(),"Hmm... the object didn't load, but loadElement didn't return -1?"
+				obj = world.rigidObject(world.numRigidObjects()-1)
+			object_cache.put(object_set,cachename,objfile,obj)
+			break
+	if obj is None:
+		raise RuntimeError("Unable to load object name %s from set %s"%(objectname,object_set))
+	obj.setTransform(*se3.identity())
+	bmin,bmax = obj.geometry().getBB()
+	T = obj.getTransform()
+	spacing = 0.005
+	T = (T[0],vectorops.add(T[1],(-(bmin[0]+bmax[0])*0.5,-(bmin[1]+bmax[1])*0.5,-bmin[2]+spacing)))
+	obj.setTransform(*T)
+	obj.appearance().setColor(0.2,0.5,0.7,1.0)
+	obj.setName(objectname)
+	return obj
 
 def make_box(world,width,depth,height,wall_thickness=0.005,mass=float('inf')):
 	"""Makes a new axis-aligned box centered at the origin with
@@ -170,34 +338,80 @@ def make_moving_base_robot(robotname,world):
 	"""Converts the given fixed-base robot into a moving base robot
 	and loads it into the given world.
 	"""
-	f = open(moving_base_template_fn,'r')
-	pattern = ''.join(f.readlines())
-	f.close()
-	f2 = open("temp.rob",'w')
-	f2.write(pattern 
-		% (robot_files[robotname],robotname))
-	f2.close()
-	world.loadElement("temp.rob")
+	#the file must be called temp.rob: the plugins accept the robot name "temp"
+	fn = scratch_file("temp.rob",read_template(moving_base_template_fn) 
+		% (os.path.abspath(moving_base_geometry_fn),os.path.abspath(robot_files[robotname]),robotname))
+	world.loadElement(fn)
 	return world.robot(world.numRobots()-1)
 
 
 
-def launch_simple(robotname,object_set,objectname,use_box=False):
-	"""Launches a very simple program that simulates a robot grasping an object from one of the
-	databases. It first allows a user to position the robot's free-floating base in a GUI. 
-	Then, it sets up a simulation with those initial conditions, and launches a visualization.
-	The controller closes the hand, and then lifts the hand upward.  The output of the robot's
-	tactile sensors are printed to the console.
+def make_simple_world(robotname,object_set,objectname,use_box=False,lod=None):
+	"""Builds the world used by launch_simple: a plane, the moving base robot
+	and the test object.  Returns (world,robot,object).
 
 	If use_box is True, then the test object is placed inside a box.
+	lod is the collision mesh tier passed to make_object.
 	"""
 	world = WorldModel()
 	world.loadElement("data/terrains/plane.env")
 	robot = make_moving_base_robot(robotname,world)
-	object = make_object(object_set,objectname,world)
+	object = make_object(object_set,objectname,world,lod)
 	if use_box:
 		box = make_box(world,*box_dims)
 		object.setTransform(*se3.mul((so3.identity(),[0,0,0.01]),object.getTransform()))
+	return world,robot,object
+
+def setup_simulation(sim,robotname,controller_module,dt,visPreshrink=True):
+	"""Attaches the hand emulator for robotname and the controller returned by
+	controller_module.make(sim,hand,dt) to robot 0 of the given simulator, and
+	latches the robot's current configuration in the PID controller.
+	Returns the hand emulator.
+
+	If profiling is on (see profiling.py), the simulator, emulator and
+	controller calls are timed.
+
+	visPreshrink: turn this to true if you want to see the "shrunken" models
+	used for collision detection
+	"""
+	world = sim.world
+	robot = world.robot(0)
+	#setup some simulation parameters
+	for l in range(robot.numLinks()):
+		sim.body(robot.link(l)).setCollisionPreshrink(visPreshrink)
+	for l in range(world.numRigidObjects()):
+		sim.body(world.rigidObject(l)).setCollisionPreshrink(visPreshrink)
+
+	#create a hand emulator from the given robot name
+	module = importlib.import_module('plugins.'+robotname)
+	#emulator takes the robot index (0), start link index (6), and start driver index (6)
+	hand = module.HandEmulator(sim,0,6,6)
+	sim.addEmulator(0,hand)
+
+	#the result of controller_module.make() is now attached to control the robot
+	controller = controller_module.make(sim,hand,dt)
+	if profiling.enabled():
+		controller = profiling.instrument(sim,hand,controller)
+	sim.setController(robot,controller)
+
+	#the next line latches the current configuration in the PID controller...
+	sim.controller(0).setPIDCommand(robot.getConfig(),robot.getVelocity())
+	return hand
+
+def launch_simple(robotname,object_set,objectname,use_box=False,log=True,record=None):
+	"""Launches a very simple program that simulates a robot grasping an object from one of the
+	databases. It first allows a user to position the robot's free-floating base in a GUI. 
+	Then, it sets up a simulation with those initial conditions, and launches a visualization.
+	The controller closes the hand, and then lifts the hand upward.  The output of the robot's
+	tactile sensors are logged to the console.
+
+	If use_box is True, then the test object is placed inside a box.
+	If log is False, controller telemetry is turned off.
+	If record is given, the run is recorded into that directory (see recorder.py).
+	"""
+	load_gui()
+	telemetry.configure(enabled=log)
+	world,robot,object = make_simple_world(robotname,object_set,objectname,use_box)
 	doedit = True
 	xform = resource.get("%s/default_initial_%s.xform"%(object_set,robotname),description="Initial hand transform",default=robot.link(5).getTransform(),world=world)
 	set_moving_base_xform(robot,xform[0],xform[1])
@@ -215,25 +429,9 @@ def launch_simple(robotname,object_set,objectname,use_box=False):
 	program = GLSimulationProgram(world)
 	sim = program.sim
 
-	#setup some simulation parameters
-	visPreshrink = True   #turn this to true if you want to see the "shrunken" models used for collision detection
-	for l in range(robot.numLinks()):
-		sim.body(robot.link(l)).setCollisionPreshrink(visPreshrink)
-	for l in range(world.numRigidObjects()):
-		sim.body(world.rigidObject(l)).setCollisionPreshrink(visPreshrink)
-
-	#create a hand emulator from the given robot name
-	module = importlib.import_module('plugins.'+robotname)
-	#emulator takes the robot index (0), start link index (6), and start driver index (6)
-	hand = module.HandEmulator(sim,0,6,6)
-	sim.addEmulator(0,hand)
-
 	#the result of simple_controller.make() is now attached to control the robot
 	import simple_controller
-	sim.setController(robot,simple_controller.make(sim,hand,program.dt))
-
-	#the next line latches the current configuration in the PID controller...
-	sim.controller(0).setPIDCommand(robot.getConfig(),robot.getVelocity())
+	hand = setup_simulation(sim,robotname,simple_controller,program.dt)
 	
 	#this code uses the GLSimulationProgram structure, which gives a little more control over the visualization
 	"""
@@ -248,26 +446,35 @@ def launch_simple(robotname,object_set,objectname,use_box=False):
 	#this code manually updates the visualization
 	vis.add("world",world)
 	vis.show()
+	#info describes how replay.py rebuilds the world
+	recorder = Recorder(record,sim,hand,state_period=record_state_period,
+		info={'world':'simple','args':[robotname,object_set,objectname,use_box,None],'controller':'simple_controller','control_dt':program.dt}) if record else None
+	if recorder: recorder.record()
 	t0 = time.time()
 	while vis.shown():
 		vis.lock()
 		sim.simulate(0.01)
+		if recorder: recorder.record()
 		sim.updateWorld()
 		vis.unlock()
 		t1 = time.time()
 		time.sleep(max(0.01-(t1-t0),0.001))
 		t0 = t1
+	if recorder: recorder.close()
 	return
 
 
 
-def launch_balls(robotname,num_balls=10):
-	"""Launches a very simple program that simulates a robot grasping an object from one of the
-	databases. It first allows a user to position the robot's free-floating base in a GUI. 
-	Then, it sets up a simulation with those initial conditions, and launches a visualization.
-	The controller closes the hand, and then lifts the hand upward.  The output of the robot's
-	tactile sensors are printed to the console.
+def make_balls_world(robotname,num_balls=10,seed=None):
+	"""Builds the world used by launch_balls: a plane, num_balls balls arranged
+	in layers inside a box, a second empty box, and the moving base robot.
+	Returns (world,robot).
+
+	If seed is given, the balls are jittered with a random generator seeded with
+	it, so the layout is reproducible.  It is cheap to generate, so unlike the
+	shelf layout it is not cached.
 	"""
+	rng = random.Random(seed) if seed is not None else random
 	world = WorldModel()
 	world.loadElement("data/terrains/plane.env")
 	maxlayer = 16
@@ -290,13 +497,28 @@ def launch_balls(robotname,num_balls=10):
 			x = (x - (w-1)*0.5)*box_dims[0]*0.7/(w-1)
 			y = (y - (h-1)*0.5)*box_dims[1]*0.7/(h-1)
 			t = [x,y,0.08 + layer*0.11]
-			t[0] += random.uniform(-0.005,0.005)
-			t[1] += random.uniform(-0.005,0.005)
+			t[0] += rng.uniform(-0.005,0.005)
+			t[1] += rng.uniform(-0.005,0.005)
 			ball.setTransform(R,t)
 	robot = make_moving_base_robot(robotname,world)
 	box = make_box(world,*box_dims)
 	box2 = make_box(world,*box_dims)
 	box2.geometry().translate((0.7,0,0))
+	return world,robot
+
+def launch_balls(robotname,num_balls=10,log=True,record=None,seed=None):
+	"""Launches a very simple program that simulates a robot grasping an object from one of the
+	databases. It first allows a user to position the robot's free-floating base in a GUI. 
+	Then, it sets up a simulation with those initial conditions, and launches a visualization.
+	The controller closes the hand, and then lifts the hand upward.  The output of the robot's
+	tactile sensors are logged to the console.
+	If log is False, controller telemetry is turned off.
+	If record is given, the run is recorded into that directory (see recorder.py).
+	If seed is given, the balls layout is reproducible (see make_balls_world).
+	"""
+	load_gui()
+	telemetry.configure(enabled=log)
+	world,robot = make_balls_world(robotname,num_balls,seed)
 	xform = resource.get("balls/default_initial_%s.xform"%(robotname,),description="Initial hand transform",default=robot.link(5).getTransform(),world=world,doedit=True)
 	if not xform:
 		print "User quit the program"
@@ -308,25 +530,9 @@ def launch_balls(robotname,num_balls=10):
 	program = GLSimulationProgram(world)  
 	sim = program.sim
 
-	#setup some simulation parameters
-	visPreshrink = True   #turn this to true if you want to see the "shrunken" models used for collision detection
-	for l in range(robot.numLinks()):
-		sim.body(robot.link(l)).setCollisionPreshrink(visPreshrink)
-	for l in range(world.numRigidObjects()):
-		sim.body(world.rigidObject(l)).setCollisionPreshrink(visPreshrink)
-
-	#create a hand emulator from the given robot name
-	module = importlib.import_module('plugins.'+robotname)
-	#emulator takes the robot index (0), start link index (6), and start driver index (6)
-	hand = module.HandEmulator(sim,0,6,6)
-	sim.addEmulator(0,hand)
-
 	#A StateMachineController instance is now attached to control the robot
 	import balls_controller
-	sim.setController(robot,balls_controller.make(sim,hand,program.dt))
-
-	#the next line latches the current configuration in the PID controller...
-	sim.controller(0).setPIDCommand(robot.getConfig(),robot.getVelocity())
+	hand = setup_simulation(sim,robotname,balls_controller,program.dt)
 
 	"""
 	#this code uses the GLSimulationProgram structure, which gives a little more control over the visualization
@@ -340,109 +546,75 @@ def launch_balls(robotname,num_balls=10):
 	#this code manually updates the visualization
 	vis.add("world",world)
 	vis.show()
+	#info describes how replay.py rebuilds the world
+	recorder = Recorder(record,sim,hand,state_period=record_state_period,
+		info={'world':'balls','args':[robotname,num_balls,seed],'controller':'balls_controller','control_dt':program.dt}) if record else None
+	if recorder: recorder.record()
 	t0 = time.time()
 	while vis.shown():
 		vis.lock()
 		sim.simulate(0.01)
+		if recorder: recorder.record()
 		sim.updateWorld()
 		vis.unlock()
 		t1 = time.time()
 		time.sleep(max(0.01-(t1-t0),0.001))
 		t0 = t1
+	if recorder: recorder.close()
 	return
 
-def xy_randomize(obj,bmin,bmax):
-	R,t = obj.getTransform()
-	obmin,obmax = obj.geometry().getBB()
-	w = 0.5*(obmax[0]-obmin[0])
-	h = 0.5*(obmax[1]-obmin[1])
-	correction = max(w,h)
-	R = so3.mul(so3.rotation([0,0,1],random.uniform(0,math.pi*2)),R)
-	t[0] = random.uniform(bmin[0]+correction,bmax[0]-correction)
-	t[1] = random.uniform(bmin[1]+correction,bmax[1]-correction)
-	obj.setTransform(R,t)
-
-def xy_jiggle(world,objects,fixed_objects,bmin,bmax,iters,randomize = True):
-	"""Jiggles the objects' x-y positions within the range bmin - bmax, and randomizes orientation about the z
-	axis until the objects are collision free.  A list of fixed objects (fixed_objects) may be given as well.
-
-	Objects for which collision-free resolutions are not found after iters steps will be
-	deleted from the world.
-	"""
-	if randomize:
-		for obj in objects:
-			xy_randomize(obj,bmin,bmax)
-	inner_iters = 10
-	while iters > 0:
-		numConflicts = [0]*len(objects)
-		for (i,j) in collide.self_collision_iter([o.geometry() for o in objects]):
-			numConflicts[i] += 1
-			numConflicts[j] += 1
-		for (i,j) in collide.group_collision_iter([o.geometry() for o in objects],[o.geometry() for o in fixed_objects]):
-			numConflicts[i] += 1
-		
-		amax = max((c,i) for (i,c) in enumerate(numConflicts))[1]
-		cmax = numConflicts[amax]
-		if cmax == 0:
-			#conflict free
-			return
-		print cmax,"conflicts with object",objects[amax].getName()
-		other_geoms = [o.geometry() for o in objects[:amax]+objects[amax+1:]+fixed_objects]
-		for it in xrange(inner_iters):
-			xy_randomize(objects[amax],bmin,bmax)
-			nc = sum([1 for p in collide.group_collision_iter([objects[amax].geometry()],other_geoms)])
-			if nc < cmax:
-				break
-			iters-=1
-		print "Now",nc,"conflicts with object",objects[amax].getName()
-
-	numConflicts = [0]*len(objects)
-	for (i,j) in collide.self_collision_iter([o.geometry() for o in objects]):
-		numConflicts[i] += 1
-		numConflicts[j] += 1
-	for (i,j) in collide.group_collision_iter([o.geometry() for o in objects],[o.geometry() for o in fixed_objects]):
-		numConflicts[i] += 1
-	removed = []
-	while max(numConflicts) > 0:
-		amax = max((c,i) for (i,c) in enumerate(numConflicts))[1]
-		cmax = numConflicts[amax]
-		print "Unable to find conflict-free configuration, removing object",objects[amax].getName(),"with",cmax,"conflicts"
-		removed.append(amax)
-
-		#revise # of conflicts -- this could be faster, but whatever...
-		numConflicts = [0]*len(objects)
-		for (i,j) in collide.self_collision_iter([o.geometry() for o in objects]):
-			if i in removed or j in removed:
-				continue
-			numConflicts[i] += 1
-			numConflicts[j] += 1
-		for (i,j) in collide.group_collision_iter([o.geometry() for o in objects],[o.geometry() for o in fixed_objects]):
-			if i in removed:
-				continue
-			numConflicts[i] += 1
-	removeIDs = [objects[i].index for i in removed]
-	for i in sorted(removeIDs)[::-1]:
-		world.remove(world.rigidObject(i))
-	raw_input("Press enter to continue")
-
-
-def launch_shelf(robotname,objects):
-	"""Launches the task 2 program that asks the robot to retrieve some set of objects
-	packed within a shelf.
+def make_shelf_world(robotname,objects,interactive=False,lod=None,seed=None):
+	"""Builds the world used by launch_shelf: a plane, the moving base robot, a box,
+	and a shelf in which the given (objectset,objectname) objects are packed.
+	Returns (world,robot,shelf).  lod is the collision mesh tier passed to make_object.
+	If interactive is True, waits for the user to press enter if objects could not
+	be packed.
+
+	If seed is given, the objects are packed with a random generator seeded with
+	it, and the packed layout is stored in (or loaded from) the scene cache, which
+	skips packing altogether.
 	"""
+	objects = [tuple(o) for o in objects]
+	lod = object_lod if lod is None else lod
+	layout = None
+	if seed is not None:
+		meshes = [object_mesh_stamp(objectset,objectname,lod) for (objectset,objectname) in objects]
+		key = scene_cache.make_key('shelf',seed,objects,lod,meshes,shelf_dims,shelf_offset,shelf_height)
+		layout = scene_cache.load(key)
 	world = WorldModel()
 	world.loadElement("data/terrains/plane.env")
 	robot = make_moving_base_robot(robotname,world)
 	box = make_box(world,*box_dims)
 	shelf = make_shelf(world,*shelf_dims)
 	shelf.geometry().translate((0,shelf_offset,shelf_height))
+	if layout is not None:
+		#only the objects that were packed (json returns unicode names, which Klamp't does not take)
+		rigid_objects = [make_object(str(objectset),str(objectname),world,lod) for (objectset,objectname) in layout['objects']]
+		scene_cache.set_transforms(rigid_objects,layout['transforms'])
+		return world,robot,shelf
 	rigid_objects = []
 	for objectset,objectname in objects:
-		object = make_object(objectset,objectname,world)
+		object = make_object(objectset,objectname,world,lod)
 		#TODO: pack in the shelf using x-y translations and z rotations
 		object.setTransform(*se3.mul((so3.identity(),[0,shelf_offset,shelf_height + 0.01]),object.getTransform()))
 		rigid_objects.append(object)
-	xy_jiggle(world,rigid_objects,[shelf],[-0.5*shelf_dims[0],-0.5*shelf_dims[1]+shelf_offset],[0.5*shelf_dims[0],0.5*shelf_dims[1]+shelf_offset],100)
+	rng = random.Random(seed) if seed is not None else random
+	removed = xy_jiggle(world,rigid_objects,[shelf],[-0.5*shelf_dims[0],-0.5*shelf_dims[1]+shelf_offset],[0.5*shelf_dims[0],0.5*shelf_dims[1]+shelf_offset],100,interactive=interactive,rng=rng)
+	if seed is not None:
+		#the shelf and box are terrains, so the remaining rigid objects are the packed ones
+		packed = [o for (i,o) in enumerate(objects) if i not in removed]
+		scene_cache.save(key,{'objects':packed,'transforms':scene_cache.get_transforms([world.rigidObject(i) for i in xrange(world.numRigidObjects())])})
+	return world,robot,shelf
+
+def launch_shelf(robotname,objects,log=True,record=None,seed=None):
+	"""Launches the task 2 program that asks the robot to retrieve some set of objects
+	packed within a shelf.  If log is False, controller telemetry is turned off.
+	If record is given, the run is recorded into that directory (see recorder.py).
+	If seed is given, the shelf packing is reproducible (see make_shelf_world).
+	"""
+	load_gui()
+	telemetry.configure(enabled=log)
+	world,robot,shelf = make_shelf_world(robotname,objects,seed=seed)
 
 	doedit = True
 	xform = resource.get("shelf/default_initial_%s.xform"%(robotname,),description="Initial hand transform",default=robot.link(5).getTransform(),world=world)
@@ -455,32 +627,26 @@ def launch_shelf(robotname,objects):
 	program = GLSimulationProgram(world)
 	sim = program.sim
 
-	#setup some simulation parameters
-	visPreshrink = True   #turn this to true if you want to see the "shrunken" models used for collision detection
-	for l in range(robot.numLinks()):
-		sim.body(robot.link(l)).setCollisionPreshrink(visPreshrink)
-	for l in range(world.numRigidObjects()):
-		sim.body(world.rigidObject(l)).setCollisionPreshrink(visPreshrink)
-
-	#create a hand emulator from the given robot name
-	module = importlib.import_module('plugins.'+robotname)
-	#emulator takes the robot index (0), start link index (6), and start driver index (6)
-	hand = module.HandEmulator(sim,0,6,6)
-	sim.addEmulator(0,hand)
-
 	#controlfunc is now attached to control the robot
 	import shelf_controller
-	sim.setController(robot,shelf_controller.make(sim,hand,program.dt))
-
-	#the next line latches the current configuration in the PID controller...
-	sim.controller(0).setPIDCommand(robot.getConfig(),robot.getVelocity())
+	hand = setup_simulation(sim,robotname,shelf_controller,program.dt)
 	
 	#this code uses the GLSimulationProgram structure, which gives a little more control over the visualization
+	#info describes how replay.py rebuilds the world
+	recorder = Recorder(record,sim,hand,state_period=record_state_period,
+		info={'world':'shelf','args':[robotname,objects,None,seed],'controller':'shelf_controller','control_dt':program.dt}) if record else None
+	if recorder:
+		#control_loop is called before every simulation step
+		program.control_loop = recorder.record
 	vis.setPlugin(program)
 	program.reshape(800,600)
 	vis.show()
 	while vis.shown():
 		time.sleep(0.1)
+	if recorder:
+		#control_loop does not run after the last step
+		recorder.record()
+		recorder.close()
 	return
 	
 	#this code manually updates the vis
@@ -0,0 +1,212 @@
+"""Converts meshes to a compact binary format that loads without parsing.
+
+A compiled mesh is stored next to its source file, as source + '.cmesh'.  It
+consists of a fixed-size header, holding the bounding box and the mass
+properties of the mesh, followed by packed float32 vertices (n x 3) and int32
+triangle indices (m x 3).  The arrays are memory-mapped with NumPy on load.
+
+A compiled mesh is up to date if the modification time and size of its source
+recorded in the header match the source file.
+
+Usage: python mesh_compiler.py [-f] [mesh files...]
+If no files are given, all the object dataset meshes found under data/objects/ are compiled.
+The robot meshes are loaded by Klamp't from the robot files, which never read
+compiled meshes, so they are not compiled.
+"""
+
+from klampt import *
+from klampt.robotsim import doubleVector,intVector
+import numpy as np
+import argparse
+import glob
+import os
+
+compiled_extension = '.cmesh'
+magic = 'KMSH'
+version = 1
+
+header_dtype = np.dtype([('magic','S4'),('version','<u4'),('num_vertices','<u4'),('num_triangles','<u4'),
+						 ('source_mtime','<f8'),('source_size','<u8'),
+						 ('bmin','<f8',(3,)),('bmax','<f8',(3,)),
+						 ('volume','<f8'),('com','<f8',(3,)),('inertia','<f8',(3,3))])
+
+#meshes compiled by default
+default_patterns = ['data/objects/ycb/*/meshes/tsdf_mesh.stl',
+					'data/objects/ycb/*/meshes/poisson_mesh.stl',
+					'data/objects/apc2015/*/textured_meshes/optimized_tsdf_textured_mesh.ply']
+
+class CompiledMesh:
+	"""A loaded compiled mesh.  vertices and triangles are read-only memory-mapped
+	arrays; volume, com and inertia are the mass properties of the mesh assuming
+	a unit mass of uniform density (inertia is about the center of mass)."""
+	def __init__(self,fn,header,vertices,triangles):
+		self.fn = fn
+		self.vertices = vertices
+		self.triangles = triangles
+		self.bmin = header['bmin'].tolist()
+		self.bmax = header['bmax'].tolist()
+		self.volume = float(header['volume'])
+		self.com = header['com'].tolist()
+		self.inertia = header['inertia']
+
+	def geometry(self):
+		"""Returns a Klamp't Geometry3D holding this mesh"""
+		m = TriangleMesh()
+		m.vertices = doubleVector(self.vertices.ravel().tolist())
+		m.indices = intVector(self.triangles.ravel().tolist())
+		g = Geometry3D()
+		g.setTriangleMesh(m)
+		return g
+
+	def mass(self,mass):
+		"""Returns a Klamp't Mass of the given total mass for this mesh"""
+		m = Mass()
+		m.setMass(mass)
+		m.setCom(self.com)
+		m.setInertia((self.inertia*mass).ravel().tolist())
+		return m
+
+def compiled_path(fn):
+	return fn + compiled_extension
+
+def read_tri(fn):
+	"""Reads a Klamp't .tri file into (vertices,triangles) arrays"""
+	tokens = open(fn,'r').read().split()
+	nv = int(tokens[0])
+	vertices = np.array(tokens[1:1+nv*3],dtype=np.float64).reshape((nv,3))
+	nt = int(tokens[1+nv*3])
+	triangles = np.array(tokens[2+nv*3:2+nv*3+nt*3],dtype=np.int32).reshape((nt,3))
+	return vertices,triangles
+
+def read_mesh(fn):
+	"""Reads a mesh file of any format supported by Klamp't into (vertices,triangles)
+	arrays"""
+	if fn.endswith('.tri'):
+		return read_tri(fn)
+	g = Geometry3D()
+	if not g.loadFile(fn):
+		raise IOError("Unable to load mesh %s"%(fn,))
+	m = g.getTriangleMesh()
+	vertices = np.array(m.vertices,dtype=np.float64).reshape((-1,3))
+	triangles = np.array(m.indices,dtype=np.int32).reshape((-1,3))
+	return vertices,triangles
+
+def mass_properties(vertices,triangles):
+	"""Returns the (volume,com,inertia) of a closed triangle mesh of uniform density
+	and unit mass, with inertia taken about the com.  Computed by summing signed
+	tetrahedra from the origin to each triangle.  Meshes that enclose no volume
+	(e.g., open scans) are treated as solid boxes filling their bounding box."""
+	a = vertices[triangles[:,0]]
+	b = vertices[triangles[:,1]]
+	c = vertices[triangles[:,2]]
+	det = np.einsum('ij,ij->i',a,np.cross(b,c))
+	volume = det.sum()/6.0
+	bmin = vertices.min(axis=0) if len(vertices) else np.zeros(3)
+	bmax = vertices.max(axis=0) if len(vertices) else np.zeros(3)
+	dims = bmax-bmin
+	if abs(volume) <= 1e-3*max(np.prod(dims),1e-12):
+		com = 0.5*(bmin+bmax)
+		inertia = np.diag([dims[1]**2+dims[2]**2,dims[0]**2+dims[2]**2,dims[0]**2+dims[1]**2])/12.0
+		return float(np.prod(dims)),com,inertia
+	com = ((a+b+c)*det[:,np.newaxis]).sum(axis=0)/(24.0*volume)
+	#second moment (covariance) of each tetrahedron about the origin
+	s = a+b+c
+	cov = (np.einsum('i,ij,ik->jk',det,s,s) + np.einsum('i,ij,ik->jk',det,a,a) + np.einsum('i,ij,ik->jk',det,b,b) + np.einsum('i,ij,ik->jk',det,c,c))/120.0
+	#translate to the com and normalize to unit mass
+	cov = cov/volume - np.outer(com,com)
+	inertia = np.trace(cov)*np.eye(3) - cov
+	return abs(volume),com,inertia
+
+def source_stamp(fn):
+	st = os.stat(fn)
+	return st.st_mtime,st.st_size
+
+def write_compiled(fn,vertices,triangles,stamp,out=None):
+	"""Writes the given mesh arrays, originally read from fn with source_stamp
+	stamp, to the compiled file out (default: compiled_path(fn))."""
+	if out is None:
+		out = compiled_path(fn)
+	header = np.zeros(1,dtype=header_dtype)
+	header['magic'] = magic
+	header['version'] = version
+	header['num_vertices'] = len(vertices)
+	header['num_triangles'] = len(triangles)
+	header['source_mtime'],header['source_size'] = stamp
+	if len(vertices):
+		header['bmin'] = vertices.min(axis=0)
+		header['bmax'] = vertices.max(axis=0)
+	header['volume'],header['com'],header['inertia'] = mass_properties(vertices,triangles)
+	#write to a temporary file and rename so that readers never see a partial file
+	tmp = out + '.%d.tmp'%(os.getpid(),)
+	f = open(tmp,'wb')
+	f.write(header.tobytes())
+	f.write(np.ascontiguousarray(vertices,dtype='<f4').tobytes())
+	f.write(np.ascontiguousarray(triangles,dtype='<i4').tobytes())
+	f.close()
+	os.rename(tmp,out)
+	return out
+
+def compile_mesh(fn,out=None):
+	"""Compiles the mesh file fn into out (default: compiled_path(fn)) and returns
+	the compiled file name."""
+	stamp = source_stamp(fn)
+	vertices,triangles = read_mesh(fn)
+	return write_compiled(fn,vertices,triangles,stamp,out)
+
+def read_header(cfn):
+	header = np.fromfile(cfn,dtype=header_dtype,count=1)
+	if len(header) == 0 or header['magic'][0] != magic or header['version'][0] != version:
+		return None
+	return header[0]
+
+def is_up_to_date(fn,cfn=None):
+	"""Returns True if the compiled version of fn exists and was made from the
+	current contents of fn."""
+	if cfn is None:
+		cfn = compiled_path(fn)
+	if not os.path.exists(cfn) or not os.path.exists(fn):
+		return False
+	header = read_header(cfn)
+	if header is None:
+		return False
+	mtime,size = source_stamp(fn)
+	return header['source_mtime'] == mtime and header['source_size'] == size
+
+def load_compiled(cfn):
+	"""Loads a compiled mesh file, memory-mapping its vertex and triangle arrays.
+	Returns a CompiledMesh, or None if cfn is not a valid compiled mesh."""
+	header = read_header(cfn)
+	if header is None:
+		return None
+	nv = int(header['num_vertices'])
+	nt = int(header['num_triangles'])
+	offset = header_dtype.itemsize
+	vertices = np.memmap(cfn,dtype='<f4',mode='r',offset=offset,shape=(nv,3)) if nv > 0 else np.zeros((0,3),dtype='<f4')
+	offset += nv*3*4
+	triangles = np.memmap(cfn,dtype='<i4',mode='r',offset=offset,shape=(nt,3)) if nt > 0 else np.zeros((0,3),dtype='<i4')
+	return CompiledMesh(cfn,header,vertices,triangles)
+
+def load_mesh(fn):
+	"""Returns the CompiledMesh for the mesh file fn if an up-to-date compiled
+	version exists, otherwise None."""
+	if not is_up_to_date(fn):
+		return None
+	return load_compiled(compiled_path(fn))
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Compiles meshes into the binary '+compiled_extension+' format')
+	parser.add_argument('files',nargs='*',help='mesh files (default: all object dataset meshes)')
+	parser.add_argument('-f','--force',action='store_true',help='recompile meshes that are up to date')
+	args = parser.parse_args()
+	files = args.files
+	if len(files) == 0:
+		files = sorted(sum([glob.glob(p) for p in default_patterns],[]))
+	for fn in files:
+		if not args.force and is_up_to_date(fn):
+			continue
+		try:
+			cfn = compile_mesh(fn)
+		except IOError as e:
+			print e
+			continue
+		print fn,"->",cfn,"(%d bytes)"%(os.path.getsize(cfn),)
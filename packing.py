@@ -0,0 +1,170 @@
+"""Packs objects at random, collision-free x-y positions, as in the shelf scenes.
+
+xy_jiggle moves the object with the most conflicts to random positions until
+no object collides with another or with the fixed objects.  The conflicts are
+maintained incrementally: a uniform grid over the x-y plane indexes the
+bounding box footprints of the objects, and a moved object is only checked
+against the objects whose footprints share a grid cell with its own, and
+against the fixed objects.
+
+The random placements are drawn from the rng argument, the random module by
+default; pass a random.Random(seed) for reproducible layouts.
+"""
+
+from klampt import *
+from klampt.math import so3
+import telemetry
+import collections
+import math
+import random
+
+def xy_randomize(obj,bmin,bmax,rng=random):
+	R,t = obj.getTransform()
+	obmin,obmax = obj.geometry().getBB()
+	w = 0.5*(obmax[0]-obmin[0])
+	h = 0.5*(obmax[1]-obmin[1])
+	correction = max(w,h)
+	R = so3.mul(so3.rotation([0,0,1],rng.uniform(0,math.pi*2)),R)
+	t[0] = rng.uniform(bmin[0]+correction,bmax[0]-correction)
+	t[1] = rng.uniform(bmin[1]+correction,bmax[1]-correction)
+	obj.setTransform(R,t)
+
+def bb_overlap(bb1,bb2):
+	"""Returns True if the bounding boxes (bmin,bmax) bb1 and bb2 intersect"""
+	return all(bb1[0][k] <= bb2[1][k] and bb2[0][k] <= bb1[1][k] for k in xrange(3))
+
+class FootprintGrid:
+	"""A uniform grid with cells of size cell over the x-y plane, indexing the
+	bounding boxes of a set of keys by the cells their footprints cover"""
+	def __init__(self,cell):
+		self.cell = cell
+		self.cells = collections.defaultdict(set)
+		self.bbs = dict()
+
+	def cell_range(self,bb):
+		c = self.cell
+		imin,imax = int(math.floor(bb[0][0]/c)),int(math.floor(bb[1][0]/c))
+		jmin,jmax = int(math.floor(bb[0][1]/c)),int(math.floor(bb[1][1]/c))
+		return [(i,j) for i in xrange(imin,imax+1) for j in xrange(jmin,jmax+1)]
+
+	def insert(self,key,bb):
+		self.bbs[key] = bb
+		for c in self.cell_range(bb):
+			self.cells[c].add(key)
+
+	def remove(self,key):
+		for c in self.cell_range(self.bbs.pop(key)):
+			self.cells[c].discard(key)
+
+	def neighbors(self,bb):
+		"""Returns the set of keys whose bounding boxes intersect bb"""
+		res = set()
+		for c in self.cell_range(bb):
+			if c in self.cells:
+				res |= self.cells[c]
+		return set(k for k in res if bb_overlap(bb,self.bbs[k]))
+
+class Packer:
+	"""Maintains the conflicts (collisions) between objects, and between the
+	objects and fixed_objects, as the objects are moved or removed.  cell is the
+	size of the grid cells (default: the largest footprint of the objects)."""
+	def __init__(self,objects,fixed_objects,cell=None):
+		self.objects = objects
+		self.geoms = [o.geometry() for o in objects]
+		self.fixed_geoms = [o.geometry() for o in fixed_objects]
+		self.fixed_bbs = [g.getBB() for g in self.fixed_geoms]
+		bbs = [g.getBB() for g in self.geoms]
+		if cell is None:
+			cell = max([max(bb[1][0]-bb[0][0],bb[1][1]-bb[0][1]) for bb in bbs]+[1e-3])
+		self.grid = FootprintGrid(cell)
+		self.conflicts = [set() for o in objects]
+		self.fixed_conflicts = [0]*len(objects)
+		self.removed = set()
+		for i,bb in enumerate(bbs):
+			self.insert(i,bb)
+
+	def num_conflicts(self,i):
+		return len(self.conflicts[i]) + self.fixed_conflicts[i]
+
+	def worst(self):
+		"""Returns the index of the (remaining) object with the most conflicts,
+		and its number of conflicts"""
+		cmax,amax = max((self.num_conflicts(i),i) for i in xrange(len(self.objects)) if i not in self.removed)
+		return amax,cmax
+
+	def insert(self,i,bb):
+		"""Computes the conflicts of object i, whose bounding box is bb, and adds
+		it to the grid"""
+		g = self.geoms[i]
+		for j in self.grid.neighbors(bb):
+			if g.collides(self.geoms[j]):
+				self.conflicts[i].add(j)
+				self.conflicts[j].add(i)
+		self.fixed_conflicts[i] = sum(1 for (fbb,fg) in zip(self.fixed_bbs,self.fixed_geoms) if bb_overlap(bb,fbb) and g.collides(fg))
+		self.grid.insert(i,bb)
+
+	def remove(self,i):
+		"""Removes object i from the grid and from the conflicts of the others"""
+		self.grid.remove(i)
+		for j in self.conflicts[i]:
+			self.conflicts[j].discard(i)
+		self.conflicts[i] = set()
+		self.fixed_conflicts[i] = 0
+
+	def move(self,i,bmin,bmax,rng=random):
+		"""Moves object i to a random position in the range bmin - bmax, and
+		returns its new number of conflicts"""
+		self.remove(i)
+		xy_randomize(self.objects[i],bmin,bmax,rng)
+		self.insert(i,self.geoms[i].getBB())
+		return self.num_conflicts(i)
+
+	def discard(self,i):
+		"""Removes object i from the packing for good"""
+		self.remove(i)
+		self.removed.add(i)
+
+def xy_jiggle(world,objects,fixed_objects,bmin,bmax,iters,randomize = True,interactive = False,rng = random):
+	"""Jiggles the objects' x-y positions within the range bmin - bmax, and randomizes orientation about the z
+	axis until the objects are collision free.  A list of fixed objects (fixed_objects) may be given as well.
+
+	Objects for which collision-free resolutions are not found after iters steps will be
+	deleted from the world.  If interactive is True, waits for the user to press enter
+	once objects have been removed.  Returns the indices in objects of the removed objects.
+	"""
+	log = telemetry.channel('packing')
+	if randomize:
+		for obj in objects:
+			xy_randomize(obj,bmin,bmax,rng)
+	if len(objects) == 0:
+		return []
+	packer = Packer(objects,fixed_objects)
+	inner_iters = 10
+	while iters > 0:
+		amax,cmax = packer.worst()
+		if cmax == 0:
+			#conflict free
+			return []
+		log.log(None,"%d conflicts with object %s",cmax,objects[amax].getName())
+		for it in xrange(inner_iters):
+			nc = packer.move(amax,bmin,bmax,rng)
+			if nc < cmax:
+				break
+			iters-=1
+		log.log(None,"Now %d conflicts with object %s",nc,objects[amax].getName())
+
+	removed = []
+	while len(packer.removed) < len(objects):
+		amax,cmax = packer.worst()
+		if cmax == 0:
+			break
+		log.log(None,"Unable to find conflict-free configuration, removing object %s with %d conflicts",objects[amax].getName(),cmax)
+		packer.discard(amax)
+		removed.append(amax)
+	removeIDs = [objects[i].index for i in removed]
+	for i in sorted(removeIDs)[::-1]:
+		world.remove(world.rigidObject(i))
+	if interactive and len(removed) > 0:
+		telemetry.flush()
+		raw_input("Press enter to continue")
+	return removed
@@ -1,9 +1,34 @@
 from klampt.math import vectorops, se3
 from klampt.sim.simulation import ActuatorEmulator
 import numpy as np
+import cPickle as pickle
+import hashlib
+import inspect
+import os
+import sys
+
+# directory of the hand parameter cache (see CompliantHandEmulator.loadCachedHandParameters),
+# or None to always run loadHandParameters
+hand_cache_dir = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), 'cache', 'hands')
+
+
+def module_source_file(name):
+    """
+    Returns the source file of the loaded module name, or None if it has none
+    """
+    fn = getattr(sys.modules.get(name), '__file__', None)
+    if fn is not None and fn.endswith('.pyc'):
+        fn = fn[:-1]
+    return fn
 
 class CompliantHandEmulator(ActuatorEmulator):
     """An simulation model for the SoftHand for use with SimpleSimulation"""
+    # attributes set by loadHandParameters that are stored in the hand parameter cache
+    cached_parameters = ['hand', 'mimic', 'u_to_n', 'a_to_n', 'd_to_n', 'm_to_n',
+                         'n_to_u', 'n_to_a', 'n_to_d', 'n_to_m', 'm_to_u',
+                         'u_dofs', 'a_dofs', 'd_dofs', 'm_dofs',
+                         'R', 'E', 'q_u_rest', 'sigma_offset']
+
     def __init__(self, sim, robotindex=0, link_offset=0, driver_offset=0, a_dofs=0, d_dofs=0, u_dofs=0, m_dofs=0):
         self.world = sim.world
         self.sim = sim
@@ -61,6 +86,9 @@ class CompliantHandEmulator(ActuatorEmulator):
         # loading elasticity and reduction map
         self.R = np.zeros((self.a_dofs, self.u_dofs))
         self.E = np.eye(self.u_dofs)
+        # copies of R and E for which the projections of updateSynergyMatrices were computed
+        self.R_cached = None
+        self.E_cached = None
         # joint rest position for underactuated joints (q_u at zero spring deflection)
         self.q_u_rest = 0.0
         # joint offset at the actuator joint
@@ -69,13 +97,16 @@ class CompliantHandEmulator(ActuatorEmulator):
         self.q_a_ref = np.array(self.a_dofs * [0.0])
         self.q_d_ref = np.array(self.d_dofs * [0.0])
 
-        self.loadHandParameters()
+        self.hand_parameters_cached = self.loadCachedHandParameters()
+
+        self.freezeIndexMaps()
 
         self.loadContactInfo()
 
         self.setupController()
 
-        self.printHandInfo()
+        if not self.hand_parameters_cached:
+            self.printHandInfo()
 
     def loadHandParameters(self):
         """
@@ -98,6 +129,117 @@ class CompliantHandEmulator(ActuatorEmulator):
         """
         pass
 
+    def handModelFiles(self):
+        """
+        Returns the files (e.g., the URDF) loadHandParameters reads the hand parameters from
+        """
+        return []
+
+    def handSourceFiles(self):
+        """
+        Returns the source files of the code loadHandParameters runs: by default, those of the
+        emulator classes.  Subclasses that load the parameters with other modules add their files.
+        """
+        files = []
+        # ActuatorEmulator is an old-style class, so type(self) is not the emulator class
+        for cls in inspect.getmro(self.__class__):
+            fn = module_source_file(cls.__module__)
+            if fn is not None and fn not in files:
+                files.append(fn)
+        return files
+
+    def handParametersKey(self):
+        """
+        Returns the key of the hand parameters in the cache: a hash of the files of
+        handSourceFiles and handModelFiles, of the driver names and of the constructor arguments
+        """
+        h = hashlib.sha1()
+        for fn in self.handSourceFiles() + self.handModelFiles():
+            h.update(fn)
+            if os.path.exists(fn):
+                f = open(fn, 'rb')
+                h.update(f.read())
+                f.close()
+        h.update(repr((self.__class__.__name__, self.robot.getName(),
+                       [self.robot.driver(i).getName() for i in xrange(self.robot.numDrivers())],
+                       self.link_offset, self.driver_offset, self.a_dofs, self.d_dofs, self.u_dofs, self.m_dofs)))
+        return h.hexdigest()
+
+    def loadCachedHandParameters(self):
+        """
+        Sets the cached_parameters attributes from the hand parameter cache if they were stored
+        for the same hand, and otherwise calls loadHandParameters and stores them.
+        Returns True if the parameters came from the cache.
+        """
+        if hand_cache_dir is None:
+            self.loadHandParameters()
+            return False
+        fn = os.path.join(hand_cache_dir, self.handParametersKey() + '.pkl')
+        if os.path.exists(fn):
+            try:
+                f = open(fn, 'rb')
+                try:
+                    params = pickle.load(f)
+                finally:
+                    f.close()
+            except Exception:
+                # unreadable or stale entry, recomputed below
+                params = None
+            if params is not None:
+                for name, value in params.iteritems():
+                    setattr(self, name, value)
+                # R may depend on the current configuration
+                self.initR()
+                return True
+        self.loadHandParameters()
+        try:
+            if not os.path.exists(hand_cache_dir):
+                os.makedirs(hand_cache_dir)
+            tmp = '%s.%d.tmp' % (fn, os.getpid())
+            f = open(tmp, 'wb')
+            pickle.dump(dict((name, getattr(self, name)) for name in self.cached_parameters), f, pickle.HIGHEST_PROTOCOL)
+            f.close()
+            os.rename(tmp, fn)
+        except (IOError, OSError):
+            pass
+        return False
+
+    def freezeIndexMaps(self):
+        """
+        freezeIndexMaps stores the maps filled by loadHandParameters as NumPy index arrays
+        and allocates the buffers reused by output() at every substep:
+         - *_to_n_idx index the driver vector (e.g., torque) by underactuated, synergy,
+           mimic and regular actuator id
+         - *_cols index the configuration vector (e.g., qdes) by the same ids
+        The list versions of the maps are left untouched.
+        """
+        self.q_to_t_idx = np.array(self.q_to_t, dtype=int)
+        self.u_to_n_idx = np.array(self.u_to_n, dtype=int)
+        self.a_to_n_idx = np.array(self.a_to_n, dtype=int)
+        self.m_to_n_idx = np.array(self.m_to_n, dtype=int)
+        self.d_to_n_idx = np.array(self.d_to_n, dtype=int)
+        # configuration indices of the underactuated joints, i.e. the Jacobian columns of J_c
+        self.u_cols = self.q_to_t_idx[self.u_to_n_idx]
+        self.a_cols = self.q_to_t_idx[self.a_to_n_idx]
+        self.m_cols = self.q_to_t_idx[self.m_to_n_idx]
+        self.d_cols = self.q_to_t_idx[self.d_to_n_idx]
+
+        n_links = self.robot.numLinks()
+        self.g_q = np.zeros(n_links)
+        self.q_full = np.zeros(n_links)
+        self.qdes = np.zeros(n_links)
+        self.torque = np.zeros(self.n_dofs)
+        self.q_a = np.zeros(self.a_dofs)
+        self.q_u = np.zeros(self.u_dofs)
+        self.sigma = np.zeros(self.a_dofs)
+        self.tau_c = np.zeros(self.u_dofs)
+        self.f_a = np.zeros(self.a_dofs)
+        self.torque_u = np.zeros(self.u_dofs)
+        self.q_u_ref = np.zeros(self.u_dofs)
+        self.tmp_a = np.zeros(self.a_dofs)
+        self.tmp_u = np.zeros(self.u_dofs)
+        self.tmp_u2 = np.zeros(self.u_dofs)
+
     def updateR(self, q_u):
         """
         updateR computes the new transmission matrix as a function of q_u
@@ -106,12 +248,41 @@ class CompliantHandEmulator(ActuatorEmulator):
         """
         return self.R
 
+    def updateSynergyMatrices(self):
+        """
+        updateSynergyMatrices recomputes the projections used by output() when R or E
+        changed since the last call:
+         - P_f_tau = (R E^-1 R^T)^-1 R E^-1 and P_f_sigma = (R E^-1 R^T)^-1, so that
+           f_a = effort_scaling * P_f_tau tau_c + synergy_reduction * P_f_sigma sigma
+         - P_q_tau = -E^-1 + E^-1 R^T P_f_tau and P_q_sigma = E^-1 R^T P_f_sigma, so that
+           q_u_ref = q_u_rest + effort_scaling * P_q_tau tau_c + synergy_reduction * P_q_sigma sigma
+        The products are obtained by solving against E and R E^-1 R^T rather than by
+        forming their inverses.
+        """
+        if self.R_cached is not None and np.array_equal(self.R, self.R_cached) and np.array_equal(self.E, self.E_cached):
+            return
+        self.R_cached = self.R.copy()
+        self.E_cached = self.E.copy()
+        E_inv_R_T = np.linalg.solve(self.E, self.R.T)
+        R_E_inv = np.linalg.solve(self.E.T, self.R.T).T
+        S = self.R.dot(E_inv_R_T)
+        self.P_f_tau = np.linalg.solve(S, R_E_inv)
+        self.P_f_sigma = np.linalg.solve(S, np.eye(S.shape[0]))
+        self.P_q_tau = E_inv_R_T.dot(self.P_f_tau) - np.linalg.solve(self.E, np.eye(self.u_dofs))
+        self.P_q_sigma = E_inv_R_T.dot(self.P_f_sigma)
+
     def loadContactInfo(self):
         # loading previously defined maps
         for i in self.u_to_n:
             link = self.robot.link(self.robot.driver(i).getName())
             self.u_to_l.append(link.getID())
             self.l_to_i[link.getID()] = link.getIndex()
+        self.u_links = [self.robot.link(self.l_to_i[l_id]) for l_id in self.u_to_l]
+        # per-link contact wrenches (torque, then force) and jacobians, preallocated
+        # so that get_contact_forces_and_jacobians does not allocate per substep
+        self.w_l = np.zeros((len(self.u_to_l), 6))
+        self.J_l = np.zeros((len(self.u_to_l), 6, self.u_dofs))
+        self.l_in_contact = np.zeros(len(self.u_to_l), dtype=int)
 
     def setupController(self):
         kP, kI, kD = self.controller.getPIDGains()
@@ -133,59 +304,60 @@ class CompliantHandEmulator(ActuatorEmulator):
     def output(self):
         """
         @return (torque, qdes) where #torque = n_dofs, #qdes = n_links
+        The returned arrays are buffers that are overwritten by the next call.
         """
-        torque = np.array(self.n_dofs * [0.0])
-        self.g_q = np.array(self.robot.getGravityForces([0,0,-9.81]))
+        self.g_q[:] = self.robot.getGravityForces([0,0,-9.81])
         # gravity compensation
-        torque = self.g_q[self.q_to_t]
+        torque = np.take(self.g_q, self.q_to_t_idx, out=self.torque)
 
-        q = np.array(self.sim.getActualConfig(self.robotindex))
-
-        q = q[self.q_to_t]
-        dq = np.array(self.sim.getActualVelocity(self.robotindex))
-        dq = dq[self.q_to_t]
+        q_full = self.sim.getActualConfig(self.robotindex)
+        self.q_full[:] = q_full
 
-        dq_a = dq[self.a_to_n]
-        dq_u = dq[self.u_to_n]
-        dq_m = dq[self.m_to_n]
-
-        q_a = q[self.a_to_n]
-        q_u = q[self.u_to_n]
-        q_m = q[self.m_to_n]
+        q_a = np.take(self.q_full, self.a_cols, out=self.q_a)
+        q_u = np.take(self.q_full, self.u_cols, out=self.q_u)
 
         # updates self.R
         self.updateR(q_u)
+        self.updateSynergyMatrices()
 
-        E_inv = np.linalg.inv(self.E)
-        R_E_inv_R_T_inv = np.linalg.inv(self.R.dot(E_inv).dot(self.R.T))
-        sigma = q_a + self.sigma_offset # q_a goes from 0.0 to 1.0
-        f_c, J_c = self.get_contact_forces_and_jacobians()
-        self.tau_c = J_c.T.dot(f_c)
+        sigma = np.add(q_a, self.sigma_offset, out=self.sigma) # q_a goes from 0.0 to 1.0
+        f_c, J_c = self.get_contact_forces_and_jacobians(q_full)
+        np.dot(J_c.T, f_c, out=self.tau_c)
 
         # tendon tension
-        self.f_a =  self.effort_scaling * R_E_inv_R_T_inv.dot(self.R).dot(E_inv).dot(self.tau_c) + self.synergy_reduction * R_E_inv_R_T_inv.dot(sigma)
-
-        torque_a = 0.0 * (self.f_a / self.synergy_reduction) # f_a offset
-
-        torque_u = self.R.T.dot(self.f_a) - self.E.dot(q_u-self.q_u_rest)
-
-        torque_m = len(self.m_to_u)*[0.0] # 0 offset
-
-        q_u_ref = self.q_u_rest + self.effort_scaling * (-E_inv + E_inv.dot(self.R.T).dot(R_E_inv_R_T_inv).dot(self.R).dot(E_inv)).dot(self.tau_c) + self.synergy_reduction * E_inv.dot(self.R.T).dot(R_E_inv_R_T_inv).dot(sigma)
-
-        torque[self.a_to_n] = torque_a # synergy actuators are affected by gravity
-        torque[self.u_to_n] += torque_u # underactuated joints are emulated, no gravity
-        torque[self.m_to_n] += torque_m # mimic joints are emulated, no gravity
-
-        qdes = np.array(self.controller.getCommandedConfig())
-        qdes[[self.q_to_t[u_id] for u_id in self.u_to_n]] = q_u_ref
-        qdes[[self.q_to_t[m_id] for m_id in self.m_to_n]] = q_u_ref
-        qdes[[self.q_to_t[a_id] for a_id in self.a_to_n]] = self.q_a_ref
-        qdes[[self.q_to_t[d_id] for d_id in self.d_to_n]] = self.q_d_ref
+        np.dot(self.P_f_tau, self.tau_c, out=self.f_a)
+        self.f_a *= self.effort_scaling
+        np.dot(self.P_f_sigma, sigma, out=self.tmp_a)
+        self.tmp_a *= self.synergy_reduction
+        self.f_a += self.tmp_a
+
+        torque_u = np.dot(self.R.T, self.f_a, out=self.torque_u)
+        np.subtract(q_u, self.q_u_rest, out=self.tmp_u)
+        torque_u -= np.dot(self.E, self.tmp_u, out=self.tmp_u2)
+
+        q_u_ref = np.dot(self.P_q_tau, self.tau_c, out=self.q_u_ref)
+        q_u_ref *= self.effort_scaling
+        np.dot(self.P_q_sigma, sigma, out=self.tmp_u)
+        self.tmp_u *= self.synergy_reduction
+        q_u_ref += self.tmp_u
+        q_u_ref += self.q_u_rest
+
+        torque[self.a_to_n_idx] = 0.0 # synergy actuators are affected by gravity, f_a offset is 0
+        # underactuated joints are emulated, no gravity
+        np.take(torque, self.u_to_n_idx, out=self.tmp_u)
+        self.tmp_u += torque_u
+        torque[self.u_to_n_idx] = self.tmp_u
+        # mimic joints are emulated, no gravity, 0 offset
+
+        qdes = self.qdes
+        qdes[:] = self.controller.getCommandedConfig()
+        qdes[self.u_cols] = q_u_ref
+        qdes[self.m_cols] = q_u_ref
+        qdes[self.a_cols] = self.q_a_ref
+        qdes[self.d_cols] = self.q_d_ref
 
         # print 'q_u:', q_u
         # print 'q_a_ref-q_a:',self.q_a_ref-q_a
-        # print 'q_u-q_m:', q_u[self.m_to_u]-q_m
         # print 'tau_u:', torque_u
         # print "tau_c", self.tau_c
         # print "f_a", self.f_a
@@ -205,74 +377,41 @@ class CompliantHandEmulator(ActuatorEmulator):
         q_u = q[self.u_to_n]
         self.updateR(q_u)
 
-    def get_contact_forces_and_jacobians(self):
+    def get_contact_forces_and_jacobians(self, q=None):
         """
         Returns a force contact vector 1x(6*n_contacts)
         and a contact jacobian matrix 6*n_contactsxn.
-        Contact forces are considered to be applied at the link origin
+        Contact forces are considered to be applied at the link origin.
+        q is the current simulated configuration of the robot, if the caller already has it.
+        The returned arrays are views on buffers that are overwritten by the next call.
         """
         n_contacts = 0  # one contact per link
-        maxid = self.world.numIDs()
-        J_l = dict()
-        f_l = dict()
-        t_l = dict()
-        for l_id in self.u_to_l:
-            l_index = self.l_to_i[l_id]
-            link_in_contact = self.robot.link(l_index)
-            contacts_per_link = 0
-            for j in xrange(maxid):  # TODO compute just one contact per link
-                contacts_l_id_j = len(self.sim.getContacts(l_id, j))
-                contacts_per_link += contacts_l_id_j
-                if contacts_l_id_j > 0:
-                    if not f_l.has_key(l_id):
-                        f_l[l_id] = self.sim.contactForce(l_id, j)
-                        t_l[l_id] = self.sim.contactTorque(l_id, j)
-                    else:
-                        f_l[l_id] = vectorops.add(f_l[l_id], self.sim.contactForce(l_id, j))
-                        t_l[l_id] = vectorops.add(t_l[l_id], self.sim.contactTorque(l_id, j))
-                    ### debugging ###
-                    # print "link", link_in_contact.getName(), """
-                    #      in contact with obj""", self.world.getName(j), """
-                    #      (""", len(self.sim.getContacts(l_id, j)), """
-                    #      contacts)\n f=""",self.sim.contactForce(l_id, j), """
-                    #      t=""", self.sim.contactTorque(l_id, j)
+        for k, l_id in enumerate(self.u_to_l):
             if self.virtual_contacts.has_key(l_id):
-                b = self.sim.body(link_in_contact)
-
-                f_v = se3.apply_rotation(b.getTransform(),self.virtual_wrenches[l_id][0:3])
-                t_v = se3.apply_rotation(b.getTransform(),self.virtual_wrenches[l_id][3:6])
-                if not f_l.has_key(l_id):
-                    f_l[l_id] = f_v
-                    t_l[l_id] = t_v
-                else:
-                    f_l[l_id] = f_v
-                    t_l[l_id] = t_v
-
-
-            ### debugging ###
-            """
-            if contacts_per_link == 0:
-                print "link", link_in_contact.getName(), "not in contact"
-            """
-            if contacts_per_link > 0 or self.virtual_contacts.has_key(l_id):
-                n_contacts += 1
-                J_l[l_id] = np.array(link_in_contact.getJacobian(
-                    (0, 0, 0)))
-                self.robot.setConfig(self.sim.getActualConfig(self.robotindex))
-                #print "J_l[l_id]:\n",J_l[l_id]
-                #print "J_l shape", J_l[l_id].shape
-        f_c = np.array(6 * n_contacts * [0.0])
-        J_c = np.zeros((6 * n_contacts, self.u_dofs))
-
-        for l_in_contact in xrange(len(J_l.keys())):
-            f_c[l_in_contact * 6:l_in_contact * 6 + 3
-            ] = t_l.values()[l_in_contact] # Jacobian has angular velocity first, then linear
-            f_c[l_in_contact * 6 + 3:l_in_contact * 6 + 6
-            ] = f_l.values()[l_in_contact] # Jacobian has angular velocity first, then linear
-            J_c[l_in_contact * 6:l_in_contact * 6 + 6,
-            :] = np.array(
-                J_l.values()[l_in_contact])[:, [self.q_to_t[u_id] for u_id in self.u_to_n]]
-        #print f_c, J_c
+                b = self.sim.body(self.u_links[k])
+                # Jacobian has angular velocity first, then linear
+                self.w_l[n_contacts, 0:3] = se3.apply_rotation(b.getTransform(), self.virtual_wrenches[l_id][3:6])
+                self.w_l[n_contacts, 3:6] = se3.apply_rotation(b.getTransform(), self.virtual_wrenches[l_id][0:3])
+            elif self.sim.inContact(l_id, -1):
+                # bid = -1 sums over all the bodies touching the link, so that the cost
+                # depends on the number of hand links rather than on the size of the world
+                self.w_l[n_contacts, 0:3] = self.sim.contactTorque(l_id, -1)
+                self.w_l[n_contacts, 3:6] = self.sim.contactForce(l_id, -1)
+            else:
+                continue
+            self.l_in_contact[n_contacts] = k
+            n_contacts += 1
+        if n_contacts > 0:
+            # the Jacobians of all the links in contact are taken at the current simulated
+            # configuration, which is set on the robot model once per call
+            if q is None:
+                q = self.sim.getActualConfig(self.robotindex)
+            self.robot.setConfig(q)
+            for c in xrange(n_contacts):
+                J = np.array(self.u_links[self.l_in_contact[c]].getJacobian((0, 0, 0)))
+                self.J_l[c] = J[:, self.u_cols]
+        f_c = self.w_l[:n_contacts].reshape(6 * n_contacts)
+        J_c = self.J_l[:n_contacts].reshape((6 * n_contacts, self.u_dofs))
         return (f_c, J_c)
 
 
@@ -283,6 +422,23 @@ class CompliantHandEmulator(ActuatorEmulator):
     def getCommand(self):
         return np.hstack([self.q_a_ref, self.q_d_ref])
 
+    def getState(self):
+        """
+        Returns the internal state of the emulator that is not part of the simulator state
+        (the actuator references and the virtual contacts), as a picklable dict
+        """
+        return {'q_a_ref': self.q_a_ref.tolist(),
+                'q_d_ref': self.q_d_ref.tolist(),
+                'virtual_contacts': dict(self.virtual_contacts),
+                'virtual_wrenches': dict(self.virtual_wrenches)}
+
+    def setState(self, state):
+        """Restores a state returned by getState"""
+        self.q_a_ref = np.array(state['q_a_ref'])
+        self.q_d_ref = np.array(state['q_d_ref'])
+        self.virtual_contacts = dict(state['virtual_contacts'])
+        self.virtual_wrenches = dict(state['virtual_wrenches'])
+
 
     def process(self, commands, dt):
         if commands:
@@ -305,7 +461,7 @@ class CompliantHandEmulator(ActuatorEmulator):
     def substep(self, dt):
         torque, qdes = self.output()
         #qdes = np.array(self.sim.getActualConfig(self.robotindex))
-        qdes[[self.q_to_t[d_id] for d_id in self.d_to_n]] = self.q_d_ref
+        qdes[self.d_cols] = self.q_d_ref
         #dqdes = self.sim.getActualVelocity(self.robotindex)
         dqdes = self.controller.getCommandedVelocity()
         self.controller.setPIDCommand(qdes, dqdes, torque)
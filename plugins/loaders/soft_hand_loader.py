@@ -4,19 +4,50 @@ import argparse
 from lxml import etree
 
 class SoftHandLoader(object):
+    """Reads the transmission parameters and the joint to link map of a soft hand URDF.
+
+    The revolute joints are indexed by name, child link and parent link in a single
+    pass over the URDF, so that every lookup is a dictionary access.
+    """
     def __init__(self,filename):
         self.handParameters = dict()
         self.jointToLink = dict()
 
         self.urdf = etree.fromstring(file(filename).read())
 
-        for transmission_el in self.urdf.iter('transmission'):
-            for transmission_type_el in transmission_el.iter('type'):
-                if isinstance(transmission_type_el.tag, basestring):
-                    if transmission_type_el.text == 'transmission_interface/AdaptiveSynergyTransmission':
-                        self.handParameters = self.parseTransmission(transmission_el)
+        # revolute joint name -> child link, parent link -> joint name, child link -> joint name
+        # (the first joint in the file wins, as in a linear search)
+        self.jointChild = dict()
+        self.parentToJoint = dict()
+        self.childToJoint = dict()
+
+        for el in self.urdf.iter():
+            if not isinstance(el.tag, basestring):
+                continue
+            if el.tag == 'transmission':
+                for transmission_type_el in el.iter('type'):
+                    if isinstance(transmission_type_el.tag, basestring):
+                        if transmission_type_el.text == 'transmission_interface/AdaptiveSynergyTransmission':
+                            self.handParameters = self.parseTransmission(el)
+            elif el.tag == 'joint' and el.get('type') == 'revolute':
+                self.indexJoint(el)
 
         self.jointToLink = self.parseJointToLink()
+        # link -> joint position, the inverse of jointToLink used by phalanxToJoint
+        self.linkToJoint = dict()
+        for joint_name,link_name in self.jointToLink.iteritems():
+            self.linkToJoint.setdefault(link_name, joint_name.split('_')[3])
+
+    def indexJoint(self, joint_el):
+        joint_name = joint_el.get('name')
+        for child_link_el in joint_el.iter('child'):
+            if 'link' in child_link_el.keys():
+                self.jointChild.setdefault(joint_name, child_link_el.get('link'))
+                self.childToJoint.setdefault(child_link_el.get('link'), joint_name)
+                break
+        for parent_link_el in joint_el.iter('parent'):
+            if 'link' in parent_link_el.keys():
+                self.parentToJoint.setdefault(parent_link_el.get('link'), joint_name)
 
     def parseTransmission(self, transmission_el):
         handParams = dict()
@@ -34,45 +65,30 @@ class SoftHandLoader(object):
 
     def parseJointToLink(self):
         jointToLink = dict()
-        for joint_el in self.urdf.iter('joint'):
-            if isinstance(joint_el.tag, basestring):
-                if 'type' in joint_el.keys() and joint_el.get('type') == 'revolute':
-                    joint_name = joint_el.get('name')
-                    is_mimic = (joint_name.split('_')[-1]=='mimic')
-                    if is_mimic:
-                        continue
-                    jointToLink[joint_name] = self.parseJointChildLink(joint_name)
+        for joint_name in self.jointChild.iterkeys():
+            is_mimic = (joint_name.split('_')[-1]=='mimic')
+            if is_mimic:
+                continue
+            jointToLink[joint_name] = self.parseJointChildLink(joint_name)
         return jointToLink
 
-
     def parseJointChildLink(self,joint_name):
-        for joint_el in self.urdf.iter('joint'):
-            if isinstance(joint_el.tag, basestring):
-                if 'name' in joint_el.keys() and joint_el.get('name') == joint_name:
-                    if 'type' in joint_el.keys() and joint_el.get('type') == 'revolute':
-                        for child_link_el in joint_el.iter('child'):
-                            if isinstance(joint_el.tag, basestring):
-                                if 'link' in child_link_el.keys():
-                                    link_name = child_link_el.get('link')
-                                    _,_,_,fake,_ = link_name.split('_')
-                                    is_fake = (fake == 'fake')
-                                    if not is_fake:
-                                        return link_name
-                                    else:
-                                        childLinkChildJoint = self.parseChildWithParentLink(link_name)
-                                        return self.parseJointChildLink(childLinkChildJoint)
+        """Returns the first real (non fake) link below the revolute joint joint_name"""
+        visited = set()
+        while joint_name in self.jointChild and joint_name not in visited:
+            visited.add(joint_name)
+            link_name = self.jointChild[joint_name]
+            _,_,_,fake,_ = link_name.split('_')
+            if fake != 'fake':
+                return link_name
+            joint_name = self.parseChildWithParentLink(link_name)
         raise Exception('could not find child link for joint %s'%joint_name)
 
     def parseChildWithParentLink(self,link_name):
-        for joint_el in self.urdf.iter('joint'):
-            if isinstance(joint_el.tag, basestring):
-                if 'type' in joint_el.keys() and joint_el.get('type') == 'revolute':
-                    for child_link_el in joint_el.iter('parent'):
-                        if isinstance(joint_el.tag, basestring):
-                            if 'link' in child_link_el.keys():
-                                if child_link_el.get('link') == link_name:
-                                    return joint_el.get('name')
-        raise Exception('could not joint with parent link %s'%link_name)
+        try:
+            return self.parentToJoint[link_name]
+        except KeyError:
+            raise Exception('could not joint with parent link %s'%link_name)
 
 
     def jointToPhalanx(self, finger, joint_position):
@@ -80,12 +96,10 @@ class SoftHandLoader(object):
         return phalanx
 
     def phalanxToJoint(self, finger, phalanx):
-        for key,val in self.jointToLink.iteritems():
-            if val == 'soft_hand_%s_%s_link'%(finger,phalanx):
-                joint_name = key.split('_')[3]
-                return joint_name
-
-        raise Exception('could not find parent joint for link soft_hand_%s_%s_link'%(finger,phalanx))
+        try:
+            return self.linkToJoint['soft_hand_%s_%s_link'%(finger,phalanx)]
+        except KeyError:
+            raise Exception('could not find parent joint for link soft_hand_%s_%s_link'%(finger,phalanx))
 
 
 if __name__ == '__main__':
@@ -1,5 +1,4 @@
 from klampt import *
-from klampt.vis.glrobotprogram import *
 import numpy as np
 from actuators.CompliantHandEmulator import CompliantHandEmulator
 
@@ -90,6 +89,11 @@ class HandEmulator(CompliantHandEmulator):
                 print "Link name (id):", self.world.getName(link_id), "(%d)"%link_id
         """
 
+    cached_parameters = CompliantHandEmulator.cached_parameters + ['n_fingers', 'u_dofs_per_finger']
+
+    def handModelFiles(self):
+        return [klampt_model_name]
+
     def loadHandParameters(self):
         global klampt_model_name, gripper_name
 
@@ -202,157 +206,9 @@ class HandEmulator(CompliantHandEmulator):
     def getCommand(self):
         return np.hstack([1.0 - self.sigma_offset - self.q_a_ref, self.q_d_ref])
 
-class HandSimGLViewer(GLSimulationProgram):
-    def __init__(self,world,base_link=0,base_driver=0):
-        GLSimulationProgram.__init__(self,world,"Reflex simulation program")
-        self.handsim = HandEmulator(self.sim,0,base_link,base_driver)
-        self.sim.addEmulator(0,self.handsim)
-        self.control_dt = 0.01
-
-    def control_loop(self):
-        #external control loop
-        #print "Time",self.sim.getTime()
-        return
-
-    def display(self):
-        GLSimulationProgram.display(self)
-
-        #draw forces
-        glDisable(GL_LIGHTING)
-        glDisable(GL_DEPTH_TEST)
-        glLineWidth(4.0)
-        glBegin(GL_LINES)
-        for l_id in self.handsim.virtual_contacts:
-            glColor3f(0,1,0)
-            forcelen = 0.1
-            l = self.handsim.robot.link(self.handsim.l_to_i[l_id])
-            b = self.sim.body(l)
-            com = l.getMass().getCom()
-            f = self.handsim.virtual_wrenches[l_id][0:3]
-            glVertex3f(*se3.apply(b.getTransform(), com))
-            glVertex3f(*se3.apply(b.getTransform(), vectorops.madd(com,f,forcelen)))
-            """
-            # draw local link frame
-            for color in {(1, 0, 0), (0, 1, 0), (0, 0, 1)}:
-                glColor3f(*color)
-                glVertex3f(*se3.apply(b.getTransform(), com))
-                glVertex3f(*se3.apply(b.getTransform(), vectorops.madd(com, color, 0.1)))
-            """
-        glEnd()
-        glLineWidth(1)
-        glEnable(GL_DEPTH_TEST)
-        glEnable(GL_LIGHTING)
-
-    def idle(self):
-        if self.simulate:
-            for l_id in self.handsim.virtual_contacts:
-                glColor3f(0, 1, 0)
-                l = self.handsim.robot.link(self.handsim.l_to_i[l_id])
-                b = self.sim.body(l)
-                f = self.handsim.virtual_wrenches[l_id][0:3]
-                com = l.getMass().getCom()
-                b.applyForceAtLocalPoint(se3.apply_rotation(b.getTransform(),50*f),com) # could also use applyWrench with moment=[0,0,0]
-            self.control_loop()
-            self.sim.simulate(self.control_dt)
-
-    def print_help(self):
-        GLSimulationProgram.print_help()
-        print "y/h: raise/lower finger 1 command"
-        print "u/j: raise/lower finger 2 command"
-        print "i/k: raise/lower finger 3 command"
-        print "o/l: raise/lower preshape command"
-        print "e/d: activate/deactivate virtual force at finger 1 distal phalanx"
-        print "r/f: activate/deactivate virtual force at finger 2 distal phalanx"
-        print "t/g: activate/deactivate virtual force at finger 3 distal phalanx"
-
-    def keyboardfunc(self,c,x,y):
-        #Put your keyboard handler here
-        #the current example toggles simulation / movie mode
-        pl = self.handsim.model.proximal_links
-        l2i = self.handsim.l_to_i
-        link_index_to_id = {y: x for x, y in l2i.iteritems()}
-        finger1_l_id, finger2_l_id, finger3_l_id = [link_index_to_id[index] for index in pl]
-        force_at_com = [0, 0, -5.0]
-        wrench_at_base = dict()
-        for l_id in [finger1_l_id, finger2_l_id, finger3_l_id]:
-            l = self.handsim.robot.link(self.handsim.l_to_i[l_id])
-            b = self.sim.body(l)
-            com = np.array(l.getMass().getCom())
-            # m_b = m_com + f_com x com_b
-            # com_b = -b_com = -com
-            wrench_at_base[l_id] = tuple(force_at_com) + vectorops.cross(-com, force_at_com)
-
-        if c=='y':
-            u = self.handsim.getCommand()
-            u[0] += 0.01
-            self.handsim.setCommand(u)
-        elif c=='h':
-            u = self.handsim.getCommand()
-            u[0] -= 0.01
-            self.handsim.setCommand(u)
-        elif c=='u':
-            u = self.handsim.getCommand()
-            u[1] += 0.01
-            self.handsim.setCommand(u)
-        elif c=='j':
-            u = self.handsim.getCommand()
-            u[1] -= 0.01
-            self.handsim.setCommand(u)
-        elif c=='i':
-            u = self.handsim.getCommand()
-            u[2] += 0.01
-            self.handsim.setCommand(u)
-        elif c=='k':
-            u = self.handsim.getCommand()
-            u[2] -= 0.01
-            self.handsim.setCommand(u)
-        elif c=='o':
-            u = self.handsim.getCommand()
-            u[3] += 0.01
-            self.handsim.setCommand(u)
-        elif c=='l':
-            u = self.handsim.getCommand()
-            u[3] -= 0.01
-            self.handsim.setCommand(u)
-        elif c == 'e':
-            self.handsim.virtual_contacts[finger1_l_id] = True
-            self.handsim.virtual_wrenches[finger1_l_id] = np.array(wrench_at_base[finger1_l_id])
-        elif c == 'd':
-            if self.handsim.virtual_contacts.has_key(finger1_l_id):
-                self.handsim.virtual_contacts.pop(finger1_l_id)
-            if self.handsim.virtual_wrenches.has_key(finger1_l_id):
-                self.handsim.virtual_wrenches.pop(finger1_l_id)
-        elif c == 'r':
-            self.handsim.virtual_contacts[finger2_l_id] = True
-            self.handsim.virtual_wrenches[finger2_l_id] = np.array(wrench_at_base[finger2_l_id])
-        elif c == 'f':
-            if self.handsim.virtual_contacts.has_key(finger2_l_id):
-                self.handsim.virtual_contacts.pop(finger2_l_id)
-            if self.handsim.virtual_wrenches.has_key(finger2_l_id):
-                self.handsim.virtual_wrenches.pop(finger2_l_id)
-        elif c == 't':
-            self.handsim.virtual_contacts[finger3_l_id] = True
-            self.handsim.virtual_wrenches[finger3_l_id] = np.array(wrench_at_base[finger3_l_id])
-        elif c == 'g':
-            if self.handsim.virtual_contacts.has_key(finger3_l_id):
-                self.handsim.virtual_contacts.pop(finger3_l_id)
-            if self.handsim.virtual_wrenches.has_key(finger3_l_id):
-                self.handsim.virtual_wrenches.pop(finger3_l_id)
-        else:
-            GLSimulationProgram.keyboardfunc(self,c,x,y)
-
-        
+
 if __name__=='__main__':
-    world = WorldModel()
-    if len(sys.argv) == 2:
-        if not world.readFile(sys.argv[1]):
-            print "Could not load Reflex hand from", sys.argv[1]
-            exit(1)
-    else:
-        if not world.readFile(klampt_model_name):
-            print "Could not load Reflex hand from", klampt_model_name
-            exit(1)
-    viewer = HandSimGLViewer(world)
-    viewer.run()
-
-    
+    #the OpenGL viewer is kept in reflex_viewer.py, so that the emulator can be
+    #imported without OpenGL
+    import reflex_viewer
+    reflex_viewer.main()
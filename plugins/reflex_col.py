@@ -1,8 +1,8 @@
 from klampt import *
 #Klampt v0.7
 from klampt.math import se3,vectorops
-from klampt.vis.glrobotprogram import *
 from klampt.sim.simulation import ActuatorEmulator
+import math
 #Klampt v0.6.x
 #from klampt import se3,vectorops
 #from klampt.glrobotprogram import *
@@ -48,6 +48,12 @@ swivel_links = [2,7]
 proximal_links = [3,8,12]
 distal_links = [4,9,13]
 
+#tendon stiffness: the tendon force is tendon_c2*x^2+tendon_c1*x for an
+#extension x beyond the rest length, capped at tendon_max_force
+tendon_c2 = 30000.0
+tendon_c1 = 10000.0
+tendon_max_force = 100
+
 def commandToConfig(command):
     """Given a rethink parallel jaw gripper command vector, in the range
     range [0] (closed) to [1] (open), returns the gripper configuration for
@@ -78,6 +84,64 @@ def configToCommand(config):
     fingers = [(config[proximal_links[i]]-proxmax)/(proxmin-proxmax) for i in range(3)]
     return fingers+[preshape]
 
+def _apply(T,p):
+    """se3.apply(T,p) with the rotation unrolled"""
+    R,t = T
+    x,y,z = p
+    return [R[0]*x+R[3]*y+R[6]*z+t[0],R[1]*x+R[4]*y+R[7]*z+t[1],R[2]*x+R[5]*y+R[8]*z+t[2]]
+
+def _unit(x,y,z):
+    """vectorops.unit([x,y,z])"""
+    n = math.sqrt(x*x+y*y+z*z)
+    if n > 1e-5:
+        n = 1.0/n
+        return x*n,y*n,z*n
+    return x,y,z
+
+def tendon_force(T0,T1,T2,rest_length,tendon0_local,tendon1_local,tendon2_local):
+    """Evaluates the tendon model of one finger.
+
+    Arguments:
+    - T0, T1, T2: the transforms of the hand base body, and of the proximal and
+      distal bodies of the finger
+    - rest_length: the tendon rest length
+    - tendon0_local, tendon1_local: the tendon attachment points on the proximal
+      body, and tendon2_local the one on the distal body (local coordinates)
+
+    Returns None if the tendon is slack, otherwise (f0,p0,f1,f2), where the forces are:
+    - f0 on the base body, at the point p0
+    - f1 on the proximal body at tendon1_local, and -f1 at tendon0_local
+    - -f2 on the distal body at tendon2_local
+
+    The vector operations are written out: on 3-vectors, this is several times
+    faster than the klampt.math functions or NumPy.
+    """
+    p0w = _apply(T1,tendon0_local)
+    p1w = _apply(T1,tendon1_local)
+    p2w = _apply(T2,tendon2_local)
+    dx,dy,dz = p2w[0]-p1w[0],p2w[1]-p1w[1],p2w[2]-p1w[2]
+    d = math.sqrt(dx*dx+dy*dy+dz*dz)
+    if d <= rest_length:
+        return None
+    dx,dy,dz = _unit(dx,dy,dz)
+    stretch = d - rest_length
+    f = min(tendon_c2*stretch**2+tendon_c1*stretch,tendon_max_force)
+    #tendon routing force
+    sx,sy,sz = _unit(p2w[0]-p0w[0],p2w[1]-p0w[1],p2w[2]-p0w[2])
+    px,py,pz = _unit(p1w[0]-p0w[0],p1w[1]-p0w[1],p1w[2]-p0w[2])
+    #pulley axis: the y axis of the proximal body
+    R1 = T1[0]
+    ax,ay,az = R1[3],R1[4],R1[5]
+    tx,ty,tz = ay*pz-az*py,az*px-ax*pz,ax*py-ay*px
+    cosangle = sx*tx+sy*ty+sz*tz
+    #base direction: the -z axis of the base body
+    R0 = T0[0]
+    bx,by,bz = -R0[6],-R0[7],-R0[8]
+    #note: p0 is a world point, but it is applied as a local point of the base
+    fc = cosangle*f
+    return ([-f*bx,-f*by,-f*bz],[p0w[0]+0.04*bx,p0w[1]+0.04*by,p0w[2]+0.04*bz],
+            [tx*fc,ty*fc,tz*fc],[dx*f,dy*f,dz*f])
+
 class HandModel:
     """A kinematic model of the Reflex hand"""
     def __init__(self,robot,link_offset=0,driver_offset=0):
@@ -172,6 +236,10 @@ class HandEmulator(ActuatorEmulator):
         self.model = HandModel(world.robot(robotindex),link_offset,driver_offset)
         self.setpoint = self.model.getCommand()
         self.endpoint = self.setpoint[:]
+        #the setpoint for which commanded_links was computed, and the (link,value)
+        #pairs of the hand joints commanded by process for that setpoint
+        self.commanded_setpoint = None
+        self.commanded_links = []
         self.speed = [1,1,1,1]
         self.force = [0,0,0,0]
         self.moving = [0,0,0,0]
@@ -186,6 +254,11 @@ class HandEmulator(ActuatorEmulator):
         self.tendon1_local = [0.035,0,0.009]
         self.tendon2_local = [-0.015,0,0.007]
         self.forces = [[None,None,None] for i in range(3)]
+        #bodies acted on by the tendons
+        robot = self.model.robot
+        self.base_body = self.sim.body(robot.link(self.model.proximal_links[0]-3))
+        self.proximal_bodies = [self.sim.body(robot.link(l)) for l in self.model.proximal_links]
+        self.distal_bodies = [self.sim.body(robot.link(l)) for l in self.model.distal_links]
 
     def getCommand(self):
         return self.endpoint
@@ -205,6 +278,22 @@ class HandEmulator(ActuatorEmulator):
     def setPreshape(self,value):
         self.endpoint[3] = max(min(value,1),0)
 
+    def getState(self):
+        """Returns the internal state of the emulator that is not part of the
+        simulator state, as a picklable dict"""
+        return {'setpoint':self.setpoint[:],'endpoint':self.endpoint[:],
+                'speed':list(self.speed),'force':list(self.force),'moving':list(self.moving)}
+
+    def setState(self,state):
+        """Restores a state returned by getState"""
+        self.setpoint = list(state['setpoint'])
+        self.endpoint = list(state['endpoint'])
+        self.speed = list(state['speed'])
+        self.force = list(state['force'])
+        self.moving = list(state['moving'])
+        #the commanded links are recomputed by the next process call
+        self.commanded_setpoint = None
+
     def update_tendon_lengths(self):
         #drive system:
         #find deviation between commanded and actual on proximal joint, use
@@ -238,69 +327,56 @@ class HandEmulator(ActuatorEmulator):
                 self.setpoint[i] = max(self.setpoint[i]-speed*dt,self.endpoint[i])
             elif self.endpoint[i] > self.setpoint[i]:
                 self.setpoint[i] = min(self.setpoint[i]+speed*dt,self.endpoint[i])
-        self.model.setCommand(self.setpoint)
-        q = self.model.robot.getConfig()
+        if self.setpoint != self.commanded_setpoint:
+            self.update_commanded_links()
         qcmd = self.controller.getCommandedConfig()
-        qcmd[self.model.swivel_links[0]] = q[self.model.swivel_links[0]]
-        qcmd[self.model.swivel_links[1]] = q[self.model.swivel_links[1]]
-        qcmd[self.model.proximal_links[0]] = q[self.model.proximal_links[0]]
-        qcmd[self.model.proximal_links[1]] = q[self.model.proximal_links[1]]
-        qcmd[self.model.proximal_links[2]] = q[self.model.proximal_links[2]]
-        qcmd[self.model.distal_links[0]] = 0
-        qcmd[self.model.distal_links[1]] = 0
-        qcmd[self.model.distal_links[2]] = 0
-        vcmd = self.controller.getCommandedVelocity()
+        changed = False
+        for (l,v) in self.commanded_links:
+            if qcmd[l] != v:
+                qcmd[l] = v
+                changed = True
         #print "Hand commanded q / retrieved q:"
         #for (a,b) in zip(qcmd,self.controller.getCommandedConfig()):
         #    print "  ",a,b
-        if qcmd != self.controller.getCommandedConfig():
+        if changed:
             #allow queued movements for other joints if fingers are stopped
+            vcmd = self.controller.getCommandedVelocity()
             self.controller.setPIDCommand(qcmd,vcmd)
-        
+
+    def update_commanded_links(self):
+        """Computes the commanded hand joint values for the current setpoint,
+        using the robot model.  Only needs to be called when the setpoint changes."""
+        self.model.setCommand(self.setpoint)
+        q = self.model.robot.getConfig()
+        self.commanded_links = [(l,q[l]) for l in self.model.swivel_links + self.model.proximal_links]
+        self.commanded_links += [(l,0) for l in self.model.distal_links]
+        self.commanded_setpoint = self.setpoint[:]
+
     def substep(self,dt):
         #apply forces associated with tendon
-        self.model.setCommand(self.setpoint)
         self.update_tendon_lengths()
+        self.apply_tendon_forces()
+
+    def apply_tendon_forces(self):
+        T0 = self.base_body.getTransform()
         for i in range(3):
-            self.apply_tendon_forces(i,self.model.proximal_links[i],self.model.distal_links[i],self.tendon_lengths[i])
-
-    def apply_tendon_forces(self,i,link1,link2,rest_length):
-        tendon_c2 = 30000.0
-        tendon_c1 = 10000.0
-        b0 = self.sim.body(self.model.robot.link(self.model.proximal_links[0]-3))
-        b1 = self.sim.body(self.model.robot.link(link1))
-        b2 = self.sim.body(self.model.robot.link(link2))
-        p0w = se3.apply(b1.getTransform(),self.tendon0_local)
-        p1w = se3.apply(b1.getTransform(),self.tendon1_local)
-        p2w = se3.apply(b2.getTransform(),self.tendon2_local)
-
-        d = vectorops.distance(p1w,p2w)
-        if d > rest_length:
-            #apply tendon force
-            direction = vectorops.unit(vectorops.sub(p2w,p1w))
-            f = tendon_c2*(d - rest_length)**2+tendon_c1*(d - rest_length)
-            #print d,rest_length
-            #print "Force magnitude",self.model.robot.link(link1).getName(),":",f
-            f = min(f,100)
-            #tendon routing force
-            straight = vectorops.unit(vectorops.sub(p2w,p0w))
-            pulley_direction = vectorops.unit(vectorops.sub(p1w,p0w))
-            pulley_axis = so3.apply(b1.getTransform()[0],(0,1,0))
-            tangential_axis = vectorops.cross(pulley_axis,pulley_direction)
-            cosangle = vectorops.dot(straight,tangential_axis)
-            #print "Cosine angle",self.model.robot.link(link1).getName(),cosangle
-            base_direction = so3.apply(b0.getTransform()[0],[0,0,-1])
-            b0.applyForceAtLocalPoint(vectorops.mul(base_direction,-f),vectorops.madd(p0w,base_direction,0.04))
-            b1.applyForceAtLocalPoint(vectorops.mul(tangential_axis,cosangle*f),self.tendon1_local)
-            b1.applyForceAtLocalPoint(vectorops.mul(tangential_axis,-cosangle*f),self.tendon0_local)
-            b2.applyForceAtLocalPoint(vectorops.mul(direction,-f),self.tendon2_local)
-            self.forces[i][1] = vectorops.mul(tangential_axis,cosangle*f)
-            self.forces[i][2] = vectorops.mul(direction,f)
-        else:
-            self.forces[i] = [None,None,None]
+            b1 = self.proximal_bodies[i]
+            b2 = self.distal_bodies[i]
+            res = tendon_force(T0,b1.getTransform(),b2.getTransform(),self.tendon_lengths[i],self.tendon0_local,self.tendon1_local,self.tendon2_local)
+            if res is not None:
+                f0,p0,f1,f2 = res
+                self.base_body.applyForceAtLocalPoint(f0,p0)
+                b1.applyForceAtLocalPoint(f1,self.tendon1_local)
+                b1.applyForceAtLocalPoint([-f1[0],-f1[1],-f1[2]],self.tendon0_local)
+                b2.applyForceAtLocalPoint([-f2[0],-f2[1],-f2[2]],self.tendon2_local)
+                self.forces[i][1] = f1
+                self.forces[i][2] = f2
+            else:
+                self.forces[i] = [None,None,None]
         return
 
     def drawGL(self):
+        from OpenGL.GL import glDisable,glEnable,glLineWidth,glColor3f,glBegin,glEnd,glVertex3f,GL_LIGHTING,GL_DEPTH_TEST,GL_LINES
         #draw tendons
         glDisable(GL_LIGHTING)
         glDisable(GL_DEPTH_TEST)
@@ -308,8 +384,8 @@ class HandEmulator(ActuatorEmulator):
         glColor3f(0,1,1)
         glBegin(GL_LINES)
         for i in range(3):
-            b1 = self.sim.body(self.model.robot.link(self.model.proximal_links[i]))
-            b2 = self.sim.body(self.model.robot.link(self.model.distal_links[i]))
+            b1 = self.proximal_bodies[i]
+            b2 = self.distal_bodies[i]
             glVertex3f(*se3.apply(b1.getTransform(),self.tendon0_local))
             glVertex3f(*se3.apply(b1.getTransform(),self.tendon1_local))
             glVertex3f(*se3.apply(b1.getTransform(),self.tendon1_local))
@@ -320,8 +396,8 @@ class HandEmulator(ActuatorEmulator):
         glBegin(GL_LINES)
         fscale = 0.01
         for i in range(3):
-            b1 = self.sim.body(self.model.robot.link(self.model.proximal_links[i]))
-            b2 = self.sim.body(self.model.robot.link(self.model.distal_links[i]))
+            b1 = self.proximal_bodies[i]
+            b2 = self.distal_bodies[i]
             if self.forces[i][0] != None:
                 p = se3.apply(b1.getTransform(),self.tendon0_local)
                 glVertex3f(*p)
@@ -339,80 +415,8 @@ class HandEmulator(ActuatorEmulator):
         glEnable(GL_LIGHTING)
 
 
-class HandSimGLViewer(GLSimulationProgram):
-    def __init__(self,world,base_link=0,base_driver=0):
-        GLSimulationProgram.__init__(self,world,"Reflex simulation program")
-        self.handsim = HandEmulator(self.sim,0,base_link,base_driver)
-        self.sim.addEmulator(0,self.handsim)
-        self.control_dt = 0.01
-
-    def control_loop(self):
-        #external control loop
-        #print "Time",self.sim.getTime()
-        return
-
-    def idle(self):
-        if self.simulate:
-            self.control_loop()
-            self.sim.simulate(self.control_dt)
-            glutPostRedisplay()
-
-    def print_help(self):
-        GLSimulationProgram.print_help()
-        print "y/h: raise/lower finger 1 command"
-        print "u/j: raise/lower finger 2 command"
-        print "i/k: raise/lower finger 3 command"
-        print "o/l: raise/lower preshape command"
-
-    def keyboardfunc(self,c,x,y):
-        #Put your keyboard handler here
-        #the current example toggles simulation / movie mode
-        if c=='y':
-            u = self.handsim.getCommand()
-            u[0] += 0.1
-            self.handsim.setCommand(u)
-        elif c=='h':
-            u = self.handsim.getCommand()
-            u[0] -= 0.1
-            self.handsim.setCommand(u)
-        elif c=='u':
-            u = self.handsim.getCommand()
-            u[1] += 0.1
-            self.handsim.setCommand(u)
-        elif c=='j':
-            u = self.handsim.getCommand()
-            u[1] -= 0.1
-            self.handsim.setCommand(u)
-        elif c=='i':
-            u = self.handsim.getCommand()
-            u[2] += 0.1
-            self.handsim.setCommand(u)
-        elif c=='k':
-            u = self.handsim.getCommand()
-            u[2] -= 0.1
-            self.handsim.setCommand(u)
-        elif c=='o':
-            u = self.handsim.getCommand()
-            u[3] += 0.1
-            self.handsim.setCommand(u)
-        elif c=='l':
-            u = self.handsim.getCommand()
-            u[3] -= 0.1
-            self.handsim.setCommand(u)
-        else:
-            GLSimulationProgram.keyboardfunc(self,c,x,y)
-        glutPostRedisplay()
-
-
-
-        
 if __name__=='__main__':
-    global klampt_model_name
-    world = WorldModel()
-    if not world.readFile(klampt_model_name):
-        print "Could not load Reflex hand from",klampt_model_name
-        exit(1)
-    viewer = HandSimGLViewer(world)
-    viewer.run()
-
-    
+    #the OpenGL viewer is kept in reflex_col_viewer.py, so that the emulator can be
+    #imported without OpenGL
+    import reflex_col_viewer
+    reflex_col_viewer.main()
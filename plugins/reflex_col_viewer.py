@@ -0,0 +1,86 @@
+"""An OpenGL viewer for interactively simulating the reflex_col hand emulator in
+reflex_col.py.
+
+Usage: python plugins/reflex_col_viewer.py
+"""
+
+from klampt import *
+from klampt.vis.glrobotprogram import *
+from reflex_col import *
+import sys
+
+class HandSimGLViewer(GLSimulationProgram):
+    def __init__(self,world,base_link=0,base_driver=0):
+        GLSimulationProgram.__init__(self,world,"Reflex simulation program")
+        self.handsim = HandEmulator(self.sim,0,base_link,base_driver)
+        self.sim.addEmulator(0,self.handsim)
+        self.control_dt = 0.01
+
+    def control_loop(self):
+        #external control loop
+        #print "Time",self.sim.getTime()
+        return
+
+    def idle(self):
+        if self.simulate:
+            self.control_loop()
+            self.sim.simulate(self.control_dt)
+            glutPostRedisplay()
+
+    def print_help(self):
+        GLSimulationProgram.print_help()
+        print "y/h: raise/lower finger 1 command"
+        print "u/j: raise/lower finger 2 command"
+        print "i/k: raise/lower finger 3 command"
+        print "o/l: raise/lower preshape command"
+
+    def keyboardfunc(self,c,x,y):
+        #Put your keyboard handler here
+        #the current example toggles simulation / movie mode
+        if c=='y':
+            u = self.handsim.getCommand()
+            u[0] += 0.1
+            self.handsim.setCommand(u)
+        elif c=='h':
+            u = self.handsim.getCommand()
+            u[0] -= 0.1
+            self.handsim.setCommand(u)
+        elif c=='u':
+            u = self.handsim.getCommand()
+            u[1] += 0.1
+            self.handsim.setCommand(u)
+        elif c=='j':
+            u = self.handsim.getCommand()
+            u[1] -= 0.1
+            self.handsim.setCommand(u)
+        elif c=='i':
+            u = self.handsim.getCommand()
+            u[2] += 0.1
+            self.handsim.setCommand(u)
+        elif c=='k':
+            u = self.handsim.getCommand()
+            u[2] -= 0.1
+            self.handsim.setCommand(u)
+        elif c=='o':
+            u = self.handsim.getCommand()
+            u[3] += 0.1
+            self.handsim.setCommand(u)
+        elif c=='l':
+            u = self.handsim.getCommand()
+            u[3] -= 0.1
+            self.handsim.setCommand(u)
+        else:
+            GLSimulationProgram.keyboardfunc(self,c,x,y)
+        glutPostRedisplay()
+
+
+def main():
+    world = WorldModel()
+    if not world.readFile(klampt_model_name):
+        print "Could not load Reflex hand from",klampt_model_name
+        exit(1)
+    viewer = HandSimGLViewer(world)
+    viewer.run()
+
+if __name__ == '__main__':
+    main()
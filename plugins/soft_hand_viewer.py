@@ -0,0 +1,111 @@
+"""An OpenGL viewer for interactively simulating the soft_hand hand emulator in
+soft_hand.py.
+
+Usage: python plugins/soft_hand_viewer.py [model file]
+"""
+
+from klampt import *
+from klampt.vis.glrobotprogram import *
+from soft_hand import *
+import sys
+
+class HandSimGLViewer(GLSimulationProgram):
+    def __init__(self,world,base_link=0,base_driver=0):
+        GLSimulationProgram.__init__(self,world,"Reflex simulation program")
+        self.handsim = HandEmulator(self.sim,0,base_link,base_driver)
+        self.sim.addEmulator(0,self.handsim)
+        self.control_dt = 0.01
+
+    def control_loop(self):
+        #external control loop
+        #print "Time",self.sim.getTime()
+        return
+
+    def display(self):
+        GLSimulationProgram.display(self)
+
+        #draw forces
+        glDisable(GL_LIGHTING)
+        glDisable(GL_DEPTH_TEST)
+        glLineWidth(4.0)
+        glBegin(GL_LINES)
+        for l_id in self.handsim.virtual_contacts:
+            glColor3f(0,1,0)
+            forcelen = 0.1
+            l = self.handsim.robot.link(self.handsim.l_to_i[l_id])
+            b = self.sim.body(l)
+            p = [0,0,0]
+            f = self.handsim.virtual_wrenches[l_id][0:3]
+            glVertex3f(*se3.apply(b.getTransform(), p))
+            glVertex3f(*se3.apply(b.getTransform(), vectorops.madd(p,f,forcelen)))
+            """
+            # draw local link frame
+            for color in {(1, 0, 0), (0, 1, 0), (0, 0, 1)}:
+                glColor3f(*color)
+                glVertex3f(*se3.apply(b.getTransform(), p))
+                glVertex3f(*se3.apply(b.getTransform(), vectorops.madd(p, color, 0.1)))
+            """
+        glEnd()
+
+        glLineWidth(1)
+        glEnable(GL_DEPTH_TEST)
+        glEnable(GL_LIGHTING)
+
+    def idle(self):
+        if self.simulate:
+            for l_id in self.handsim.virtual_contacts:
+                glColor3f(0, 1, 0)
+                l = self.handsim.robot.link(self.handsim.l_to_i[l_id])
+                b = self.sim.body(l)
+                f = self.handsim.virtual_wrenches[l_id][0:3]
+                p = [0,0,0]
+                b.applyForceAtLocalPoint(se3.apply_rotation(b.getTransform(),f),p)
+            self.control_loop()
+            self.sim.simulate(self.control_dt)
+
+    def print_help(self):
+        GLSimulationProgram.print_help()
+        print "o/l: increase/decrease synergy command"
+        print "q/a: activate/deactivate virtual force at index distal phalanx"
+
+    def keyboardfunc(self, c, x, y):
+        # Put your keyboard handler here
+        # the current example toggles simulation / movie mode
+        index_distal_jid = self.handsim.hand['index']['distal']
+        index_distal_uid = self.handsim.n_to_u[index_distal_jid]
+        index_distal_id = self.handsim.u_to_l[index_distal_uid]
+        if c == 'o':
+            u = self.handsim.getCommand()
+            u[0] += 0.1
+            self.handsim.setCommand(u)
+        elif c == 'l':
+            u = self.handsim.getCommand()
+            u[0] -= 0.1
+            self.handsim.setCommand(u)
+        elif c == 'q':
+            self.handsim.virtual_contacts[index_distal_id] = True
+            self.handsim.virtual_wrenches[index_distal_id] = np.array([0,0.0,-5.0,0,0,0])
+        elif c == 'a':
+            if self.handsim.virtual_contacts.has_key(index_distal_id):
+                self.handsim.virtual_contacts.pop(index_distal_id)
+            if self.handsim.virtual_wrenches.has_key(index_distal_id):
+                self.handsim.virtual_wrenches.pop(index_distal_id)
+        else:
+            GLSimulationProgram.keyboardfunc(self, c, x, y)
+
+
+def main():
+    world = WorldModel()
+    if len(sys.argv) == 2:
+        if not world.readFile(sys.argv[1]):
+            print "Could not load SoftHand hand from", sys.argv[1]
+            exit(1)
+    else:
+        if not world.readFile(klampt_model_name):
+            print "Could not load SoftHand hand from", klampt_model_name
+            exit(1)
+    viewer = HandSimGLViewer(world)
+    viewer.run()
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,181 @@
+"""Opt-in timing of the components of the simulation step.
+
+When profiling is turned on with configure(), main.setup_simulation wraps
+- simulate: sim.simulate (physics, plus everything the simulator calls)
+- updateWorld: sim.updateWorld
+- controller: the controller returned by the controller module's make()
+- emulator.process, emulator.substep: the hand emulator's process / substep
+and records the latency of every call in a log-spaced histogram.  The times
+are inclusive: simulate contains the controller and emulator calls it
+makes, and the controllers that call hand.process themselves contain it.
+
+Usage:
+	profiling.configure(True)
+	main.launch_simple(...)       #or any run built with main.setup_simulation
+	profiling.report()
+	profiling.export('profile.json')
+
+or from the command line, for a headless trial:
+	python profiling.py [dataset] [object] [robot] [-d duration] [-o profile.json]
+"""
+
+import json
+import math
+import sys
+import time
+import timeit
+
+#histogram bins: bins_per_octave log-spaced bins per doubling from min_time (s)
+min_time = 1e-7
+bins_per_octave = 8
+num_bins = bins_per_octave*32
+
+_enabled = False
+_profiler = None
+
+class Histogram:
+	"""A latency histogram with log-spaced bins, and the count, total and
+	maximum of the recorded latencies"""
+	def __init__(self):
+		self.counts = [0]*num_bins
+		self.count = 0
+		self.total = 0.0
+		self.max = 0.0
+
+	def add(self,t):
+		if t <= min_time:
+			b = 0
+		else:
+			b = min(int(math.log(t/min_time,2)*bins_per_octave),num_bins-1)
+		self.counts[b] += 1
+		self.count += 1
+		self.total += t
+		if t > self.max:
+			self.max = t
+
+	@staticmethod
+	def bin_edge(b):
+		"""Returns the upper edge of bin b, in s"""
+		return min_time*2.0**(float(b+1)/bins_per_octave)
+
+	def percentile(self,p):
+		"""Returns the upper edge of the bin holding the p-th percentile latency
+		(at most the maximum latency), or 0 if nothing was recorded"""
+		if self.count == 0:
+			return 0.0
+		rank = p*0.01*self.count
+		cumulative = 0
+		for b,c in enumerate(self.counts):
+			cumulative += c
+			if cumulative >= rank and c > 0:
+				return min(Histogram.bin_edge(b),self.max)
+		return self.max
+
+	def summary(self):
+		"""Returns a JSON-serializable dict of the statistics and of the nonempty
+		bins, given as [upper edge,count] pairs"""
+		return {'count':self.count,
+				'total':self.total,
+				'mean':self.total/self.count if self.count else 0.0,
+				'p50':self.percentile(50),
+				'p99':self.percentile(99),
+				'max':self.max,
+				'histogram':[[Histogram.bin_edge(b),c] for b,c in enumerate(self.counts) if c > 0]}
+
+class Profiler:
+	"""Per-component latency histograms"""
+	def __init__(self):
+		self.components = dict()
+
+	def histogram(self,name):
+		if name not in self.components:
+			self.components[name] = Histogram()
+		return self.components[name]
+
+	def wrap(self,name,fn):
+		"""Returns a function that calls fn and records its latency under name"""
+		hist = self.histogram(name)
+		timer = timeit.default_timer
+		def timed(*args,**kwargs):
+			t0 = timer()
+			try:
+				return fn(*args,**kwargs)
+			finally:
+				hist.add(timer()-t0)
+		return timed
+
+	def summary(self):
+		return dict((name,h.summary()) for name,h in self.components.iteritems())
+
+def configure(enabled=True):
+	"""Turns profiling on or off for the simulations set up afterwards, and
+	clears the recorded latencies"""
+	global _enabled,_profiler
+	_enabled = enabled
+	_profiler = Profiler() if enabled else None
+
+def enabled():
+	return _enabled
+
+def get():
+	"""Returns the current Profiler, or None if profiling is off"""
+	return _profiler
+
+def instrument(sim,hand,controller):
+	"""Wraps sim.simulate, sim.updateWorld and the process / substep methods of
+	the hand emulator hand with the current Profiler.  Returns the wrapped
+	controller, to be passed to sim.setController."""
+	p = _profiler
+	sim.simulate = p.wrap('simulate',sim.simulate)
+	sim.updateWorld = p.wrap('updateWorld',sim.updateWorld)
+	hand.process = p.wrap('emulator.process',hand.process)
+	hand.substep = p.wrap('emulator.substep',hand.substep)
+	return p.wrap('controller',controller)
+
+def report(out=None):
+	"""Prints the count, mean, p50, p99 and maximum latency of each component"""
+	if _profiler is None:
+		return
+	out = out or sys.stdout
+	out.write("%-18s %8s %10s %10s %10s %10s %10s\n"%('component','calls','total s','mean ms','p50 ms','p99 ms','max ms'))
+	for name,s in sorted(_profiler.summary().iteritems()):
+		out.write("%-18s %8d %10.3f %10.4f %10.4f %10.4f %10.4f\n"%(name,s['count'],s['total'],s['mean']*1000,s['p50']*1000,s['p99']*1000,s['max']*1000))
+
+def export(fn,info=None):
+	"""Writes the per-component statistics and histograms to the JSON file fn,
+	along with the time of export and the dict info (e.g., robot and object
+	names) for trend tracking"""
+	if _profiler is None:
+		return
+	f = open(fn,'w')
+	json.dump({'time':time.time(),'info':info or {},'components':_profiler.summary()},f,indent=1,sort_keys=True)
+	f.close()
+
+if __name__ == '__main__':
+	import argparse
+	import random
+	import headless
+	import main
+	parser = argparse.ArgumentParser(description='Profiles the simulation step of a headless grasping trial')
+	parser.add_argument('dataset',nargs='?',help='object set (default: random), or balls')
+	parser.add_argument('object',nargs='?',help='object name or index (default: random), or number of balls')
+	parser.add_argument('robot',nargs='?',default='soft_hand',help='robot (default: soft_hand)')
+	parser.add_argument('-d','--duration',type=float,default=3.0,help='simulated duration, in s')
+	parser.add_argument('-o','--output',help='JSON file to export the profile to')
+	args = parser.parse_args()
+	dataset = args.dataset or random.choice(main.objects.keys())
+	configure(True)
+	if dataset == 'balls':
+		numballs = int(args.object) if args.object else 10
+		res = headless.run_balls(args.robot,numballs,duration=args.duration)
+	else:
+		objname = args.object
+		if objname is None:
+			objname = random.choice(main.objects[dataset])
+		elif objname.isdigit():
+			objname = main.objects[dataset][int(objname)]
+		res = headless.run_simple(args.robot,dataset,objname,duration=args.duration)
+	print "%s %s/%s: %d steps, %.2f s wall time"%(res['robot'],res['object_set'],res['object'],res['steps'],res['wall_time'])
+	report()
+	if args.output:
+		export(args.output,{'robot':res['robot'],'object_set':res['object_set'],'object':res['object'],'duration':args.duration})
@@ -0,0 +1,242 @@
+"""Records the state of a simulation run into a binary, columnar log.
+
+A recording is a directory holding meta.json and one subdirectory per column.
+Each column is stored as a sequence of .npy chunks of chunk_size steps
+(000000.npy, 000001.npy, ...) which are written once and never modified, so
+a recording can be read with memory mapping while it is being written.
+
+The recorded columns are:
+- time: the simulation time
+- q, dq: the actual configuration and velocity of robot 0
+- objects: the transforms of the rigid objects, as 12 numbers each (the
+  column-major rotation, then the translation)
+- hand.setpoint, hand.endpoint, hand.tendon_lengths, hand.f_a, hand.tau_c,
+  hand.q_a_ref, hand.q_d_ref: the hand emulator state, for the attributes the
+  emulator has
+- takktile: the TakkTile sensor array (3 x 2 x 5) of the Reflex hands
+
+If state_period is given, a snapshot of the simulator state (sim.getState())
+is also saved every state_period steps as states/<step>.state, along with the
+internal state of the hand emulator (hand.getState(), if it has one) as
+states/<step>.hand, from which replay.py can resume the simulation.  The info dict given to the Recorder is
+saved in meta.json; the launch functions use it to describe how to rebuild
+the world.
+
+Usage:
+	rec = Recorder('runs/trial1',sim,hand)
+	while ...:
+		sim.simulate(dt)
+		rec.record()
+	rec.close()
+
+	log = Recording('runs/trial1')
+	log.column('q')        #num_steps x numLinks array
+	log.frame(100)['objects']
+"""
+
+import numpy as np
+import json
+import os
+import glob
+import bisect
+import cPickle as pickle
+from reflex_control import TakkTileBank
+
+#hand emulator attributes recorded, if present
+hand_state_names = ['setpoint','endpoint','tendon_lengths','f_a','tau_c','q_a_ref','q_d_ref']
+
+def _chunk_path(path,name,index):
+	return os.path.join(path,name,'%06d.npy'%(index,))
+
+def _state_path(path,step):
+	return os.path.join(path,'states','%06d.state'%(step,))
+
+def _hand_state_path(path,step):
+	return os.path.join(path,'states','%06d.hand'%(step,))
+
+class Recorder:
+	"""Records the state of sim, and of the hand emulator hand if given, into
+	the directory path every time record() is called.  Steps are buffered in
+	memory and written chunk_size at a time.
+
+	takktile is the TakkTileBank to record (by default, the one shared with
+	the controllers, see TakkTileBank.shared).  The sensors are not recorded if
+	the robot has none.
+
+	If state_period is given, the simulator state is saved every state_period
+	steps, starting with the first.  info is a dict saved in meta.json.
+	"""
+	def __init__(self,path,sim,hand=None,chunk_size=500,takktile=None,state_period=None,info=None):
+		self.path = path
+		self.sim = sim
+		self.hand = hand
+		self.chunk_size = chunk_size
+		self.state_period = state_period
+		self.num_steps = 0
+		self.num_chunks = 0
+		world = sim.world
+		self.robot = world.robot(0)
+		self.object_bodies = [sim.body(world.rigidObject(i)) for i in xrange(world.numRigidObjects())]
+		self.hand_state = []
+		if hand is not None:
+			for name in hand_state_names:
+				if getattr(hand,name,None) is not None:
+					self.hand_state.append(name)
+		self.takktile = takktile if takktile is not None else TakkTileBank.shared(sim)
+		if self.takktile is not None and self.takktile.read() is None:
+			self.takktile = None
+		shapes = [('time',()),
+				  ('q',(self.robot.numLinks(),)),
+				  ('dq',(self.robot.numLinks(),)),
+				  ('objects',(len(self.object_bodies),12))]
+		for name in self.hand_state:
+			shapes.append(('hand.'+name,np.shape(getattr(hand,name))))
+		if self.takktile is not None:
+			shapes.append(('takktile',self.takktile.values.shape))
+		self.columns = [name for (name,shape) in shapes]
+		self.buffers = dict((name,np.zeros((chunk_size,)+shape)) for (name,shape) in shapes)
+		if not os.path.exists(path):
+			os.makedirs(path)
+		for name in self.columns + (['states'] if state_period else []):
+			if not os.path.exists(os.path.join(path,name)):
+				os.mkdir(os.path.join(path,name))
+		self.meta = {'columns':dict((name,list(shape)) for (name,shape) in shapes),
+					 'chunk_size':chunk_size,
+					 'robot':self.robot.getName(),
+					 'objects':[world.rigidObject(i).getName() for i in xrange(world.numRigidObjects())],
+					 'state_period':state_period,
+					 'info':info or {},
+					 'num_steps':0}
+		self.write_meta()
+
+	def record(self):
+		"""Records the current state as the next step"""
+		i = self.num_steps % self.chunk_size
+		b = self.buffers
+		b['time'][i] = self.sim.getTime()
+		b['q'][i] = self.sim.getActualConfig(0)
+		b['dq'][i] = self.sim.getActualVelocity(0)
+		objects = b['objects'][i]
+		for k,body in enumerate(self.object_bodies):
+			R,t = body.getTransform()
+			objects[k,0:9] = R
+			objects[k,9:12] = t
+		for name in self.hand_state:
+			b['hand.'+name][i] = getattr(self.hand,name)
+		if self.takktile is not None:
+			values = self.takktile.read()
+			if values is not None:
+				b['takktile'][i] = values
+		if self.state_period and self.num_steps % self.state_period == 0:
+			self.save_state()
+		self.num_steps += 1
+		if i+1 == self.chunk_size:
+			self.flush()
+
+	def flush(self):
+		"""Writes the buffered steps as a chunk"""
+		n = self.num_steps - self.num_chunks*self.chunk_size
+		if n <= 0:
+			return
+		for name in self.columns:
+			fn = _chunk_path(self.path,name,self.num_chunks)
+			tmp = fn+'.tmp'
+			f = open(tmp,'wb')
+			np.save(f,self.buffers[name][:n])
+			f.close()
+			os.rename(tmp,fn)
+		if n == self.chunk_size:
+			self.num_chunks += 1
+		self.meta['num_steps'] = self.num_steps
+		self.write_meta()
+
+	def save_state(self):
+		"""Saves the simulator state, and the hand emulator state if the emulator
+		has getState(), as the snapshot of the current step"""
+		if self.hand is not None and hasattr(self.hand,'getState'):
+			fn = _hand_state_path(self.path,self.num_steps)
+			f = open(fn+'.tmp','wb')
+			pickle.dump(self.hand.getState(),f,pickle.HIGHEST_PROTOCOL)
+			f.close()
+			os.rename(fn+'.tmp',fn)
+		fn = _state_path(self.path,self.num_steps)
+		f = open(fn+'.tmp','wb')
+		f.write(self.sim.getState())
+		f.close()
+		os.rename(fn+'.tmp',fn)
+
+	def write_meta(self):
+		tmp = os.path.join(self.path,'meta.json.tmp')
+		f = open(tmp,'w')
+		json.dump(self.meta,f,indent=1)
+		f.close()
+		os.rename(tmp,os.path.join(self.path,'meta.json'))
+
+	def close(self):
+		"""Writes the remaining buffered steps.  The last chunk may be partial."""
+		self.flush()
+
+class Recording:
+	"""Reads a recording made by Recorder, memory-mapping its chunks"""
+	def __init__(self,path):
+		self.path = path
+		f = open(os.path.join(path,'meta.json'),'r')
+		self.meta = json.load(f)
+		f.close()
+		self.columns = sorted(self.meta['columns'].keys())
+		self.chunk_size = self.meta['chunk_size']
+		self.objects = self.meta['objects']
+		self.info = self.meta.get('info',{})
+		self.chunks = dict()
+		for name in self.columns:
+			fns = sorted(glob.glob(os.path.join(path,name,'*.npy')))
+			self.chunks[name] = [np.load(fn,mmap_mode='r') for fn in fns]
+		self.num_steps = sum(len(c) for c in self.chunks['time'])
+		self.state_steps = sorted(int(os.path.basename(fn)[:-6]) for fn in glob.glob(os.path.join(path,'states','*.state')))
+
+	def __len__(self):
+		return self.num_steps
+
+	def column(self,name):
+		"""Returns all the steps of a column as one (num_steps x ...) array"""
+		chunks = self.chunks[name]
+		if len(chunks) == 1:
+			return chunks[0]
+		if len(chunks) == 0:
+			return np.zeros((0,)+tuple(self.meta['columns'][name]))
+		return np.concatenate(chunks)
+
+	def frame(self,i):
+		"""Returns a dict from column names to their values at step i"""
+		if i < 0:
+			i += self.num_steps
+		c,j = divmod(i,self.chunk_size)
+		return dict((name,self.chunks[name][c][j]) for name in self.columns)
+
+	def state(self,i):
+		"""Returns (step,state) for the last simulator state snapshot at or before
+		step i, or None if there is none"""
+		k = bisect.bisect_right(self.state_steps,i)
+		if k == 0:
+			return None
+		step = self.state_steps[k-1]
+		f = open(_state_path(self.path,step),'rb')
+		state = f.read()
+		f.close()
+		return (step,state)
+
+	def hand_state(self,step):
+		"""Returns the hand emulator state saved with the snapshot of the given
+		step, or None if there is none"""
+		try:
+			f = open(_hand_state_path(self.path,step),'rb')
+		except IOError:
+			return None
+		state = pickle.load(f)
+		f.close()
+		return state
+
+	def object_transform(self,i,k):
+		"""Returns the transform of object k at step i as a Klamp't (R,t) pair"""
+		T = self.chunks['objects'][i//self.chunk_size][i%self.chunk_size][k]
+		return (T[0:9].tolist(),T[9:12].tolist())
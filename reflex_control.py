@@ -1,43 +1,111 @@
 """Common code for handling the Righthand Robotics ReFlex gripper"""
 
+import numpy as np
+import telemetry
+
+class TakkTileBank:
+	"""The 30 TakkTile contact sensors of the ReFlex, read together into a
+	fingers x segments x taxels (3 x 2 x 5) array.  Segment 0 is the proximal
+	link and segment 1 the distal link of each finger.
+
+	The sensors are looked up once.  read() polls them at most once per
+	simulation time step, and at most once every period seconds of simulated
+	time if period is nonzero, so that several consumers in the same control
+	tick share one reading.
+	"""
+	segments = ['proximal','distal']
+	def __init__(self,sim,robotindex=0,period=0):
+		self.sim = sim
+		self.period = period
+		controller = sim.controller(robotindex)
+		#(not properly functioning in 0.6.x)
+		self.sensors = [controller.sensor("f%d_%s_takktile_%d"%(f,seg,i)) for f in range(1,4) for seg in self.segments for i in range(1,6)]
+		self.values = np.zeros((3,len(self.segments),5))
+		#the sensors are read into scratch, so that a failed read leaves values intact
+		self.scratch = np.zeros(self.values.shape)
+		self.time = None
+
+	@staticmethod
+	def available(sim,robotindex=0):
+		"""Returns True if the robot has the TakkTile sensors (the Reflex hands
+		do, the soft hand does not).  Only the first sensor is looked up."""
+		name = "f1_%s_takktile_1"%(TakkTileBank.segments[0],)
+		return sim.controller(robotindex).sensor(name).name() == name
+
+	@staticmethod
+	def shared(sim,robotindex=0):
+		"""Returns the TakkTileBank of robot robotindex shared by all the users of
+		sim (controllers, recorders), so that the sensors are read once per time
+		step.  Returns None if the robot has no TakkTile sensors."""
+		banks = getattr(sim,'takktile_banks',None)
+		if banks is None:
+			banks = sim.takktile_banks = dict()
+		if robotindex not in banks:
+			banks[robotindex] = TakkTileBank(sim,robotindex) if TakkTileBank.available(sim,robotindex) else None
+		return banks[robotindex]
+
+	def read(self):
+		"""Returns the array of sensor values, or None if the sensors can't be read"""
+		t = self.sim.getTime()
+		if self.time is not None and (t == self.time or t < self.time + self.period):
+			return self.values
+		flat = self.scratch.reshape(-1)
+		try:
+			for i,s in enumerate(self.sensors):
+				flat[i] = s.getMeasurements()[0]
+		except Exception:
+			return None
+		self.values[...] = self.scratch
+		self.time = t
+		return self.values
+
+	def log(self,channel):
+		"""Logs the sensor values on the given telemetry channel, if the channel
+		is not rate limited at the current time"""
+		t = self.sim.getTime()
+		if channel.active(t) and self.read() is not None:
+			channel.log(t,"finger 1: %s, finger 2: %s, finger 3: %s",*[[int(v) for v in self.finger(i)] for i in range(3)])
+
+	def finger(self,i):
+		"""Returns the 10 latest values of finger i (0-2), proximal taxels first,
+		as a flat array"""
+		return self.values[i].reshape(-1)
+
 class ReflexController:
 	"""A controller that simply provides convenient accesss to the ReFlex's contact sensors.
-	It will print out contact sensor readings every type __call__ is called if verbose is set to True.
+	It will log contact sensor readings on the 'contact' telemetry channel when __call__ is
+	called if verbose is set to True.  self.takktile is None if the robot has no TakkTile
+	sensors.
 	"""
 	def __init__(self,sim,hand,dt):
 		self.sim = sim
 		self.hand = hand
 		self.dt = dt
 
-		#get references to the robot's sensors (not properly functioning in 0.6.x)
-		self.f1_proximal_takktile_sensors = [sim.controller(0).sensor("f1_proximal_takktile_%d"%(i,)) for i in range(1,6)]
-		self.f1_distal_takktile_sensors = [sim.controller(0).sensor("f1_distal_takktile_%d"%(i,)) for i in range(1,6)]
-		self.f2_proximal_takktile_sensors = [sim.controller(0).sensor("f2_proximal_takktile_%d"%(i,)) for i in range(1,6)]
-		self.f2_distal_takktile_sensors = [sim.controller(0).sensor("f2_distal_takktile_%d"%(i,)) for i in range(1,6)]
-		self.f3_proximal_takktile_sensors = [sim.controller(0).sensor("f3_proximal_takktile_%d"%(i,)) for i in range(1,6)]
-		self.f3_distal_takktile_sensors = [sim.controller(0).sensor("f3_distal_takktile_%d"%(i,)) for i in range(1,6)]
-		self.contact_sensors = self.f1_proximal_takktile_sensors + self.f1_distal_takktile_sensors + self.f2_proximal_takktile_sensors + self.f2_distal_takktile_sensors + self.f3_proximal_takktile_sensors + self.f3_distal_takktile_sensors
+		#get references to the robot's sensors (not properly functioning in 0.6.x),
+		#if it has them
+		self.takktile = TakkTileBank.shared(sim)
+		self.contact_sensors = self.takktile.sensors if self.takktile is not None else []
+		self.f1_proximal_takktile_sensors = self.contact_sensors[0:5]
+		self.f1_distal_takktile_sensors = self.contact_sensors[5:10]
+		self.f2_proximal_takktile_sensors = self.contact_sensors[10:15]
+		self.f2_distal_takktile_sensors = self.contact_sensors[15:20]
+		self.f3_proximal_takktile_sensors = self.contact_sensors[20:25]
+		self.f3_distal_takktile_sensors = self.contact_sensors[25:30]
 
+		self.contact_log = telemetry.channel('contact')
 		self.verbose = False 
 
 	def contact_measurements(self):
-		try:
-			f1_contact = [s.getMeasurements()[0] for s in self.f1_proximal_takktile_sensors] + [s.getMeasurements()[0] for s in self.f1_distal_takktile_sensors]
-			f2_contact = [s.getMeasurements()[0] for s in self.f2_proximal_takktile_sensors] + [s.getMeasurements()[0] for s in self.f2_distal_takktile_sensors]
-			f3_contact = [s.getMeasurements()[0] for s in self.f3_proximal_takktile_sensors] + [s.getMeasurements()[0] for s in self.f3_distal_takktile_sensors]
-			return [f1_contact,f2_contact,f3_contact]
-		except:
+		"""Returns the contact sensor values of each finger as 3 lists of 10 values
+		(proximal taxels first), or None if the sensors can't be read.  Use
+		self.takktile.read() to get them as an array instead."""
+		if self.takktile is None or self.takktile.read() is None:
 			return None
+		return [self.takktile.finger(i).tolist() for i in range(3)]
 
 	def __call__(self,controller):
-		if self.verbose: 
-			try:
-				f1_contact,f2_contact,f3_contact = self.contact_measurements()
-				print "Contact sensors"
-				print "  finger 1:",[int(v) for v in f1_contact]
-				print "  finger 2:",[int(v) for v in f2_contact]
-				print "  finger 3:",[int(v) for v in f3_contact]
-			except:
-				pass
+		if self.verbose and self.takktile is not None:
+			self.takktile.log(self.contact_log)
 		#need to manually call the hand emulator
 		self.hand.process({},self.dt)
@@ -0,0 +1,164 @@
+"""Replays trials recorded by recorder.py.
+
+A Replay drives the robot configuration and the rigid object transforms of a
+world straight from a recording, without simulating, and can resume the
+simulation from any recorded step: the simulator is restored from the last
+state snapshot at or before that step, then stepped forward with the
+recorded time steps.
+
+Only the simulator state, the hand emulator state saved with the snapshot
+and the recorded hand emulator columns are restored.  The controllers are rebuilt with make(), so a resumed run matches
+the recorded one when the controllers depend only on the simulation time
+(as simple_controller does).
+
+Usage: python replay.py recording [-t time] [-r]
+Plays back the recording from the given time, or with -r, resumes the
+simulation from that time.  The world is rebuilt from the launch information
+saved in the recording by main.py / headless.py.
+"""
+
+from klampt import *
+from klampt.sim.simulation import SimpleSimulator
+from recorder import Recording
+import numpy as np
+import importlib
+import argparse
+import time
+import main
+
+class Replay:
+	"""Plays back a Recording (or the recording in the directory recording) in
+	world, which must contain the recorded robot and rigid objects"""
+	def __init__(self,recording,world):
+		if isinstance(recording,str):
+			recording = Recording(recording)
+		self.recording = recording
+		self.world = world
+		self.robot = world.robot(0)
+		self.objects = [world.rigidObject(i) for i in xrange(world.numRigidObjects())]
+		if len(self.objects) != len(recording.objects):
+			raise ValueError("The world has %d rigid objects, the recording has %d"%(len(self.objects),len(recording.objects)))
+		self.times = recording.column('time')
+
+	def __len__(self):
+		return len(self.recording)
+
+	def step_at(self,t):
+		"""Returns the last step recorded at or before the simulation time t"""
+		return max(int(np.searchsorted(self.times,t,side='right'))-1,0)
+
+	def apply(self,i):
+		"""Sets the world to the state recorded at step i, and returns that frame"""
+		frame = self.recording.frame(i)
+		self.robot.setConfig(frame['q'].tolist())
+		self.robot.setVelocity(frame['dq'].tolist())
+		for o,T in zip(self.objects,frame['objects']):
+			o.setTransform(T[0:9].tolist(),T[9:12].tolist())
+		return frame
+
+	def frames(self,start=0,stop=None):
+		"""Iterates over the steps from start to stop, applying each to the world
+		and yielding (step,frame)"""
+		if stop is None:
+			stop = len(self)
+		for i in xrange(start,stop):
+			yield i,self.apply(i)
+
+	def resume(self,sim,i,hand=None):
+		"""Restores sim to the recorded step i: loads the last state snapshot at
+		or before i, restores the hand emulator hand (if given) from the
+		recorded columns and the snapshot, and fast-forwards the simulation to
+		step i.  Returns the step
+		from which the simulation was fast-forwarded.
+
+		sim must simulate the world of this replay, with its controller and
+		emulator already set up.
+		"""
+		snapshot = self.recording.state(i)
+		if snapshot is None:
+			raise ValueError("The recording has no simulator state at or before step %d"%(i,))
+		step,state = snapshot
+		sim.setState(state)
+		if hand is not None:
+			restore_hand(hand,self.recording.frame(step),self.recording.hand_state(step))
+		for k in xrange(step,i):
+			sim.simulate(float(self.times[k+1]-self.times[k]))
+		sim.updateWorld()
+		return step
+
+def restore_hand(hand,frame,state=None):
+	"""Sets the attributes of the hand emulator hand from the hand.* columns of
+	a recorded frame, then restores the emulator state state (as returned by
+	hand.getState()), if given"""
+	for name,value in frame.iteritems():
+		if not name.startswith('hand.'):
+			continue
+		attr = name[5:]
+		current = getattr(hand,attr,None)
+		if isinstance(current,np.ndarray):
+			current[...] = value
+		elif current is not None:
+			setattr(hand,attr,value.tolist())
+	if state is not None and hasattr(hand,'setState'):
+		hand.setState(state)
+
+def make_world(info):
+	"""Rebuilds the world described by the info saved by main.py / headless.py
+	in a recording.  Returns (world,robot).  Shelf worlds packed without a seed
+	may not keep the same objects as the recorded one."""
+	args = info['args']
+	if info['world'] == 'simple':
+		world,robot,object = main.make_simple_world(*args)
+	elif info['world'] == 'balls':
+		world,robot = main.make_balls_world(*args)
+	elif info['world'] == 'shelf':
+		robotname,objects,lod = args[:3]
+		seed = args[3] if len(args) > 3 else None
+		world,robot,shelf = main.make_shelf_world(robotname,objects,interactive=False,lod=lod,seed=seed)
+	else:
+		raise ValueError("Unknown world "+str(info['world']))
+	return world,robot
+
+def resume_simulation(replay,i,dt):
+	"""Sets up a simulation of the world of replay with the recorded controller,
+	resumed at step i.  Returns (sim,hand)."""
+	info = replay.recording.info
+	#the controllers read the initial base transform from the robot model
+	replay.apply(0)
+	sim = SimpleSimulator(replay.world)
+	hand = main.setup_simulation(sim,info['args'][0],importlib.import_module(info['controller']),dt)
+	replay.resume(sim,i,hand)
+	return sim,hand
+
+if __name__ == '__main__':
+	from klampt import vis
+	parser = argparse.ArgumentParser(description='Replays a recorded trial')
+	parser.add_argument('recording',help='the recording directory')
+	parser.add_argument('-t','--time',type=float,default=0,help='the simulation time to start from')
+	parser.add_argument('-r','--resume',action='store_true',help='resume the simulation instead of playing back')
+	args = parser.parse_args()
+	recording = Recording(args.recording)
+	if 'world' not in recording.info:
+		parser.error("the recording does not describe its world")
+	world,robot = make_world(recording.info)
+	replay = Replay(recording,world)
+	start = replay.step_at(args.time)
+	if args.resume:
+		sim,hand = resume_simulation(replay,start,recording.info.get('control_dt',0.02))
+	vis.add("world",world)
+	vis.show()
+	i = start
+	t0 = time.time()
+	while vis.shown():
+		vis.lock()
+		if args.resume:
+			sim.simulate(0.01)
+			sim.updateWorld()
+		elif i < len(replay):
+			replay.apply(i)
+			i += 1
+		vis.unlock()
+		t1 = time.time()
+		time.sleep(max(0.01-(t1-t0),0.001))
+		t0 = t1
+	vis.kill()
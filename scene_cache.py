@@ -0,0 +1,69 @@
+"""An on-disk cache of generated scene layouts.
+
+The shelf scene places its objects at random, and packing the shelf
+(packing.xy_jiggle) is expensive.  When the shelf is generated with an
+explicit seed, main.py stores the resolved layout -- the objects that were
+kept and their final transforms -- under a key made of the seed, the object
+list, the collision mesh tier, the scene dimensions, and the modification time
+and size of the mesh file and tier of every object (see main.object_mesh_stamp),
+so that regenerated meshes are packed again.  Later runs with the same key
+load the layout instead of generating it.
+
+Layouts are JSON files in cache_dir.
+"""
+
+import hashlib
+import json
+import os
+
+cache_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)),'cache','scenes')
+#set to False to always generate the scenes
+enabled = True
+
+def make_key(*parts):
+	"""Returns the cache key of a scene described by the JSON-serializable parts"""
+	return hashlib.sha1(json.dumps(parts,sort_keys=True)).hexdigest()
+
+def _path(key):
+	return os.path.join(cache_dir,key+'.json')
+
+def load(key):
+	"""Returns the layout stored under key, or None if there is none"""
+	if not enabled:
+		return None
+	try:
+		f = open(_path(key),'r')
+	except IOError:
+		return None
+	try:
+		return json.load(f)
+	except ValueError:
+		return None
+	finally:
+		f.close()
+
+def save(key,layout):
+	"""Stores the layout (a JSON-serializable dict) under key"""
+	if not enabled:
+		return
+	if not os.path.exists(cache_dir):
+		try:
+			os.makedirs(cache_dir)
+		except OSError:
+			#made by another process
+			pass
+	fn = _path(key)
+	tmp = '%s.%d.tmp'%(fn,os.getpid())
+	f = open(tmp,'w')
+	json.dump(layout,f)
+	f.close()
+	os.rename(tmp,fn)
+
+def get_transforms(objects):
+	"""Returns the transforms of the given rigid objects, as stored in layouts"""
+	return [o.getTransform() for o in objects]
+
+def set_transforms(objects,transforms):
+	"""Sets the transforms of the given rigid objects from a layout"""
+	for o,(R,t) in zip(objects,transforms):
+		o.setTransform(R,t)
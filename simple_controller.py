@@ -1,6 +1,8 @@
 from klampt import *
 from klampt.math import vectorops,so3,se3
 from moving_base_control import *
+from reflex_control import TakkTileBank
+import telemetry
 import plugins.reflex, plugins.soft_hand
 import plugins.actuators.CompliantHandEmulator
 
@@ -22,31 +24,17 @@ def make(sim,hand,dt):
 
 	if not is_soft_hand:
 		#get references to the robot's sensors (not properly functioning in Klamp't 0.6.x)
-		f1_proximal_takktile_sensors = [sim.controller(0).sensor("f1_proximal_takktile_%d"%(i,)) for i in range(1,6)]
-		f1_distal_takktile_sensors = [sim.controller(0).sensor("f1_distal_takktile_%d"%(i,)) for i in range(1,6)]
-		f2_proximal_takktile_sensors = [sim.controller(0).sensor("f2_proximal_takktile_%d"%(i,)) for i in range(1,6)]
-		f2_distal_takktile_sensors = [sim.controller(0).sensor("f2_distal_takktile_%d"%(i,)) for i in range(1,6)]
-		f3_proximal_takktile_sensors = [sim.controller(0).sensor("f3_proximal_takktile_%d"%(i,)) for i in range(1,6)]
-		f3_distal_takktile_sensors = [sim.controller(0).sensor("f3_distal_takktile_%d"%(i,)) for i in range(1,6)]
-		contact_sensors = f1_proximal_takktile_sensors + f1_distal_takktile_sensors + f2_proximal_takktile_sensors + f2_distal_takktile_sensors + f3_proximal_takktile_sensors + f3_distal_takktile_sensors
+		takktile = TakkTileBank.shared(sim)
+		contact_log = telemetry.channel('contact')
 
 	sim.updateWorld()
 	xform = get_moving_base_xform(sim.controller(0).model())
 
 	def controlfunc(controller):
 		"""Place your code here... for a more sophisticated controller you could also create a class where the control loop goes in the __call__ method."""
-		if not is_soft_hand:
-			#print the contact sensors... you can safely take this out if you don't want to use it
-			try:
-				f1_contact = [s.getMeasurements()[0] for s in f1_proximal_takktile_sensors] + [s.getMeasurements()[0] for s in f1_distal_takktile_sensors]
-				f2_contact = [s.getMeasurements()[0] for s in f2_proximal_takktile_sensors] + [s.getMeasurements()[0] for s in f2_distal_takktile_sensors]
-				f3_contact = [s.getMeasurements()[0] for s in f3_proximal_takktile_sensors] + [s.getMeasurements()[0] for s in f3_distal_takktile_sensors]
-				print "Contact sensors"
-				print "  finger 1:",[int(v) for v in f1_contact]
-				print "  finger 2:",[int(v) for v in f2_contact]
-				print "  finger 3:",[int(v) for v in f3_contact]
-			except:
-				pass
+		if not is_soft_hand and takktile is not None:
+			#log the contact sensors... you can safely take this out if you don't want to use it
+			takktile.log(contact_log)
 
 		if sim.getTime() < 0.05:
 			if is_soft_hand:
@@ -0,0 +1,108 @@
+"""Evaluates grasps over many robots and objects in parallel.
+
+Each (robot, object set, object, initial transform) trial is run headless in
+a multiprocessing pool; every worker process builds its own WorldModel and
+Simulator.  Results are written to a single CSV table as they arrive.
+
+Usage: python sweep.py [-j processes] [-r robot ...] [-s dataset ...] [-o results.csv]
+"""
+
+import argparse
+import csv
+import multiprocessing
+import os
+import sys
+import time
+import traceback
+import dataset_index
+
+robots = ['reflex_col', 'soft_hand', 'reflex']
+datasets = ['ycb', 'apc2015']
+
+#columns of the aggregated results table
+columns = ['robot','object_set','object','xform','lift_height','contact_steps','max_contact_links',
+		   'final_contact_links','final_x','final_y','final_z','sim_time','steps','wall_time','status','recording','error']
+
+def make_tasks(robots,object_sets,objects,xforms=[None]):
+	"""Returns the list of (robot,object_set,objectname,xform) trials to run.
+	objects is a dict mapping each object set to its object names, as in
+	main.objects.  An xform of None means the transform stored in the resources
+	directory; otherwise it is a resource name or an se3 element."""
+	tasks = []
+	for robot in robots:
+		for object_set in object_sets:
+			for objectname in objects[object_set]:
+				for xform in xforms:
+					tasks.append((robot,object_set,objectname,xform))
+	return tasks
+
+def _init_worker(quiet):
+	if quiet:
+		sys.stdout = open(os.devnull,'w')
+
+def run_task(args):
+	"""Runs a single trial in a worker process and returns its row of the
+	results table.  Errors are reported in the row rather than raised, so that
+	one bad object does not stop the sweep."""
+	robot,object_set,objectname,xform,duration,record = args
+	row = dict((c,'') for c in columns)
+	row.update({'robot':robot,'object_set':object_set,'object':objectname,'xform':xform if isinstance(xform,str) else '','recording':record or ''})
+	try:
+		import headless
+		from klampt.io import resource
+		if isinstance(xform,str):
+			xform = resource.get(xform,doedit=False)
+		res = headless.run_simple(robot,object_set,objectname,duration=duration,xform=xform,record=record)
+	except Exception:
+		row['error'] = traceback.format_exc().strip().split('\n')[-1]
+		return row
+	for c in columns:
+		if c in res:
+			row[c] = res[c]
+	T = res['objects'][0]['final_transform']
+	row['final_x'],row['final_y'],row['final_z'] = T[1]
+	return row
+
+def sweep(tasks,outfile,processes=None,duration=3.0,quiet=True,record=None):
+	"""Runs the given trials over a pool of processes (default: one per CPU)
+	and streams rows into the CSV file outfile in completion order.  If record
+	is given, each trial is recorded into a subdirectory of it (see recorder.py).
+	Returns the list of rows."""
+	recordings = [None]*len(tasks)
+	if record:
+		recordings = [os.path.join(record,'%05d_%s_%s_%s'%(i,t[0],t[1],t[2])) for i,t in enumerate(tasks)]
+	pool = multiprocessing.Pool(processes,_init_worker,(quiet,))
+	rows = []
+	t0 = time.time()
+	with open(outfile,'w') as f:
+		writer = csv.DictWriter(f,columns)
+		writer.writeheader()
+		try:
+			for row in pool.imap_unordered(run_task,[t+(duration,r) for t,r in zip(tasks,recordings)]):
+				writer.writerow(row)
+				f.flush()
+				rows.append(row)
+				print "%d/%d %s %s/%s: lift %s %s"%(len(rows),len(tasks),row['robot'],row['object_set'],row['object'],row['lift_height'],row['error'])
+			pool.close()
+		except KeyboardInterrupt:
+			pool.terminate()
+			raise
+		finally:
+			pool.join()
+	print "Ran",len(rows),"trials in",time.time()-t0,"s"
+	return rows
+
+if __name__ == '__main__':
+	parser = argparse.ArgumentParser(description='Runs headless grasp trials over robots and objects in parallel')
+	parser.add_argument('-j','--processes',type=int,default=None,help='number of worker processes (default: # of CPUs)')
+	parser.add_argument('-r','--robot',action='append',choices=robots,help='robot(s) to evaluate (default: all)')
+	parser.add_argument('-s','--dataset',action='append',choices=datasets,help='object set(s) to evaluate (default: all)')
+	parser.add_argument('-x','--xform',action='append',help='initial transform resource(s) (default: stored per object)')
+	parser.add_argument('-d','--duration',type=float,default=3.0,help='simulated duration of each trial, in s')
+	parser.add_argument('-o','--output',default='sweep_results.csv',help='output CSV file')
+	parser.add_argument('-v','--verbose',action='store_true',help='do not silence the worker output')
+	parser.add_argument('--record',metavar='DIR',help='record every trial into a subdirectory of DIR')
+	args = parser.parse_args()
+	objects = dict((s,dataset_index.object_names(s)) for s in (args.dataset or datasets))
+	tasks = make_tasks(args.robot or robots,args.dataset or datasets,objects,args.xform or [None])
+	sweep(tasks,args.output,args.processes,args.duration,not args.verbose,args.record)
@@ -0,0 +1,172 @@
+"""Rate-limited, non-blocking telemetry for controllers and sensors.
+
+Controllers log messages through named channels instead of printing them:
+
+	import telemetry
+	contact = telemetry.channel('contact',period=0.1)
+	...
+	contact.log(sim.getTime(),"finger 1: %s",values)
+
+Messages are formatted and written to the output stream by a background
+thread, so the simulation thread never blocks on stdout.  Since formatting
+is deferred, pass copies of arrays that will be modified later.
+
+A channel drops the messages logged less than its period after the last
+one it accepted (in the units of the time passed to log, usually simulated
+seconds).  If the writer falls more than max_queue messages behind, new
+messages are dropped rather than queued.
+
+Telemetry is enabled by default.  The launch functions in main.py and
+headless.py turn it on or off for a run with configure().
+"""
+
+import sys
+import threading
+import Queue
+import atexit
+
+#default period of each channel, in s
+default_periods = {'contact':0.1}
+#slack on the periods, so that time steps accumulated in floating point are not dropped
+period_tolerance = 1e-6
+
+_enabled = True
+_periods = {}
+_channels = {}
+_writer = None
+_out = None
+_max_queue = 10000
+
+class Writer(threading.Thread):
+	"""The background thread writing queued messages to out"""
+	def __init__(self,out,max_queue):
+		threading.Thread.__init__(self,name='telemetry')
+		self.daemon = True
+		self.out = out
+		self.queue = Queue.Queue(max_queue)
+		self.dropped = 0
+
+	def put(self,item):
+		try:
+			self.queue.put_nowait(item)
+		except Queue.Full:
+			self.dropped += 1
+
+	def run(self):
+		while True:
+			item = self.queue.get()
+			if item is None:
+				self.queue.task_done()
+				return
+			t,name,fmt,args = item
+			try:
+				msg = fmt%args if args else fmt
+			except (TypeError,ValueError):
+				msg = fmt+' '+' '.join(str(a) for a in args)
+			try:
+				if t is None:
+					self.out.write("%s: %s\n"%(name,msg))
+				else:
+					self.out.write("[%.3f] %s: %s\n"%(t,name,msg))
+			except (IOError,ValueError):
+				pass
+			self.queue.task_done()
+
+	def flush(self):
+		"""Waits until all queued messages are written"""
+		self.queue.join()
+		try:
+			self.out.flush()
+		except (IOError,ValueError):
+			pass
+
+class Channel:
+	"""A named telemetry channel.  period is the minimum time between two
+	logged messages."""
+	def __init__(self,name,period=0):
+		self.name = name
+		self.period = period
+		self.last = None
+		self.dropped = 0
+
+	def active(self,t=None):
+		"""Returns True if a message logged at time t would be written.  Use this
+		to skip computing messages that would be dropped."""
+		if not _enabled:
+			return False
+		if t is None or self.last is None or t < self.last:
+			return True
+		return t >= self.last + self.period - period_tolerance
+
+	def log(self,t,fmt,*args):
+		"""Logs the message fmt%args at time t (None for untimed messages, which
+		are never rate limited).  Returns True if the message was queued."""
+		if not _enabled:
+			return False
+		if t is not None:
+			if self.last is not None and t >= self.last and t < self.last + self.period - period_tolerance:
+				self.dropped += 1
+				return False
+			self.last = t
+		_get_writer().put((t,self.name,fmt,args))
+		return True
+
+def _get_writer():
+	global _writer
+	if _writer is None:
+		_writer = Writer(_out if _out is not None else sys.stdout,_max_queue)
+		_writer.start()
+	return _writer
+
+def channel(name,period=None):
+	"""Returns the channel with the given name, creating it if needed.  The
+	period given to configure() for this channel takes precedence over period,
+	which takes precedence over default_periods."""
+	if name not in _channels:
+		if period is None:
+			period = default_periods.get(name,0)
+		_channels[name] = Channel(name,_periods.get(name,period))
+	return _channels[name]
+
+def configure(enabled=True,out=None,periods=None,max_queue=10000):
+	"""Turns telemetry on or off, and sets the output stream (default stdout),
+	the per-channel periods (a dict from channel names to periods, overriding
+	the ones given by the code) and the writer queue size.  Pending messages
+	are written to the previous stream first."""
+	global _enabled,_periods,_out,_max_queue,_writer
+	_enabled = enabled
+	_periods = dict(periods) if periods else {}
+	for name,c in _channels.iteritems():
+		if name in _periods:
+			c.period = _periods[name]
+		c.last = None
+	if _writer is not None and (out is not _out or max_queue != _max_queue):
+		close()
+	_out = out
+	_max_queue = max_queue
+
+def enabled():
+	return _enabled
+
+def flush():
+	"""Waits until all logged messages are written"""
+	if _writer is not None:
+		_writer.flush()
+
+def close():
+	"""Writes all logged messages and stops the writer thread"""
+	global _writer
+	if _writer is not None:
+		#blocking put, so that the stop message is never dropped
+		_writer.queue.put(None)
+		_writer.join()
+		_writer = None
+
+def dropped():
+	"""Returns the number of messages dropped, by channel name, including those
+	dropped because the writer queue was full (under the name None)"""
+	res = dict((name,c.dropped) for name,c in _channels.iteritems())
+	res[None] = _writer.dropped if _writer is not None else 0
+	return res
+
+atexit.register(close)